@@ -0,0 +1,386 @@
+# Import required packages
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from scipy import sparse
+from scipy.stats import norm
+from facilities import HMA_BBOX
+from map_export import read_output
+
+# Counts of sports tweets per area and their hotspots. Points are binned to square or hexagon
+# grid cells by integer cell ids computed from their coordinates, or joined to the PAAVO postal
+# areas with one STRtree query. The counts per area and category are kept in a state file, so
+# that new output parts (or new rows of a GeoPackage) are added without reading the rest again.
+# The Getis-Ord Gi* z-score of each area is computed with a sparse neighbour matrix.
+
+# Grid cell size in metres (for hexagons the distance from the centre to a corner)
+CELL_SIZE = 250
+
+# Postal areas of the metropolitan area and the columns their codes can be in
+POSTAL_AREAS = os.environ.get('SPORTS_TWEETS_POSTAL_AREAS', 'data/PKS_postinumeroalueet_2020.shp')
+AREA_ID_COLUMNS = ['Posno', 'posti_alue', 'postinumer']
+
+# Offset that keeps grid column and row numbers positive, so that they pack into one int64
+ID_OFFSET = 1 << 30
+
+# Gi* z-score limits of the hot and cold spot classes (90, 95 and 99 % confidence)
+HOTSPOT_LEVELS = [(2.58, 99), (1.96, 95), (1.65, 90)]
+
+
+def pack_ids(columns, rows):
+    """Packs grid column and row numbers into int64 cell ids."""
+    return ((columns + ID_OFFSET) << 32) | (rows + ID_OFFSET)
+
+
+def unpack_ids(ids):
+    """Returns the column and row numbers of packed cell ids."""
+    return (ids >> 32) - ID_OFFSET, (ids & 0xFFFFFFFF) - ID_OFFSET
+
+
+def square_ids(x, y, size=CELL_SIZE):
+    """Returns the ids of the square grid cells of points, the grid starts from 0, 0 of EPSG:3067."""
+    return pack_ids(np.floor(x / size).astype(np.int64), np.floor(y / size).astype(np.int64))
+
+
+def hexagon_ids(x, y, size=CELL_SIZE):
+    """Returns the ids of the pointy-top hexagon cells of points as packed axial coordinates (q, r)."""
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = 2 / 3 * y / size
+    # Round the cube coordinates and fix the one with the largest rounding error
+    cube = np.stack([q, r, -q - r])
+    rounded = np.round(cube)
+    error = np.abs(rounded - cube)
+    largest = error.argmax(axis=0)
+    rounded[0] = np.where(largest == 0, -rounded[1] - rounded[2], rounded[0])
+    rounded[1] = np.where(largest == 1, -rounded[0] - rounded[2], rounded[1])
+    return pack_ids(rounded[0].astype(np.int64), rounded[1].astype(np.int64))
+
+
+# Column and row steps to the neighbours of a cell: queen contiguity for squares, the six sides for hexagons
+NEIGHBOUR_STEPS = {'square': [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)],
+                   'hexagon': [(1, 0), (-1, 0), (0, 1), (0, -1), (1, -1), (-1, 1)]}
+
+
+class GridLayer:
+    """Square or hexagon grid over a fixed extent. All cells of the extent are areas, also the
+    empty ones, so that the hotspot statistics compare every place with its surroundings.
+
+    Parameters:
+
+    kind| String: 'square' or 'hexagon'
+    size| float: cell size in metres
+    extent| tuple: minx, miny, maxx, maxy in EPSG:3067
+    """
+
+    def __init__(self, kind='square', size=CELL_SIZE, extent=HMA_BBOX):
+        self.kind = kind
+        self.size = size
+        self.name = '%s_%s' % (kind, int(size))
+        minx, miny, maxx, maxy = extent
+
+        # Cell ids of a point lattice that is denser than the cells covers every cell of the extent
+        step = size / 2
+        x, y = np.meshgrid(np.arange(minx, maxx + step, step), np.arange(miny, maxy + step, step))
+        self.ids = np.unique(self.cell_ids(x.ravel(), y.ravel()))
+
+    def cell_ids(self, x, y):
+        """Returns the ids of the cells of points."""
+        if self.kind == 'square':
+            return square_ids(x, y, self.size)
+        return hexagon_ids(x, y, self.size)
+
+    def areas(self, x, y):
+        """Returns the position of the cell of each point in self.ids, -1 outside the extent."""
+        ids = self.cell_ids(x, y)
+        positions = np.searchsorted(self.ids, ids)
+        positions[positions == len(self.ids)] = 0
+        return np.where(self.ids[positions] == ids, positions, -1)
+
+    def weights(self):
+        """Returns the binary contiguity matrix of the cells as a sparse matrix."""
+        columns, rows = unpack_ids(self.ids)
+        pairs_from, pairs_to = [], []
+        for column_step, row_step in NEIGHBOUR_STEPS[self.kind]:
+            neighbours = pack_ids(columns + column_step, rows + row_step)
+            positions = np.searchsorted(self.ids, neighbours)
+            positions[positions == len(self.ids)] = 0
+            found = self.ids[positions] == neighbours
+            pairs_from.append(np.flatnonzero(found))
+            pairs_to.append(positions[found])
+        pairs_from, pairs_to = np.concatenate(pairs_from), np.concatenate(pairs_to)
+        return sparse.csr_matrix((np.ones(len(pairs_from)), (pairs_from, pairs_to)), shape=(len(self.ids), len(self.ids)))
+
+    def geometry(self):
+        """Returns the polygons of the cells as a GeoSeries in EPSG:3067."""
+        columns, rows = unpack_ids(self.ids)
+        if self.kind == 'square':
+            x0, y0 = columns * self.size, rows * self.size
+            corners = np.stack([np.stack([x0, y0], 1), np.stack([x0 + self.size, y0], 1),
+                                np.stack([x0 + self.size, y0 + self.size], 1), np.stack([x0, y0 + self.size], 1)], 1)
+        else:
+            centre_x = self.size * np.sqrt(3) * (columns + rows / 2)
+            centre_y = self.size * 3 / 2 * rows
+            angles = np.radians(60 * np.arange(6) - 30)
+            corners = np.stack([centre_x[:, None] + self.size * np.cos(angles),
+                                centre_y[:, None] + self.size * np.sin(angles)], 2)
+        return gpd.GeoSeries(shapely.polygons(corners), crs='EPSG:3067')
+
+    def labels(self):
+        """Returns the ids of the cells as they are written to the output."""
+        return self.ids
+
+
+class PostalAreaLayer:
+    """PAAVO postal code areas. Points are joined to the areas with one STRtree query.
+
+    Parameters:
+
+    path| String: postal area polygons eg. 'data/PKS_postinumeroalueet_2020.shp'
+    """
+
+    def __init__(self, path=POSTAL_AREAS):
+        areas = gpd.read_file(path).to_crs(epsg=3067)
+        self.name = 'postal_areas'
+        self.id_column = next((column for column in AREA_ID_COLUMNS if column in areas.columns), None)
+        self.codes = areas[self.id_column].astype(str).to_numpy() if self.id_column else np.arange(len(areas)).astype(str)
+        self.polygons = areas.geometry.values
+        self.tree = shapely.STRtree(self.polygons)
+
+    def areas(self, x, y):
+        """Returns the position of the postal area of each point, -1 outside all areas."""
+        points, areas = self.tree.query(shapely.points(x, y), predicate='intersects')
+        positions = np.full(len(x), -1, dtype=np.int64)
+        # A point on a border goes to the first area
+        positions[points[::-1]] = areas[::-1]
+        return positions
+
+    def weights(self):
+        """Returns the queen contiguity matrix of the areas (areas that share a border or corner)."""
+        areas, neighbours = self.tree.query(self.polygons, predicate='intersects')
+        other = areas != neighbours
+        return sparse.csr_matrix((np.ones(int(other.sum())), (areas[other], neighbours[other])),
+                                 shape=(len(self.codes), len(self.codes)))
+
+    def geometry(self):
+        """Returns the polygons of the areas."""
+        return gpd.GeoSeries(self.polygons, crs='EPSG:3067')
+
+    def labels(self):
+        """Returns the postal codes of the areas."""
+        return self.codes
+
+
+def area_layer(kind='square', size=CELL_SIZE, postal_areas=POSTAL_AREAS):
+    """Returns the area layer of a kind: 'square', 'hexagon' or 'postal'."""
+    if kind == 'postal':
+        return PostalAreaLayer(postal_areas)
+    return GridLayer(kind, size)
+
+
+def getis_ord(counts, weights):
+    """Returns the Getis-Ord Gi* z-scores and two-sided p-values of the counts of the areas.
+    Each area is its own neighbour (the star of Gi*), so the statistic compares the sum of an
+    area and its neighbours with what the global mean would give.
+
+    Parameters:
+
+    counts| numpy array of counts per area
+    weights| scipy sparse matrix of binary neighbour weights without the diagonal
+    """
+    n = len(counts)
+    weights = (weights + sparse.identity(n, format='csr')).tocsr()
+    mean = counts.mean()
+    deviation = np.sqrt((counts ** 2).mean() - mean ** 2)
+    weight_sums = np.asarray(weights.sum(axis=1)).ravel()
+    square_sums = np.asarray(weights.multiply(weights).sum(axis=1)).ravel()
+
+    numerator = weights @ counts - mean * weight_sums
+    denominator = deviation * np.sqrt((n * square_sums - weight_sums ** 2) / (n - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(denominator > 0, numerator / denominator, 0.0)
+    return z, 2 * norm.sf(np.abs(z))
+
+
+def hotspot_classes(z):
+    """Returns 'hot 99', 'cold 95' etc. for the z-scores, None for areas that are not significant."""
+    classes = np.full(len(z), None, dtype=object)
+    for limit, level in reversed(HOTSPOT_LEVELS):
+        classes[z >= limit] = 'hot %s' % level
+        classes[z <= -limit] = 'cold %s' % level
+    return classes
+
+
+def category_values(tweets, category=None):
+    """Returns the position of the tweet and the category of each tweet-category pair. A column
+    of comma separated values (eg. matched_keywords of the output) counts each value.
+
+    Parameters:
+
+    tweets| GeoDataFrame of tweets
+    category| String, optional: column of the categories, all tweets are 'tweets' without it
+    """
+    if category is None:
+        return np.arange(len(tweets)), np.full(len(tweets), 'tweets', dtype=object)
+    # Tweets without a category are counted only in the total
+    values = tweets[category].reset_index(drop=True).dropna().astype(str).str.split(',').explode().str.strip()
+    return values.index.to_numpy(), values.to_numpy(dtype=object)
+
+
+class AreaCounts:
+    """Counts of tweets per area and category of one area layer, with the inputs already
+    counted. Counts only grow, so new tweets are added to them without recounting.
+
+    Parameters:
+
+    layer| GridLayer or PostalAreaLayer
+    category| String, optional: column of the categories of the tweets
+    """
+
+    def __init__(self, layer, category=None):
+        self.layer = layer
+        self.category = category
+        self.categories = []
+        self.counts = np.zeros((len(layer.labels()), 0), dtype=np.int64)
+        self.totals = np.zeros(len(layer.labels()), dtype=np.int64)
+        self.sources = {}
+
+    def add(self, tweets):
+        """Adds the tweets of a GeoDataFrame to the counts. Returns the number of tweets inside the areas."""
+        tweets = tweets[~(tweets.geometry.isna() | tweets.geometry.is_empty)]
+        geometry = tweets.geometry if tweets.crs is None else tweets.geometry.to_crs(epsg=3067)
+        coordinates = shapely.get_coordinates(geometry.values)
+        areas = self.layer.areas(coordinates[:, 0], coordinates[:, 1])
+
+        rows, values = category_values(tweets, self.category)
+        for value in pd.unique(values):
+            if value not in self.categories:
+                self.categories.append(value)
+                self.counts = np.hstack([self.counts, np.zeros((len(self.counts), 1), dtype=np.int64)])
+        codes = pd.Index(self.categories).get_indexer(values)
+
+        inside = areas[rows] >= 0
+        np.add.at(self.counts, (areas[rows][inside], codes[inside]), 1)
+        self.totals += np.bincount(areas[areas >= 0], minlength=len(self.totals))
+        return int((areas >= 0).sum())
+
+    def update(self, path):
+        """Adds the tweets of an output that were not counted yet: new parts of a GeoParquet
+        directory or new rows at the end of a GeoPackage. Returns the number of new tweets.
+
+        Parameters:
+
+        path| String: output GeoPackage file or GeoParquet directory
+        """
+        new = 0
+        if os.path.isdir(path):
+            for part in sorted(os.listdir(path)):
+                if part.endswith('.parquet') and part not in self.sources:
+                    tweets = gpd.read_parquet(os.path.join(path, part))
+                    self.add(tweets)
+                    self.sources[part] = len(tweets)
+                    new += len(tweets)
+        else:
+            done = self.sources.get(os.path.basename(path), 0)
+            # rows is read with both the pyogrio and fiona engines, skip_features only with pyogrio
+            tweets = gpd.read_file(path, rows=slice(done, None))
+            self.add(tweets)
+            self.sources[os.path.basename(path)] = done + len(tweets)
+            new += len(tweets)
+        print('--- %s new tweets counted to %s %s areas ---' % (new, len(self.counts), self.layer.name))
+        return new
+
+    def save(self, state_dir):
+        """Saves the counts and the list of counted inputs to state_dir."""
+        os.makedirs(state_dir, exist_ok=True)
+        np.savez(os.path.join(state_dir, self.layer.name + '.npz'), counts=self.counts, totals=self.totals)
+        with open(os.path.join(state_dir, self.layer.name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump({'category': self.category, 'categories': self.categories, 'sources': self.sources}, f,
+                      ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, layer, state_dir, category=None):
+        """Returns the saved counts of a layer, or empty counts if there are none or they were
+        counted by another category column."""
+        counts = cls(layer, category)
+        path = os.path.join(state_dir, layer.name + '.json')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            if state['category'] == category:
+                counts.categories = state['categories']
+                counts.sources = state['sources']
+                with np.load(os.path.join(state_dir, layer.name + '.npz')) as arrays:
+                    counts.counts, counts.totals = arrays['counts'], arrays['totals']
+        return counts
+
+    def statistics(self, weights=None):
+        """Returns a GeoDataFrame of the areas with the number of tweets (total), the counts of
+        each category and the Gi* z-score, p-value and hotspot class of the total and of each category.
+
+        Parameters:
+
+        weights| sparse neighbour matrix of the layer, built from the layer when not given
+        """
+        weights = self.layer.weights() if weights is None else weights
+        result = pd.DataFrame({'area': self.layer.labels()})
+        columns = [('total', self.totals)] + [(name, self.counts[:, code]) for code, name in enumerate(self.categories)]
+        for name, counts in columns:
+            if name != 'total':
+                result[name] = counts
+            z, p = getis_ord(counts.astype(float), weights)
+            result[name + '_gi_z'] = z
+            result[name + '_gi_p'] = p
+            result[name + '_hotspot'] = hotspot_classes(z)
+        result.insert(1, 'total', self.totals)
+        return gpd.GeoDataFrame(result, geometry=self.layer.geometry().values, crs='EPSG:3067')
+
+
+def aggregate(path, kind='square', size=CELL_SIZE, category=None, state_dir=None, output=None):
+    """Counts the tweets of an output per area and computes their hotspots. With state_dir the
+    counts are kept between calls and only tweets added to the output since are read.
+    Returns the areas as a GeoDataFrame, see AreaCounts.statistics.
+
+    Parameters:
+
+    path| String: output GeoPackage file or GeoParquet directory of the main analysis
+    kind| String: 'square', 'hexagon' or 'postal'
+    size| float: grid cell size in metres
+    category| String, optional: column of the categories eg. 'matched_keywords'
+    state_dir| String, optional: directory of the saved counts
+    output| String, optional: GeoPackage to write the areas to, as a layer named by the area layer
+    """
+    layer = area_layer(kind, size)
+    if state_dir:
+        counts = AreaCounts.load(layer, state_dir, category)
+        counts.update(path)
+        counts.save(state_dir)
+    else:
+        counts = AreaCounts(layer, category)
+        counts.add(read_output(path))
+
+    areas = counts.statistics()
+    hot = areas['total_hotspot'].fillna('').str.startswith('hot')
+    print('--- %s tweets in %s areas, %s hotspots ---' % (int(areas['total'].sum()), len(areas), int(hot.sum())))
+    if output:
+        areas.to_file(output, layer=layer.name, driver='GPKG')
+    return areas
+
+
+if __name__ == '__main__':
+
+    # eg. python aggregation.py finaloutput.gpkg --kind hexagon --size 500 --category matched_keywords --output areas.gpkg
+    parser = argparse.ArgumentParser(description='Counts sports tweets per area and finds their hotspots.')
+    parser.add_argument('path', help='output GeoPackage file or GeoParquet directory')
+    parser.add_argument('--kind', choices=['square', 'hexagon', 'postal'], default='square', help='area layer')
+    parser.add_argument('--size', type=float, default=CELL_SIZE, help='grid cell size in metres')
+    parser.add_argument('--category', help='column of the categories eg. matched_keywords')
+    parser.add_argument('--state', help='directory of the counts kept between runs, for incremental updates')
+    parser.add_argument('--output', help='GeoPackage to write the areas to')
+    args = parser.parse_args()
+    aggregate(args.path, args.kind, args.size, args.category, args.state, args.output)
+    sys.exit(0)
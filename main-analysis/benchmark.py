@@ -0,0 +1,303 @@
+# Import required packages
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import contextlib
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from gazetteer import TOKEN, load_gazetteer_index, geocode
+from gazetteer_compiler import inflected_forms
+from lemmatization import create_lemmas_batched
+from matching import get_sports_tweets
+from spatial_filter import parse_points
+from pipeline_settings import PIPELINE_PACKAGES
+from sports_pipeline import SPORTS_KEYWORDS, LANGS, create_pipeline
+
+# Benchmarks of the pipeline stages on a seeded synthetic corpus. The corpus and the stub
+# lemmatizer make the numbers comparable between runs and machines without the database,
+# the network or the Stanza models: python benchmark.py --output results.json and later
+# python benchmark.py --compare results.json to catch regressions.
+
+# Corpus sizes benchmarked by default
+SIZES = [1000, 10000, 100000]
+
+# Share of the languages in the corpus, roughly that of the Helsinki tweets
+LANG_SHARES = {'fi': 0.55, 'en': 0.35, 'sv': 0.1}
+
+# Share of tweets with a sports keyword, with a place name and with a geotag, and the share
+# of the geotags that are inside the study area
+KEYWORD_RATE = 0.03
+TOPONYM_RATE = 0.15
+INFLECTED_RATE = 0.3
+GEOTAG_RATE = 0.35
+INSIDE_RATE = 0.8
+
+# Share of tweets that are retweets of an earlier tweet of the corpus
+RETWEET_RATE = 0.1
+
+# Everyday words the rest of the tweets are made of
+FILLER_WORDS = {'fi': ['ja', 'on', 'ei', 'se', 'että', 'mutta', 'kun', 'niin', 'nyt', 'tänään', 'huomenna', 'hyvä',
+                       'päivä', 'ilta', 'aamu', 'kahvi', 'sää', 'aurinko', 'sade', 'kiva', 'vähän', 'paljon',
+                       'kaupunki', 'koti', 'työ', 'ystävä', 'kesä', 'talvi', 'lumi', 'meri', 'ruoka', 'olla',
+                       'mennä', 'tulla', 'nähdä', 'kiitos', 'taas', 'vielä', 'jo', 'ihan', 'tosi', 'ollut'],
+                'en': ['the', 'a', 'and', 'is', 'to', 'of', 'in', 'it', 'today', 'tomorrow', 'good', 'day',
+                       'evening', 'morning', 'coffee', 'weather', 'sun', 'rain', 'nice', 'little', 'lot', 'city',
+                       'home', 'work', 'friend', 'summer', 'winter', 'snow', 'sea', 'food', 'be', 'go', 'come',
+                       'see', 'thanks', 'again', 'still', 'already', 'really', 'great'],
+                'sv': ['och', 'är', 'inte', 'det', 'att', 'men', 'när', 'så', 'nu', 'idag', 'imorgon', 'bra',
+                       'dag', 'kväll', 'morgon', 'kaffe', 'väder', 'sol', 'regn', 'trevlig', 'lite', 'mycket',
+                       'stad', 'hem', 'jobb', 'vän', 'sommar', 'vinter', 'snö', 'hav', 'mat', 'vara', 'gå',
+                       'komma', 'se', 'tack', 'igen', 'fortfarande', 'redan', 'verkligen']}
+
+# Gazetteer the place names of the corpus come from, and which is benchmarked
+GAZETTEER_SHAPEFILE = 'hmagazetteer.shp'
+
+# Stages faster than this are too noisy to compare between runs
+MIN_SECONDS = 0.05
+
+# Coordinates of geotags outside the study area are drawn from this box of Finland (lon, lat)
+FINLAND_BOX = (21.0, 60.0, 30.0, 69.0)
+
+
+class StubLemmatizer:
+    """Offline stand-in for a Stanza pipeline: the lemmas of a text are its lower-cased words.
+    It is used through the same lemma_service interface as the lemmatisation service, so
+    create_lemmas_batched runs unchanged.
+
+    Parameters:
+
+    lang| String: language of the texts
+    """
+
+    def __init__(self, lang):
+        self.lang = lang
+
+    def lemmatize(self, texts):
+        """Returns the lower-cased words of each text."""
+        return [[word.lstrip('#').lower() for word in TOKEN.findall(text)] for text in texts]
+
+
+def synthetic_tweets(size, seed=1, gazetteer_path=GAZETTEER_SHAPEFILE):
+    """Returns a dataframe of size synthetic tweets with columns lang, full_text, geom (WKB),
+    lat and lon. The same size and seed always give the same tweets. Keywords come from
+    SPORTS_KEYWORDS and place names (some with Finnish case endings) from the gazetteer.
+
+    Parameters:
+
+    size| int: number of tweets
+    seed| int: random seed
+    gazetteer_path| String: shapefile of the gazetteer, with columns name, latitude and longitude
+    """
+    rng = np.random.RandomState(seed)
+    gazetteer = gpd.read_file(gazetteer_path, ignore_geometry=True)
+    names = gazetteer['name'].astype(str).tolist()
+    place_lon = gazetteer['longitude'].to_numpy(dtype=float)
+    place_lat = gazetteer['latitude'].to_numpy(dtype=float)
+
+    langs = rng.choice(list(LANG_SHARES), size=size, p=list(LANG_SHARES.values()))
+    texts = []
+    for i, lang in enumerate(langs):
+        if i > 0 and rng.rand() < RETWEET_RATE:
+            texts.append('RT @user' + str(rng.randint(1000)) + ': ' + texts[rng.randint(i)])
+            continue
+
+        words = list(rng.choice(FILLER_WORDS[lang], size=rng.randint(5, 25)))
+        if rng.rand() < KEYWORD_RATE:
+            words.insert(rng.randint(len(words) + 1), rng.choice(SPORTS_KEYWORDS[lang]))
+        if rng.rand() < TOPONYM_RATE:
+            name = names[rng.randint(len(names))]
+            if lang == 'fi' and rng.rand() < INFLECTED_RATE:
+                forms = sorted(inflected_forms(name.lower()))
+                name = forms[rng.randint(len(forms))] if forms else name
+            words.insert(rng.randint(len(words) + 1), name)
+        if rng.rand() < 0.05:
+            words.append('#' + words[rng.randint(len(words))])
+        if rng.rand() < 0.1:
+            words.append('https://t.co/' + str(rng.randint(10 ** 9)))
+        text = ' '.join(words)
+        texts.append(text[0].upper() + text[1:])
+
+    # Geotags near the places of the gazetteer, or anywhere in Finland
+    geotagged = rng.rand(size) < GEOTAG_RATE
+    inside = rng.rand(size) < INSIDE_RATE
+    places = rng.randint(len(names), size=size)
+    lon = np.where(inside, place_lon[places] + rng.normal(0, 0.005, size),
+                   rng.uniform(FINLAND_BOX[0], FINLAND_BOX[2], size))
+    lat = np.where(inside, place_lat[places] + rng.normal(0, 0.003, size),
+                   rng.uniform(FINLAND_BOX[1], FINLAND_BOX[3], size))
+    lon[~geotagged] = np.nan
+    lat[~geotagged] = np.nan
+    geom = shapely.to_wkb(shapely.points(lon, lat))
+    geom[~geotagged] = None
+
+    return pd.DataFrame({'lang': langs, 'full_text': texts, 'geom': geom, 'lat': lat, 'lon': lon})
+
+
+def study_area(gazetteer_path=GAZETTEER_SHAPEFILE, buffer=2000):
+    """Returns a prepared polygon around the places of the gazetteer in EPSG:3067, an offline
+    stand-in for the municipality boundaries of spatial_filter.load_boundary.
+
+    Parameters:
+
+    gazetteer_path| String: shapefile of the gazetteer
+    buffer| float: distance in metres added around the places
+    """
+    places = gpd.read_file(gazetteer_path).to_crs(epsg=3067)
+    boundary = shapely.convex_hull(shapely.multipoints(places.geometry.values)).buffer(buffer)
+    shapely.prepare(boundary)
+    return boundary
+
+
+def measure(function, repeat=3):
+    """Runs function repeat times and once more under tracemalloc. Returns its result, the
+    best wall and CPU seconds and the peak memory in MB. The peak covers Python and numpy
+    allocations, memory that Arrow allocates for itself is not traced.
+
+    Parameters:
+
+    function| function without arguments
+    repeat| int: number of timed runs
+    """
+    seconds = []
+    cpu_seconds = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start, cpu_start = time.perf_counter(), time.process_time()
+            result = function()
+            seconds.append(time.perf_counter() - start)
+            cpu_seconds.append(time.process_time() - cpu_start)
+
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, min(seconds), min(cpu_seconds), peak / 1024 ** 2
+
+
+def lemmatize_all(df, pipelines):
+    """Lemmatises the tweets of each language with its pipeline, like the lemmatize stage."""
+    return pd.concat([create_lemmas_batched(df[df['lang'] == lang], pipelines[lang], lang) for lang in LANGS])
+
+
+def match_all(lemmatized):
+    """Finds the sports tweets of each language, like the match stage."""
+    return pd.concat([get_sports_tweets(lemmatized[lemmatized['lang'] == lang], SPORTS_KEYWORDS[lang])
+                      for lang in LANGS])
+
+
+def run_benchmarks(sizes=SIZES, seed=1, repeat=3, stanza=False, gazetteer_path=GAZETTEER_SHAPEFILE):
+    """Benchmarks create_lemmas, get_sports_tweets, geocode and parse_points on synthetic
+    corpora of each size. The stages run on the whole corpus instead of what is left of it
+    after the previous stage, so that every stage is measured on enough rows: geocode gets
+    all ungeotagged tweets and parse_points all geotagged ones. Returns a list of results,
+    one dict per stage and size.
+
+    Parameters:
+
+    sizes| list of ints: corpus sizes
+    seed| int: random seed of the corpora
+    repeat| int: number of timed runs of each stage
+    stanza| bool: lemmatise with Stanza instead of the stub lemmatizer, needs the models
+    gazetteer_path| String: gazetteer shapefile, also used for the place names of the corpus
+    """
+    if stanza:
+        pipelines = {lang: create_pipeline(lang, PIPELINE_PACKAGES[lang]) for lang in LANGS}
+    else:
+        pipelines = {lang: StubLemmatizer(lang) for lang in LANGS}
+    hmanames = load_gazetteer_index(gazetteer_path)
+    boundary = study_area(gazetteer_path)
+
+    results = []
+    for size in sizes:
+        df = synthetic_tweets(size, seed, gazetteer_path)
+        ungeotagged = df['geom'].isna()
+
+        lemmatized, *lemma_stats = measure(lambda: lemmatize_all(df, pipelines), repeat)
+        stages = [('create_lemmas', df, lemmatized, lemma_stats)]
+        sports, *stats = measure(lambda: match_all(lemmatized), repeat)
+        stages.append(('get_sports_tweets', lemmatized, sports, stats))
+        to_geocode = lemmatized[lemmatized['geom'].isna()]
+        geocoded, *stats = measure(lambda: geocode(to_geocode, hmanames), repeat)
+        stages.append(('geocode', to_geocode, geocoded, stats))
+        geotagged = df[~ungeotagged]
+        points, *stats = measure(lambda: parse_points(geotagged, boundary), repeat)
+        stages.append(('parse_points', geotagged, points, stats))
+
+        for stage, rows_in, rows_out, (seconds, cpu_seconds, peak) in stages:
+            results.append({'stage': stage, 'size': size, 'lemmatizer': 'stanza' if stanza else 'stub',
+                            'rows_in': len(rows_in), 'rows_out': len(rows_out), 'seconds': seconds,
+                            'cpu_seconds': cpu_seconds, 'rows_per_second': len(rows_in) / seconds if seconds > 0 else None,
+                            'peak_memory_mb': peak})
+            print('--- %s %s tweets: %s rows in %s s (%s rows/s), peak %s MB ---'
+                  % (stage, size, len(rows_in), round(seconds, 3), round(results[-1]['rows_per_second'] or 0),
+                     round(peak, 1)))
+    return results
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """Compares results with the results of an earlier run. Returns a list of regressions:
+    stages whose throughput dropped or whose peak memory grew by more than tolerance. The
+    throughput of stages that took less than MIN_SECONDS is not compared.
+
+    Parameters:
+
+    results| list of dicts from run_benchmarks
+    baseline| list of dicts from an earlier run_benchmarks
+    tolerance| float: allowed relative change eg. 0.2 for 20 %
+    """
+    earlier = {(r['stage'], r['size'], r['lemmatizer']): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = earlier.get((result['stage'], result['size'], result['lemmatizer']))
+        if before is None:
+            continue
+        if before['seconds'] >= MIN_SECONDS and result['rows_per_second'] < before['rows_per_second'] * (1 - tolerance):
+            regressions.append('%s %s: %s rows/s, was %s' % (result['stage'], result['size'],
+                                                             round(result['rows_per_second']),
+                                                             round(before['rows_per_second'])))
+        if result['peak_memory_mb'] > before['peak_memory_mb'] * (1 + tolerance):
+            regressions.append('%s %s: peak %s MB, was %s MB' % (result['stage'], result['size'],
+                                                                 round(result['peak_memory_mb'], 1),
+                                                                 round(before['peak_memory_mb'], 1)))
+    return regressions
+
+
+def main(argv=None):
+    """Command line of the benchmarks, see python benchmark.py --help."""
+    parser = argparse.ArgumentParser(description='Benchmarks the pipeline stages on a synthetic tweet corpus.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='corpus sizes')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the corpus')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of each stage, the best one counts')
+    parser.add_argument('--stanza', action='store_true', help='lemmatise with Stanza instead of the stub')
+    parser.add_argument('--gazetteer', default=GAZETTEER_SHAPEFILE, help='gazetteer shapefile')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown or memory growth')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.seed, args.repeat, args.stanza, args.gazetteer)
+    report = {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+              'machine': platform.machine(), 'seed': args.seed, 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print('Results written to ' + args.output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare_results(results, json.load(f)['results'], args.tolerance)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        print(str(len(regressions)) + ' regressions')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
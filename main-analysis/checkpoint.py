@@ -0,0 +1,123 @@
+# Import required packages
+import os
+import json
+import time
+import pickle
+import hashlib
+from pipeline_settings import CHECKPOINT_DIR
+
+
+def file_hash(path, block_size=1 << 20):
+    """Returns the SHA-1 of the contents of a file, read in blocks.
+
+    Parameters:
+
+    path| String: path of the file
+    block_size| int: bytes read at a time
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def params_hash(params):
+    """Returns a short hash of the parameters of a stage (eg. keyword lists), so that a stage is
+    run again when they change.
+
+    Parameters:
+
+    params| JSON serialisable object
+    """
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def chunk_id(path):
+    """Returns the name used for a chunk in the manifest, the input path with separators replaced."""
+    return os.path.normpath(path).replace(os.sep, '_').replace(':', '_')
+
+
+class ChunkCheckpoint:
+    """Manifest entry of one chunk: the hash of the input file and, for each finished stage,
+    the hash of its parameters and the path of its output. Every chunk has its own entry file
+    in checkpoint_dir so that worker processes never write the same file. An entry whose input
+    hash no longer matches the file is discarded. The file is hashed again only when its size
+    or modification time differs from the entry.
+
+    Parameters:
+
+    path| String: path of the chunk input file
+    checkpoint_dir| String: directory of the manifest entries and stage outputs
+    """
+
+    def __init__(self, path, checkpoint_dir=CHECKPOINT_DIR):
+        self.path = path
+        self.id = chunk_id(path)
+        self.dir = checkpoint_dir
+        self.entry_path = os.path.join(checkpoint_dir, self.id + '.json')
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+        stat = os.stat(path)
+        entry = None
+        if os.path.exists(self.entry_path):
+            with open(self.entry_path) as f:
+                entry = json.load(f)
+            if entry.get('input_size') == stat.st_size and entry.get('input_mtime') == stat.st_mtime_ns:
+                self.input_hash = entry['input_hash']
+                self.entry = entry
+                return
+
+        self.input_hash = file_hash(path)
+        if entry is not None and entry.get('input_hash') == self.input_hash:
+            # The file was touched or copied but not changed, keep the finished stages
+            self.entry = entry
+        else:
+            self.entry = {'input': path, 'input_hash': self.input_hash, 'stages': {}}
+        self.entry.update(input_size=stat.st_size, input_mtime=stat.st_mtime_ns)
+        if entry is not None:
+            self.write_entry()
+
+    def output_path(self, stage):
+        """Returns the path of the output file of a stage."""
+        return os.path.join(self.dir, self.id + '.' + stage + '.pkl')
+
+    def done(self, stage, params=None):
+        """Tells if a stage finished for the current input and parameters and its output still exists.
+
+        Parameters:
+
+        stage| String: name of the stage eg. 'lemmatize'
+        params| JSON serialisable object, optional: parameters the stage output depends on
+        """
+        record = self.entry['stages'].get(stage)
+        return (record is not None and record['params'] == params_hash(params)
+                and os.path.exists(record['output']))
+
+    def load(self, stage):
+        """Returns the saved output dataframe of a stage."""
+        with open(self.entry['stages'][stage]['output'], 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, stage, df, params=None):
+        """Saves the output dataframe of a stage and marks the stage finished in the manifest.
+
+        Parameters:
+
+        stage| String: name of the stage eg. 'lemmatize'
+        df| Pandas dataframe: output of the stage
+        params| JSON serialisable object, optional: parameters the stage output depends on
+        """
+        output = self.output_path(stage)
+        df.to_pickle(output + '.tmp')
+        os.replace(output + '.tmp', output)
+
+        self.entry['stages'][stage] = {'params': params_hash(params), 'output': output, 'rows': len(df),
+                                       'finished': time.strftime('%Y-%m-%d %H:%M:%S')}
+        self.write_entry()
+
+    def write_entry(self):
+        """Writes the manifest entry of the chunk."""
+        with open(self.entry_path + '.tmp', 'w') as f:
+            json.dump(self.entry, f, indent=2)
+        os.replace(self.entry_path + '.tmp', self.entry_path)
@@ -0,0 +1,149 @@
+# Import required packages
+import re
+import zlib
+import unicodedata
+import numpy as np
+import pandas as pd
+from pipeline_settings import NEAR_DUPLICATES
+from instrumentation import record_step
+
+# MinHash signature length and LSH banding, 8 bands of 8 rows find pairs with Jaccard similarity of about 0.8 and up
+NUM_PERM = 64
+BANDS = 8
+SHINGLE_SIZE = 3
+
+# Parts of tweet text that do not change its meaning
+RT_PREFIX = re.compile(r'^(?:\s*RT\s+@\w+:?\s*)+', re.IGNORECASE)
+URL = re.compile(r'https?://\S+|www\.\S+', re.IGNORECASE)
+MENTION = re.compile(r'(?<!\w)@\w+')
+WHITESPACE = re.compile(r'\s+')
+
+# Random permutations of the MinHash, fixed so that signatures are the same in every process
+MERSENNE_PRIME = (1 << 61) - 1
+PERMUTATIONS = np.random.RandomState(1).randint(1, 1 << 31, size=(2, NUM_PERM)).astype(np.uint64)
+
+
+def normalize_tweet(text):
+    """Returns the form of a tweet used to find duplicates: without retweet prefix, links and
+    mentions, NFC normalized, lower case and with single spaces.
+
+    Parameters:
+
+    text| String: text of a tweet
+    """
+    text = RT_PREFIX.sub('', unicodedata.normalize('NFC', text))
+    text = MENTION.sub('', URL.sub('', text))
+    return WHITESPACE.sub(' ', text).strip().lower()
+
+
+def minhash(text):
+    """Returns the MinHash signature (NUM_PERM unsigned integers) of the word shingles of a text.
+
+    Parameters:
+
+    text| String: normalized text
+    """
+    words = text.split()
+    shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    return ((hashes[:, None] * PERMUTATIONS[0] + PERMUTATIONS[1]) % MERSENNE_PRIME).min(axis=0)
+
+
+def near_duplicate_groups(texts):
+    """Clusters texts whose MinHash signatures share an LSH band. Returns the cluster of each
+    text as the position of its first member.
+
+    Parameters:
+
+    texts| list of strings: normalized texts, each distinct
+    """
+    parent = np.arange(len(texts))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    signatures = [minhash(text) for text in texts]
+    rows = NUM_PERM // BANDS
+    for band in range(BANDS):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            first = buckets.setdefault(signature[band * rows:(band + 1) * rows].tobytes(), i)
+            if first != i:
+                a, b = find(first), find(i)
+                parent[max(a, b)] = min(a, b)
+
+    return np.array([find(i) for i in range(len(texts))], dtype=np.int64)
+
+
+def duplicate_groups(texts, near=NEAR_DUPLICATES):
+    """Groups the texts of a chunk into duplicates. Returns the positions of one representative
+    per group and, for every text, the number of its group. Texts that are not strings form
+    their own groups.
+
+    Parameters:
+
+    texts| Pandas Series of tweet texts
+    near| bool: also group near-duplicates with MinHash and LSH
+    """
+    keys = texts.map(lambda text: normalize_tweet(text) if isinstance(text, str) else None)
+    groups, uniques = pd.factorize(keys, use_na_sentinel=True)
+
+    # Every text that is not a string is its own group
+    missing = groups < 0
+    groups[missing] = len(uniques) + np.arange(missing.sum())
+
+    if near and len(uniques) > 1:
+        clusters = near_duplicate_groups(list(uniques))
+        _, clusters = np.unique(clusters, return_inverse=True)
+        groups[~missing] = clusters[groups[~missing]]
+        groups[missing] = clusters.max() + 1 + np.arange(missing.sum())
+
+    _, representatives, groups = np.unique(groups, return_index=True, return_inverse=True)
+    return representatives, groups
+
+
+def report_dedup(label, lang, tweet_count, unique_count):
+    """Prints how many tweets of a chunk and language were left after collapsing duplicates.
+
+    Parameters:
+
+    label| String: name of the chunk eg. 'batch 3'
+    lang| String: language of the tweets
+    tweet_count| int: number of tweets
+    unique_count| int: number of groups of duplicates
+    """
+    ratio = tweet_count / unique_count if unique_count > 0 else 1.0
+    print('--- Dedup %s %s: %s tweets, %s unique (dedup ratio %s) ---'
+          % (label, lang, tweet_count, unique_count, round(ratio, 2)))
+    return {'chunk': label, 'lang': lang, 'tweets': tweet_count, 'unique': unique_count, 'dedup_ratio': ratio}
+
+
+def apply_deduplicated(df, function, lang='', label='', near=NEAR_DUPLICATES):
+    """Runs function on one representative of each group of duplicate tweets and broadcasts
+    the columns it adds back to all members of the group. Returns the dataframe with the
+    new columns, in the original order.
+
+    Parameters:
+
+    df| Pandas dataframe of tweets in one language, with column 'full_text'
+    function| function taking and returning a dataframe, eg. a lemmatiser
+    lang| String: language name used in the printout
+    label| String: name of the chunk used in the printout
+    near| bool: also collapse near-duplicates
+    """
+    if len(df) == 0:
+        return function(df)
+
+    representatives, groups = duplicate_groups(df['full_text'], near)
+    # The ratio also goes to the metrics of the enclosing step, see instrumentation.py
+    record_step(dedup=report_dedup(label, lang, len(df), len(representatives)))
+
+    processed = function(df.iloc[representatives])
+    df = df.copy()
+    for column in processed.columns.difference(df.columns):
+        df[column] = processed[column].take(groups).set_axis(df.index)
+    return df
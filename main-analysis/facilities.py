@@ -0,0 +1,137 @@
+# Import required packages
+import os
+import sys
+import numpy as np
+import geopandas as gpd
+import shapely
+import requests
+import geojson
+from pipeline_settings import LIPAS_PATH, FACILITY_RADIUS
+
+# WFS layer of the LIPAS sports facility points and the bounding box of the metropolitan area
+LIPAS_URL = 'http://lipas.cc.jyu.fi/geoserver/lipas/ows'
+LIPAS_LAYER = 'lipas:lipas_kaikki_pisteet'
+HMA_BBOX = (361500.0001438780454919, 6665250.0001345984637737, 403750.0001343561452813, 6698000.0001281434670091)
+
+# Columns of the facility name and type, the second names are those of a shapefile (10 characters)
+NAME_COLUMNS = ['nimi_fi', 'nimi']
+TYPE_COLUMNS = ['tyyppi_nimi_fi', 'tyyppi_nim']
+
+
+def fetch_facilities(path=LIPAS_PATH, bbox=HMA_BBOX):
+    """Fetches the LIPAS sports facility points inside bbox from the WFS and saves them to path,
+    with the columns kept by Get_lipas_data.ipynb.
+
+    Parameters:
+
+    path| String: file to save the facilities to eg. 'lipas.gpkg'
+    bbox| tuple: minx, miny, maxx, maxy in EPSG:3067
+    """
+    r = requests.get(LIPAS_URL, params=dict(service='wfs', version='2.0.0', request='GetFeature', typeNames=LIPAS_LAYER,
+                                            bbox=','.join(str(value) for value in bbox) + ',EPSG:3067',
+                                            outputFormat='json'))
+    r.raise_for_status()
+    facilities = gpd.GeoDataFrame.from_features(geojson.loads(r.content), crs='EPSG:3067')
+    facilities = facilities[['nimi_fi', 'tyyppi_nimi_fi', 'geometry']]
+    facilities.to_file(path)
+    print('Saved %s LIPAS facilities to %s' % (len(facilities), path))
+    return facilities
+
+
+class FacilityIndex:
+    """Spatial index of the sports facilities. The layer is read once and its geometries are
+    put in an STRtree, which finds the nearest facility of all tweets in one bulk query.
+
+    Parameters:
+
+    facilities| GeoDataFrame of facilities with name and type columns (see NAME_COLUMNS and TYPE_COLUMNS)
+    """
+
+    def __init__(self, facilities):
+        facilities = facilities.to_crs(epsg=3067) if facilities.crs is not None else facilities
+        name = next((column for column in NAME_COLUMNS if column in facilities.columns), None)
+        kind = next((column for column in TYPE_COLUMNS if column in facilities.columns), None)
+        self.names = facilities[name].to_numpy(dtype=object) if name else np.full(len(facilities), None, dtype=object)
+        self.types = facilities[kind].to_numpy(dtype=object) if kind else np.full(len(facilities), None, dtype=object)
+        self.tree = shapely.STRtree(facilities.geometry.values)
+
+    def __len__(self):
+        return len(self.names)
+
+    def nearest(self, geometry, radius=FACILITY_RADIUS):
+        """Returns the position of the nearest facility of each geometry (-1 if there is none
+        within radius) and the distances in metres (NaN if there is none).
+
+        Parameters:
+
+        geometry| array of shapely geometries in EPSG:3067
+        radius| float: largest distance in metres, 0 for no limit
+        """
+        positions = np.full(len(geometry), -1, dtype=np.int64)
+        distances = np.full(len(geometry), np.nan)
+        valid = ~(shapely.is_missing(geometry) | shapely.is_empty(geometry))
+        if len(self) == 0 or not valid.any():
+            return positions, distances
+
+        (rows, facilities), found = self.tree.query_nearest(geometry[valid], max_distance=radius or None,
+                                                            return_distance=True, all_matches=False)
+        rows = np.flatnonzero(valid)[rows]
+        positions[rows] = facilities
+        distances[rows] = found
+        return positions, distances
+
+
+def load_facilities(path=LIPAS_PATH):
+    """Returns the FacilityIndex of a facility layer, fetched from LIPAS first if the file does not exist.
+
+    Parameters:
+
+    path| String: facility layer eg. 'lipas.shp'
+    """
+    facilities = gpd.read_file(path) if os.path.exists(path) else fetch_facilities(path)
+    return FacilityIndex(facilities)
+
+
+def nearest_facility(tweets, facilities, radius=FACILITY_RADIUS, drop=False):
+    """Attaches to each tweet its nearest sports facility: columns facility, facility_type and
+    facility_distance (metres). Tweets without a facility within radius get empty values, or
+    are dropped with drop.
+
+    Parameters:
+
+    tweets| GeoDataFrame of located tweets, in EPSG:3067 if it has no crs
+    facilities| FacilityIndex
+    radius| float: largest distance in metres, 0 for no limit
+    drop| bool: leave out the tweets without a facility within radius
+    """
+    geometry = tweets.geometry
+    if geometry.crs is not None:
+        geometry = geometry.to_crs(epsg=3067)
+    positions, distances = facilities.nearest(geometry.values, radius)
+    found = positions >= 0
+
+    names = np.full(len(tweets), None, dtype=object)
+    types = np.full(len(tweets), None, dtype=object)
+    names[found] = facilities.names[positions[found]]
+    types[found] = facilities.types[positions[found]]
+
+    tweets = tweets.copy()
+    tweets['facility'] = names
+    tweets['facility_type'] = types
+    tweets['facility_distance'] = distances
+    print('%s of %s tweets have a sports facility%s' % (int(found.sum()), len(tweets),
+                                                        ' within %s m' % radius if radius else ''))
+    return tweets[found] if drop else tweets
+
+
+if __name__ == '__main__':
+
+    # Attach the nearest facilities to an output eg. python facilities.py finaloutput.gpkg lipas.shp facilities.gpkg [radius]
+    from map_export import read_output
+
+    output = read_output(sys.argv[1])
+    joined = nearest_facility(output, load_facilities(sys.argv[2]), float(sys.argv[4]) if len(sys.argv) > 4 else FACILITY_RADIUS)
+    if sys.argv[3].endswith('.parquet'):
+        joined.to_parquet(sys.argv[3])
+    else:
+        joined.to_file(sys.argv[3])
@@ -0,0 +1,145 @@
+# Import required packages
+import unicodedata
+from itertools import combinations
+from pipeline_settings import MIN_CONFIDENCE
+
+# Confidence of a match that differs only in diacritics, and of a place name found inside a compound word
+FOLDED_CONFIDENCE = 0.95
+COMPOUND_CONFIDENCE = 0.85
+
+# Shortest word looked up at all, and shortest place name accepted as part of a compound
+MIN_LENGTH = 5
+MIN_PART_LENGTH = 5
+
+# Finnish genitive ending of the first part of compounds eg. nuuksion|kansallispuisto
+COMPOUND_LINKS = ['', 'n']
+
+
+def fold_diacritics(word):
+    """Returns word without diacritics, so that 'töölö' and 'toolo' are the same.
+
+    Parameters:
+
+    word| String: normalized word
+    """
+    decomposed = unicodedata.normalize('NFKD', word)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def max_distance(word):
+    """Returns the largest edit distance allowed for a word, longer words may differ more."""
+    if len(word) < MIN_LENGTH:
+        return 0
+    return 1 if len(word) <= 8 else 2
+
+
+def deletes(word, distance):
+    """Returns all strings made by deleting up to distance characters from word."""
+    result = {word}
+    for count in range(1, min(distance, len(word) - 1) + 1):
+        for positions in combinations(range(len(word)), count):
+            result.add(''.join(char for i, char in enumerate(word) if i not in positions))
+    return result
+
+
+def edit_distance(a, b, limit):
+    """Returns the optimal string alignment distance of a and b (insertions, deletions,
+    substitutions and swaps of neighbours), or limit + 1 when it is larger than limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyToponymIndex:
+    """Symmetric delete (SymSpell style) index over the place names of a gazetteer. Names are
+    folded to plain letters, and every string made by deleting up to two letters from them
+    points back to the name. A word is looked up through its own deletes, so only a handful
+    of candidates are compared with the bounded edit distance. Words that are not found are
+    split into a place name and the rest of a compound word (eg. '#nuuksionkansallispuisto').
+    Results are remembered per word.
+
+    Parameters:
+
+    name_keys| list of (String, int): normalized place names and their feature ids, in priority order
+    """
+
+    def __init__(self, name_keys):
+        self.folded = {}
+        for key, feature_id in name_keys:
+            self.folded.setdefault(fold_diacritics(key), (key, feature_id))
+
+        self.neighbours = {}
+        for folded in self.folded:
+            for deleted in deletes(folded, max_distance(folded)):
+                self.neighbours.setdefault(deleted, []).append(folded)
+
+        self.max_name_length = max([len(folded) for folded in self.folded] + [0])
+        self.results = {}
+
+    def lookup(self, word):
+        """Returns (feature id, confidence) of the place name closest to word, or None if no
+        name is close enough.
+
+        Parameters:
+
+        word| String: word normalized with gazetteer.normalize_name
+        """
+        if word in self.results:
+            return self.results[word]
+
+        result = None
+        if len(word) >= MIN_LENGTH:
+            result = self.nearest(word)
+            if result is None:
+                result = self.compound(word)
+        if result is not None and result[1] < MIN_CONFIDENCE:
+            result = None
+
+        self.results[word] = result
+        return result
+
+    def nearest(self, word):
+        """Returns (feature id, confidence) of the closest name within the allowed edit distance."""
+        folded = fold_diacritics(word)
+        if folded in self.folded:
+            key, feature_id = self.folded[folded]
+            return feature_id, 1.0 if key == word else FOLDED_CONFIDENCE
+
+        limit = max_distance(folded)
+        best = None
+        for deleted in deletes(folded, limit):
+            for candidate in self.neighbours.get(deleted, ()):
+                distance = edit_distance(folded, candidate, limit)
+                if distance <= limit and (best is None or distance < best[0]):
+                    best = (distance, candidate)
+        if best is None:
+            return None
+        return self.folded[best[1]][1], 1 - best[0] / len(folded)
+
+    def compound(self, word):
+        """Returns (feature id, confidence) of the longest place name that a compound word
+        starts or ends with, eg. nuuksionkansallispuisto or lenkkikallio."""
+        folded = fold_diacritics(word)
+        for length in range(min(len(folded) - 3, self.max_name_length + 1), MIN_PART_LENGTH - 1, -1):
+            head = folded[:length]
+            for link in COMPOUND_LINKS:
+                if link and head.endswith(link) and head[:-len(link)] in self.folded:
+                    return self.folded[head[:-len(link)]][1], COMPOUND_CONFIDENCE
+                if not link and head in self.folded:
+                    return self.folded[head][1], COMPOUND_CONFIDENCE
+            tail = folded[-length:]
+            if tail in self.folded:
+                return self.folded[tail][1], COMPOUND_CONFIDENCE
+        return None
@@ -0,0 +1,355 @@
+# Import required packages
+import re
+import json
+import hashlib
+import unicodedata
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from lemma_store import as_lemma_series, lemma_chunks, lemma_series
+from fuzzy_toponyms import FuzzyToponymIndex
+from pipeline_settings import FUZZY
+from instrumentation import count_error
+
+# File signature and format version of compiled gazetteer artifacts
+ARTIFACT_MAGIC = b'SPGAZ\x00\x00\x00'
+ARTIFACT_VERSION = 1
+
+# Words of raw tweet text, hyphenated names and hashtags are kept whole
+TOKEN = re.compile(r'#?\w+(?:-\w+)*')
+
+
+def normalize_name(name):
+    """Returns the form of a place name or lemma used for matching: lower case NFC text
+    without hashtag signs, spaces or hyphens, so that 'Itä-Keskus', 'itä keskus' and
+    '#itäkeskus' all become 'itäkeskus'.
+
+    Parameters:
+
+    name| String: place name or lemma
+    """
+    name = unicodedata.normalize('NFC', name).lower()
+    return ''.join(char for char in name if char not in '#- \t')
+
+
+def text_tokens(text):
+    """Splits raw tweet text into word tokens, so that tweets can be matched against the
+    inflected forms of a compiled gazetteer without lemmatising them. Returns None for
+    tweets without text.
+
+    Parameters:
+
+    text| String: text of a tweet
+    """
+    return TOKEN.findall(text) if isinstance(text, str) else None
+
+
+def name_hash(key):
+    """Returns the 64-bit hash of a normalized name that compiled gazetteers are keyed by.
+
+    Parameters:
+
+    key| String: name normalized with normalize_name
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class GazetteerIndex:
+    """Compiled lookup structure over a gazetteer. Place names are normalized and mapped to
+    the row of their first feature, whose coordinates and geometry are precomputed into
+    arrays. Names that the tokenizer splits into several lemmas (eg. 'Itä keskus') are
+    found by walking consecutive lemmas through a prefix set of the names.
+
+    Parameters:
+
+    hmanames| GeoPandas dataframe holding the gazetteer, with columns name and geometry
+    """
+
+    def __init__(self, hmanames):
+        names = hmanames['name'].astype(str).tolist()
+        self.names = names
+        self.geometry = hmanames.geometry.reset_index(drop=True)
+        self.x = self.geometry.x.to_numpy()
+        self.y = self.geometry.y.to_numpy()
+        self.crs = hmanames.crs
+
+        # Normalized name -> first feature with that name, like the earlier .values[0] lookup
+        self.name_to_id = {}
+        for feature_id, name in enumerate(names):
+            self.name_to_id.setdefault(normalize_name(name), feature_id)
+
+        # Every prefix of every name, used to stop the lemma walk early
+        self.prefixes = set()
+        for key in self.name_to_id:
+            for end in range(1, len(key) + 1):
+                self.prefixes.add(key[:end])
+
+        # Largest number of lemmas one name can be split into
+        self.max_parts = max([len(name.replace('-', ' ').split()) for name in names] + [1]) + 1
+        self._fuzzy = None
+
+    def name_keys(self):
+        """Returns the normalized names and their feature ids, in the order they take precedence."""
+        return list(self.name_to_id.items())
+
+    def fuzzy(self):
+        """Returns the FuzzyToponymIndex of the gazetteer, built on first use."""
+        if self._fuzzy is None:
+            self._fuzzy = FuzzyToponymIndex(self.name_keys())
+        return self._fuzzy
+
+    def match(self, lemmas):
+        """Returns the feature ids of all toponyms found in a list of lemmas, in order of
+        appearance without repeats. At each position the longest run of lemmas that forms a
+        place name wins, and matching continues after it.
+
+        Parameters:
+
+        lemmas| list of strings: lemmas of one tweet
+        """
+        return self.match_keys([normalize_name(lemma) for lemma in lemmas])
+
+    def match_keys(self, keys):
+        """Same as match for lemmas that are already normalized with normalize_name."""
+        found = []
+        start = 0
+
+        while start < len(keys):
+            joined = ''
+            best = None
+            for end in range(start, min(start + self.max_parts, len(keys))):
+                joined += keys[end]
+                if joined not in self.prefixes:
+                    break
+                if joined in self.name_to_id:
+                    best = (end, self.name_to_id[joined])
+
+            if best is None:
+                start += 1
+            else:
+                if best[1] not in found:
+                    found.append(best[1])
+                start = best[0] + 1
+
+        return found
+
+
+class HashedNames:
+    """Set (and mapping to feature ids) of normalized names stored as sorted 64-bit hashes.
+
+    Parameters:
+
+    hashes| numpy array of uint64: sorted name hashes
+    feature_ids| numpy array of int32, optional: feature id of each hash
+    """
+
+    def __init__(self, hashes, feature_ids=None):
+        self.hashes = hashes
+        self.feature_ids = feature_ids
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def position(self, key):
+        """Returns the position of the hash of key, or -1 if key is not in the set."""
+        key_hash = np.uint64(name_hash(key))
+        position = int(np.searchsorted(self.hashes, key_hash))
+        if position < len(self.hashes) and self.hashes[position] == key_hash:
+            return position
+        return -1
+
+    def __contains__(self, key):
+        return self.position(key) >= 0
+
+    def __getitem__(self, key):
+        position = self.position(key)
+        if position < 0:
+            raise KeyError(key)
+        return int(self.feature_ids[position])
+
+
+class FeatureNames:
+    """Read-only sequence of the feature names of a compiled gazetteer, decoded from the
+    memory mapped UTF-8 bytes when accessed.
+
+    Parameters:
+
+    offsets| numpy array of int64: start of each name in data, plus the end of the last
+    data| numpy array of uint8: the names as UTF-8
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, feature_id):
+        return bytes(self.data[self.offsets[feature_id]:self.offsets[feature_id + 1]]).decode('utf-8')
+
+
+class CompiledGazetteer(GazetteerIndex):
+    """GazetteerIndex read from a binary artifact written by gazetteer_compiler.py. The arrays
+    (name hashes, feature ids, prefix hashes, coordinates and names) are memory mapped from
+    the file, so loading takes milliseconds and worker processes share the pages.
+
+    Parameters:
+
+    path| String: path of the artifact eg. 'hmagazetteer.gaz'
+    """
+
+    def __init__(self, path):
+        header = read_artifact_header(path)
+        arrays = {name: np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(length,))
+                  for name, (offset, dtype, length) in header['arrays'].items()}
+
+        self.path = path
+        self.header = header
+        self.names = FeatureNames(arrays['name_offsets'], arrays['name_bytes'])
+        self.x = arrays['x']
+        self.y = arrays['y']
+        self.crs = header['crs']
+        self.name_to_id = HashedNames(arrays['key_hashes'], arrays['key_features'])
+        self.prefixes = HashedNames(arrays['prefix_hashes'])
+        self.max_parts = header['max_parts']
+        self._geometry = None
+        self._fuzzy = None
+
+    def name_keys(self):
+        """Returns the normalized feature names and their feature ids. The alternate names and
+        inflected forms of the artifact are stored as hashes only and are not included."""
+        return [(normalize_name(self.names[feature_id]), feature_id) for feature_id in range(len(self.names))]
+
+    @property
+    def geometry(self):
+        """Points of the features, built on first use."""
+        if self._geometry is None:
+            self._geometry = gpd.GeoSeries(gpd.points_from_xy(self.x, self.y), crs=self.crs)
+        return self._geometry
+
+
+def read_artifact_header(path):
+    """Returns the header of a compiled gazetteer artifact as a dict. Raises ValueError if the
+    file is not an artifact of the current format version.
+
+    Parameters:
+
+    path| String: path of the artifact
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(ARTIFACT_MAGIC))
+        version, header_length = np.frombuffer(f.read(8), dtype='<u4')
+        if magic != ARTIFACT_MAGIC or version != ARTIFACT_VERSION:
+            raise ValueError(path + ' is not a version ' + str(ARTIFACT_VERSION)
+                             + ' gazetteer artifact, rebuild it with gazetteer_compiler.py')
+        return json.loads(f.read(int(header_length)).decode('utf-8'))
+
+
+def load_gazetteer_index(path):
+    """Reads a gazetteer file and compiles a GazetteerIndex from it. Artifacts built with
+    gazetteer_compiler.py (.gaz) are memory mapped instead.
+
+    Parameters:
+
+    path| String: path of the gazetteer eg. 'hmagazetteer.shp' or 'hmagazetteer.gaz'
+    """
+    if path.endswith('.gaz'):
+        return CompiledGazetteer(path)
+    return GazetteerIndex(gpd.read_file(path))
+
+
+def geocode(sportstogeocode, hmanames, column='lemmas', fuzzy=FUZZY):
+    """
+    Geocodes the tweets in sportstogeocode dataframe based on the gazetteer saved in hmanames.
+    All tweets are matched in one pass over the lemma ids against the compiled gazetteer
+    index, skipping tweets in which no lemma can start a place name. The point of
+    the first toponym of a tweet becomes its geometry (lon and lat hold its x and y) and
+    all matched toponyms are listed in column toponyms. Tweets without an exact match are
+    looked up in the fuzzy index of the gazetteer (misspellings, missing diacritics and
+    place names inside compound words), see fuzzy_toponyms.py. Column confidence is 1 for
+    exact matches and lower for fuzzy ones.
+
+    Parameters:
+
+    sportstogeocode | String: name of Pandas dataframe with ungeotagged tweets
+    hmanames | GazetteerIndex or GeoPandas dataframe holding gazetteer information
+    column | String: 'lemmas' or a text column eg. 'full_text' to match its raw words
+    fuzzy | bool: look up tweets without an exact match in the fuzzy index
+    """
+    index = hmanames if isinstance(hmanames, GazetteerIndex) else GazetteerIndex(hmanames)
+    if column == 'lemmas':
+        lemmas = as_lemma_series(sportstogeocode['lemmas'])
+    else:
+        lemmas = lemma_series([text_tokens(text) for text in sportstogeocode[column].tolist()])
+
+    rows = []
+    first_ids = []
+    toponyms = []
+    confidence = []
+    skipped = 0
+    chunk_start = 0
+
+    for token_rows, ids, dictionary, missing in lemma_chunks(lemmas):
+        skipped += int(missing.sum())
+        # Normalize each word of the dictionary once instead of every token
+        keys = [normalize_name(word) for word in dictionary.to_pylist()]
+        starts_name = np.fromiter((key in index.prefixes for key in keys), dtype=bool, count=len(keys))
+
+        # Only tweets with at least one lemma that can start a place name are walked
+        candidates = np.unique(token_rows[starts_name[ids]])
+        starts = np.searchsorted(token_rows, candidates, side='left')
+        ends = np.searchsorted(token_rows, candidates, side='right')
+
+        matched = np.zeros(len(missing), dtype=bool)
+        for row, start, end in zip(candidates.tolist(), starts.tolist(), ends.tolist()):
+            feature_ids = index.match_keys([keys[lemma_id] for lemma_id in ids[start:end].tolist()])
+            if feature_ids:
+                matched[row - chunk_start] = True
+                rows.append(row)
+                first_ids.append(feature_ids[0])
+                toponyms.append(','.join(index.names[feature_id] for feature_id in feature_ids))
+                confidence.append(1.0)
+
+        if fuzzy:
+            # Each distinct word of the tweets left without a match is looked up once
+            left = ~matched[token_rows - chunk_start]
+            fuzzy_index = index.fuzzy()
+            fuzzy_feature = np.full(len(keys), -1, dtype=np.int64)
+            fuzzy_confidence = np.zeros(len(keys))
+            for lemma_id in np.unique(ids[left]).tolist():
+                result = fuzzy_index.lookup(keys[lemma_id])
+                if result is not None:
+                    fuzzy_feature[lemma_id], fuzzy_confidence[lemma_id] = result
+
+            # The first word of a tweet with a fuzzy match locates it
+            hit = left & (fuzzy_feature[ids] >= 0)
+            hit_rows, first = np.unique(token_rows[hit], return_index=True)
+            hit_ids = ids[hit][first]
+            for row, lemma_id in zip(hit_rows.tolist(), hit_ids.tolist()):
+                rows.append(row)
+                first_ids.append(int(fuzzy_feature[lemma_id]))
+                toponyms.append(index.names[int(fuzzy_feature[lemma_id])])
+                confidence.append(float(fuzzy_confidence[lemma_id]))
+
+        chunk_start += len(missing)
+
+    if skipped > 0:
+        print('Skipped %s tweets without lemmas' % skipped)
+        count_error('no_lemmas', skipped)
+
+    # Back to the order of the tweets
+    order = np.argsort(np.asarray(rows, dtype=np.int64), kind='stable')
+    first_ids = np.asarray(first_ids, dtype=np.int64)[order]
+    sportshma = sportstogeocode.iloc[np.asarray(rows, dtype=np.int64)[order]].copy()
+    sportshma['lon'] = index.x[first_ids]
+    sportshma['lat'] = index.y[first_ids]
+    sportshma['toponym'] = [index.names[feature_id] for feature_id in first_ids]
+    sportshma['toponyms'] = pd.Series([toponyms[i] for i in order], index=sportshma.index, dtype=object)
+    sportshma['confidence'] = np.asarray(confidence, dtype=np.float64)[order]
+    sportshma = gpd.GeoDataFrame(sportshma, geometry=index.geometry.take(first_ids).to_numpy(), crs=index.crs)
+
+    print(str(len(sportshma)) + ' tweets succesfully geocoded')
+    if fuzzy:
+        print(str(int((sportshma['confidence'] < 1).sum())) + ' of them with a fuzzy match')
+    return sportshma
@@ -0,0 +1,302 @@
+# Import required packages
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from gazetteer import normalize_name, name_hash, ARTIFACT_MAGIC, ARTIFACT_VERSION
+
+# Columns of the GeoNames country files eg. FI.txt
+GEONAMES_COLUMNS = ['geonameid', 'name', 'asciiname', 'alternatenames', 'latitude', 'longitude', 'feature class',
+                    'feature code', 'country code', 'cc2', 'admin1 code', 'admin2 code', 'admin3 code', 'admin4 code',
+                    'population', 'elevation', 'dem', 'timezone', 'modification date']
+
+# Languages of the alternate names taken from the GeoNames alternateNamesV2.txt file
+LANGUAGES = ['fi', 'sv', 'en']
+
+# Shortest name expanded into inflected forms, shorter ones collide with common words
+MIN_INFLECTED_LENGTH = 4
+
+# Finnish consonant gradation, strong grade -> weak grade, longest first
+GRADATION = [('kk', 'k'), ('pp', 'p'), ('tt', 't'), ('nk', 'ng'), ('nt', 'nn'), ('mp', 'mm'), ('lt', 'll'),
+             ('rt', 'rr'), ('ht', 'hd'), ('lk', 'l'), ('rk', 'r'), ('hk', 'h'), ('t', 'd'), ('p', 'v'), ('k', '')]
+
+VOWELS = 'aeiouyäö'
+
+# Case endings added to the weak and strong stems, in back vowel form
+WEAK_ENDINGS = ['n', 'ssa', 'sta', 'lla', 'lta', 'lle', 'ksi']
+STRONG_ENDINGS = ['na']
+
+
+def read_geonames(path, area_path):
+    """Reads a GeoNames country file and keeps the places inside the study area. Returns a
+    geodataframe in EPSG:3067 with lower case names.
+
+    Parameters:
+
+    path| String: path of the GeoNames file eg. 'data/FI.txt'
+    area_path| String: polygons of the study area eg. 'data/PKS_postinumeroalueet_2020.shp'
+    """
+    geonames = pd.read_csv(path, sep='\t', header=None, names=GEONAMES_COLUMNS, quoting=3,
+                           dtype={'alternatenames': str, 'admin1 code': str, 'admin2 code': str,
+                                  'admin3 code': str, 'admin4 code': str, 'cc2': str})
+
+    # Points of all places at once, converted to ETRS89 / TM35FIN
+    points = gpd.GeoSeries(gpd.points_from_xy(geonames['longitude'], geonames['latitude']),
+                           crs='EPSG:4326').to_crs(epsg=3067)
+
+    # Keep the places inside the study area with one prepared point in polygon test
+    area = gpd.read_file(area_path).to_crs(epsg=3067)
+    boundary = shapely.union_all(area.geometry.values)
+    shapely.prepare(boundary)
+    inside = shapely.contains_xy(boundary, points.x.to_numpy(), points.y.to_numpy())
+
+    hmanames = gpd.GeoDataFrame(geonames[inside].reset_index(drop=True),
+                                geometry=points.values[inside], crs='EPSG:3067')
+    hmanames['name'] = hmanames['name'].str.lower()
+    return hmanames
+
+
+def read_alternate_names(path, geonameids, languages=LANGUAGES):
+    """Reads the names of the given places in the given languages from the GeoNames
+    alternateNamesV2.txt file. Returns a dataframe with columns geonameid, lang and name.
+
+    Parameters:
+
+    path| String: path of alternateNamesV2.txt
+    geonameids| list of ints: places to keep
+    languages| list of strings: ISO language codes to keep
+    """
+    names = pd.read_csv(path, sep='\t', header=None, usecols=[1, 2, 3], names=['geonameid', 'lang', 'name'],
+                        dtype={'lang': str, 'name': str}, quoting=3)
+    names = names[names['geonameid'].isin(geonameids) & names['lang'].isin(languages)]
+    return names.reset_index(drop=True)
+
+
+def is_latin(name):
+    """Tells if a name is written in latin letters and is not just a number."""
+    return any(char.isalpha() for char in name) and all(ord(char) < 0x250 for char in name)
+
+
+def surface_names(hmanames, alternate_names=None):
+    """Returns every name a feature can be written with: the base name, then the alternate
+    names. Alternate names come from alternate_names if given, otherwise from the
+    alternatenames column (latin script only, GeoNames does not tell their language there).
+    Returns a dataframe with columns feature, name, lang and priority.
+
+    Parameters:
+
+    hmanames| GeoPandas dataframe of the gazetteer, with columns name and geonameid
+    alternate_names| Pandas dataframe from read_alternate_names, optional
+    """
+    base = pd.DataFrame({'feature': np.arange(len(hmanames)), 'name': hmanames['name'].astype(str),
+                         'lang': 'fi', 'priority': 0})
+
+    if alternate_names is not None:
+        feature_of = pd.Series(np.arange(len(hmanames)), index=hmanames['geonameid'])
+        feature_of = feature_of[~feature_of.index.duplicated()]
+        alternates = pd.DataFrame({'feature': feature_of.reindex(alternate_names['geonameid']).to_numpy(),
+                                   'name': alternate_names['name'].to_numpy(), 'lang': alternate_names['lang'].to_numpy()})
+    else:
+        column = 'alternatenames' if 'alternatenames' in hmanames.columns else 'alternaten'
+        alternates = pd.DataFrame({'feature': np.arange(len(hmanames)),
+                                   'name': hmanames[column].str.split(',')}).explode('name')
+        alternates = alternates[alternates['name'].notna()]
+        alternates = alternates[alternates['name'].map(is_latin).astype(bool)]
+        alternates['lang'] = None
+    alternates['priority'] = 1
+
+    names = pd.concat([base, alternates.dropna(subset=['feature', 'name'])], ignore_index=True)
+    names['feature'] = names['feature'].astype(np.int64)
+    return names
+
+
+def harmony_vowels(name):
+    """Returns the vowels ('a' and/or 'ä') the endings of a Finnish name can take. Both when
+    the name ends in neutral vowels after a back vowel, as in compounds like hakaniemi."""
+    word = name.replace('-', ' ').split()[-1]
+    harmonic = [char for char in word if char in 'aouäöy']
+    if not harmonic:
+        return ['ä']
+    if harmonic[-1] in 'äöy':
+        return ['ä']
+    tail = word[word.rindex(harmonic[-1]) + 1:]
+    return ['a', 'ä'] if len(tail) >= 4 else ['a']
+
+
+def weak_grade(stem):
+    """Returns stem with the consonant before its last vowel in the weak grade, eg. helsinki -> helsingi."""
+    for strong, weak in GRADATION:
+        head = stem[:-1]
+        if head.endswith(strong) and len(head) > len(strong) and head[-len(strong) - 1] in VOWELS + 'lnrh':
+            return head[:-len(strong)] + weak + stem[-1]
+    return stem
+
+
+def inflected_forms(name):
+    """Returns approximate Finnish case forms of a place name (genitive, locative cases,
+    essive, translative, illative and partitive), eg. kallio -> kallion, kalliossa, kalliota.
+    The rules are the regular ones for names ending in a vowel or -us/-ys/-nen, names that do
+    not follow them only get some of their forms right.
+
+    Parameters:
+
+    name| String: lower case place name
+    """
+    key = normalize_name(name)
+    if len(key) < MIN_INFLECTED_LENGTH or not key.isalpha():
+        return []
+
+    # (weak stem, strong stem, illative, partitive stem and ending) for each way the name can be inflected
+    stems = []
+    if key.endswith('nen'):
+        stems.append((key[:-3] + 'se', key[:-3] + 'se', key[:-3] + 'seen', (key[:-3] + 's', 'ta')))
+    elif key[-2:] in ('us', 'ys', 'os', 'ös'):
+        stems.append((key[:-1] + 'kse', key[:-1] + 'kse', key[:-1] + 'kseen', (key, 'ta')))
+    elif key[-1] in VOWELS and key[-2] in VOWELS:
+        # Long vowel or diphthong, no gradation: espoo, vantaa, kallio
+        illative = key + 'seen' if key[-1] == key[-2] else key + key[-1] + 'n'
+        stems.append((key, key, illative, (key, 'ta')))
+    elif key[-1] in VOWELS:
+        stems.append((weak_grade(key), key, key + key[-1] + 'n', (key, 'a')))
+        if key[-1] == 'i':
+            # Old e-stems: niemi -> niemen, lahti -> lahden
+            e_stem = key[:-1] + 'e'
+            stems.append((weak_grade(e_stem), e_stem, e_stem + 'en', (e_stem, 'a')))
+
+    forms = []
+    for vowel in harmony_vowels(name):
+        for weak, strong, illative, (partitive_stem, partitive) in stems:
+            forms += [weak + ending.replace('a', vowel) for ending in WEAK_ENDINGS]
+            forms += [strong + ending.replace('a', vowel) for ending in STRONG_ENDINGS]
+            forms += [illative, partitive_stem + partitive.replace('a', vowel)]
+    return list(dict.fromkeys(form for form in forms if form != key))
+
+
+def surface_forms(hmanames, alternate_names=None):
+    """Returns all normalized forms of all names of the gazetteer with the feature they point
+    to: base names first, then alternate names, then the generated Finnish inflected forms of
+    base names, then those of alternate names. When forms collide the earlier one wins, so a
+    name is never shadowed by another feature's alternate or inflected form, and an inflected
+    base name (vantaan of Vantaa) wins over an inflected alternate name of another feature
+    (Vantaa of Vantaanjoki). Returns a dataframe with columns key, feature and parts (number
+    of words of the name the form comes from).
+
+    Parameters:
+
+    hmanames| GeoPandas dataframe of the gazetteer
+    alternate_names| Pandas dataframe from read_alternate_names, optional
+    """
+    names = surface_names(hmanames, alternate_names)
+    names['key'] = names['name'].map(normalize_name)
+    names['parts'] = names['name'].astype(str).map(lambda name: len(name.replace('-', ' ').split()))
+
+    # Inflected forms of the Finnish names (base names and Finnish or untagged alternate names)
+    finnish = names[names['lang'].isna() | (names['lang'] == 'fi')]
+    inflected = pd.DataFrame({'feature': finnish['feature'].to_numpy(),
+                              'key': finnish['name'].map(inflected_forms).to_numpy(),
+                              'parts': finnish['parts'].to_numpy(),
+                              'priority': finnish['priority'].to_numpy() + 2}).explode('key')
+
+    forms = pd.concat([names[['feature', 'key', 'parts', 'priority']], inflected.dropna(subset=['key'])],
+                      ignore_index=True)
+    forms = forms[forms['key'].str.len() > 0]
+    forms = forms.sort_values(['priority', 'feature'], kind='stable').drop_duplicates('key')
+    return forms[['key', 'feature', 'parts']].reset_index(drop=True)
+
+
+def write_artifact(path, hmanames, forms, source=''):
+    """Writes a compiled gazetteer: a header followed by 8-byte aligned arrays that
+    gazetteer.CompiledGazetteer memory maps.
+
+    Parameters:
+
+    path| String: path of the artifact eg. 'hmagazetteer.gaz'
+    hmanames| GeoPandas dataframe of the gazetteer in the output coordinate system
+    forms| Pandas dataframe from surface_forms
+    source| String: description of the source data stored in the header
+    """
+    key_hashes = np.fromiter((name_hash(key) for key in forms['key']), dtype=np.uint64, count=len(forms))
+    order = np.argsort(key_hashes, kind='stable')
+    if (np.diff(key_hashes[order]) == 0).any():
+        raise ValueError('Name hash collision in the gazetteer, the artifact can not be built')
+
+    prefixes = {key[:end] for key in forms['key'] for end in range(1, len(key) + 1)}
+    prefix_hashes = np.unique(np.fromiter((name_hash(prefix) for prefix in prefixes),
+                                          dtype=np.uint64, count=len(prefixes)))
+
+    names = [name.encode('utf-8') for name in hmanames['name'].astype(str)]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in names], out=name_offsets[1:])
+
+    arrays = {'key_hashes': key_hashes[order],
+              'key_features': forms['feature'].to_numpy(dtype=np.int32)[order],
+              'prefix_hashes': prefix_hashes,
+              'x': hmanames.geometry.x.to_numpy(dtype=np.float64),
+              'y': hmanames.geometry.y.to_numpy(dtype=np.float64),
+              'name_offsets': name_offsets,
+              'name_bytes': np.frombuffer(b''.join(names), dtype=np.uint8)}
+
+    # Longest run of lemmas one name, base or alternate, can be split into, as in GazetteerIndex
+    max_parts = int(forms['parts'].max()) + 1 if len(forms) else 2
+    header = {'version': ARTIFACT_VERSION, 'crs': hmanames.crs.to_string(), 'features': len(hmanames),
+              'forms': len(forms), 'max_parts': max_parts, 'source': source,
+              'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'arrays': {}}
+
+    # Offsets depend on the header length, which depends on the offsets: reserve room for them
+    header_length = len(json.dumps(header)) + 64 * len(arrays) + 256
+    offset = len(ARTIFACT_MAGIC) + 8 + header_length
+    for name, array in arrays.items():
+        offset += -offset % 8
+        header['arrays'][name] = [offset, array.dtype.str, len(array)]
+        offset += array.nbytes
+    encoded = json.dumps(header).encode('utf-8').ljust(header_length)
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(ARTIFACT_MAGIC)
+        f.write(np.array([ARTIFACT_VERSION, header_length], dtype='<u4').tobytes())
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.write(b'\x00' * (header['arrays'][name][0] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def compile_gazetteer(source, output, area_path=None, alternate_names_path=None):
+    """Builds a compiled gazetteer artifact from a GeoNames country file (limited to the study
+    area) or from an existing gazetteer file such as hmagazetteer.shp. Returns the gazetteer.
+
+    Parameters:
+
+    source| String: GeoNames file (.txt) or gazetteer file readable by GeoPandas
+    output| String: path of the artifact eg. 'hmagazetteer.gaz'
+    area_path| String: polygons of the study area, needed with a GeoNames file
+    alternate_names_path| String, optional: GeoNames alternateNamesV2.txt for language tagged alternate names
+    """
+    start_time = time.time()
+    if source.endswith('.txt'):
+        hmanames = read_geonames(source, area_path)
+    else:
+        hmanames = gpd.read_file(source).to_crs(epsg=3067)
+        hmanames['name'] = hmanames['name'].str.lower()
+
+    alternate_names = None
+    if alternate_names_path is not None:
+        alternate_names = read_alternate_names(alternate_names_path, hmanames['geonameid'])
+
+    forms = surface_forms(hmanames, alternate_names)
+    write_artifact(output, hmanames, forms, os.path.basename(source))
+
+    print('--- Compiled %s features with %s name forms into %s in %s seconds ---'
+          % (len(hmanames), len(forms), output, round(time.time() - start_time, 2)))
+    return hmanames
+
+
+if __name__ == '__main__':
+
+    # eg. python gazetteer_compiler.py hmagazetteer.shp hmagazetteer.gaz
+    # or python gazetteer_compiler.py data/FI.txt hmagazetteer.gaz data/PKS_postinumeroalueet_2020.shp [alternateNamesV2.txt]
+    compile_gazetteer(*sys.argv[1:])
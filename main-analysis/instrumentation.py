@@ -0,0 +1,311 @@
+# Import required packages
+import os
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+import contextlib
+from pipeline_settings import METRICS_PATH, PROFILE_DIR
+
+# The resource module is only on Unix, psutil (if installed) gives the peak on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Metrics of the pipeline steps. Each step of a chunk (load, split by language, lemmatize,
+# match, geocode, parse_points, write) is wrapped in step(), which appends one JSON line per
+# step to the metrics file: wall and CPU seconds, rows in and out, peak RSS and the errors
+# counted during the step. Steps can be nested, eg. parse_points inside the geocode stage.
+
+# Id of the run, shared with the worker processes through the environment
+RUN_ID = os.environ.setdefault('SPORTS_TWEETS_RUN_ID', uuid.uuid4().hex[:12])
+
+# Interval of the sampling profiler in seconds
+SAMPLE_INTERVAL = 0.005
+
+# Chunk being measured in this process and the steps open in it
+ACTIVE = {'path': None, 'chunk': None, 'steps': []}
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process in MB since the last reset_peak_rss,
+    or None where it can not be measured."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is not None:
+        # ru_maxrss is in kB on Linux and in bytes on macOS, and can not be reset
+        scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    try:
+        import psutil
+    except ImportError:
+        return None
+    # Peak working set of the process on Windows
+    memory = psutil.Process().memory_info()
+    return getattr(memory, 'peak_wset', memory.rss) / 1024 ** 2
+
+
+def larger_peak(*peaks):
+    """Returns the largest of peak RSS values that are not None, None if all are."""
+    peaks = [peak for peak in peaks if peak is not None]
+    return max(peaks) if peaks else None
+
+
+def reset_peak_rss():
+    """Resets the peak RSS of this process to the current RSS where Linux allows it. Elsewhere
+    the peak of a step is the peak of the process so far."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def write_metrics(record, path=None):
+    """Appends one record to the JSON-lines metrics file. Each record is written with a
+    single append so that lines of parallel workers do not mix.
+
+    Parameters:
+
+    record| dict: metrics of a step
+    path| String, optional: metrics file, the file of the active chunk by default
+    """
+    path = path or ACTIVE['path']
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def chunk_metrics(chunk, path=METRICS_PATH):
+    """Makes the steps run inside the block record their metrics for chunk.
+
+    Parameters:
+
+    chunk| String: name of the chunk eg. its file name
+    path| String: JSON-lines file of the metrics, nothing is written when empty
+    """
+    previous = dict(ACTIVE)
+    ACTIVE.update(path=path, chunk=chunk, steps=[])
+    try:
+        yield
+    finally:
+        ACTIVE.update(previous)
+
+
+@contextlib.contextmanager
+def step(name, rows_in=None, **fields):
+    """Measures one step of the active chunk. Yields the record of the step, the block sets
+    record['rows_out'] (and rows_in if it was not known at the start). An exception raised in
+    the block is counted as an error of the step, written and raised again.
+
+    Parameters:
+
+    name| String: name of the step eg. 'geocode'
+    rows_in| int, optional: number of rows the step gets
+    fields| extra fields of the record eg. lang='fi'
+    """
+    steps = ACTIVE['steps']
+    record = {'run': RUN_ID, 'pid': os.getpid(), 'chunk': ACTIVE['chunk'], 'step': name,
+              'parent': steps[-1]['step'] if steps else None, 'rows_in': rows_in, 'rows_out': None}
+    record.update(fields)
+    record['errors'] = {}
+
+    # The enclosing step keeps the peak reached so far, then the peak is reset for this step
+    if steps:
+        steps[-1]['peak_rss_mb'] = larger_peak(steps[-1]['peak_rss_mb'], peak_rss())
+    reset_peak_rss()
+    record['peak_rss_mb'] = None
+    steps.append(record)
+
+    start, cpu_start = time.perf_counter(), time.process_time()
+    record['started'] = time.time()
+    try:
+        yield record
+    except Exception as e:
+        record['errors'][type(e).__name__] = record['errors'].get(type(e).__name__, 0) + 1
+        record['exception'] = repr(e)
+        raise
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record['cpu_seconds'] = time.process_time() - cpu_start
+        record['peak_rss_mb'] = larger_peak(record['peak_rss_mb'], peak_rss())
+        steps.pop()
+        if steps:
+            steps[-1]['peak_rss_mb'] = larger_peak(steps[-1]['peak_rss_mb'], record['peak_rss_mb'])
+        if ACTIVE['chunk'] is not None:
+            write_metrics(record)
+
+
+def count_error(kind, count=1):
+    """Counts errors that were handled and skipped, eg. tweets without lemmas, in the
+    innermost open step. Does nothing outside a step.
+
+    Parameters:
+
+    kind| String: kind of the error eg. 'no_lemmas'
+    count| int: number of errors
+    """
+    if ACTIVE['steps'] and count:
+        errors = ACTIVE['steps'][-1]['errors']
+        errors[kind] = errors.get(kind, 0) + int(count)
+
+
+def record_step(**fields):
+    """Adds fields to the record of the innermost open step, eg. the dedup ratio of the
+    lemmatize step. Does nothing outside a step.
+
+    Parameters:
+
+    fields| fields of the record eg. dedup={...}
+    """
+    if ACTIVE['steps']:
+        ACTIVE['steps'][-1].update(fields)
+
+
+class StackSampler:
+    """Sampling profiler of one thread. A background thread records the stack of the thread
+    every interval seconds, and the counts are written in the collapsed stack format of
+    flamegraph.pl, speedscope and py-spy (py-spy record --format raw).
+
+    Parameters:
+
+    interval| float: seconds between samples
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = {}
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%s)' % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump(self, path):
+        """Writes the sampled stacks to path, one 'stack count' line per distinct stack."""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write('%s %s\n' % (stack, count))
+
+
+@contextlib.contextmanager
+def profiled(chunk, mode='cprofile', profile_dir=PROFILE_DIR):
+    """Profiles the block and writes the profile of chunk to profile_dir. Mode 'cprofile'
+    writes a pstats file (for pstats, snakeviz or gprof2dot) and the 30 slowest functions as
+    text, mode 'sample' writes sampled stacks in the collapsed format, see StackSampler.
+    External samplers can also be attached with py-spy record --pid to the printed pid.
+
+    Parameters:
+
+    chunk| String: name of the chunk, used in the file names
+    mode| String: 'cprofile', 'sample' or None to not profile
+    profile_dir| String: directory of the profiles
+    """
+    if not mode:
+        yield
+        return
+
+    os.makedirs(profile_dir, exist_ok=True)
+    name = os.path.join(profile_dir, os.path.splitext(os.path.basename(chunk))[0])
+    print('Profiling %s in process %s (%s)' % (chunk, os.getpid(), mode))
+    profiler = cProfile.Profile() if mode == 'cprofile' else StackSampler()
+    if mode == 'cprofile':
+        profiler.enable()
+    else:
+        profiler.start()
+    try:
+        yield
+    finally:
+        if mode == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(name + '.prof')
+            with open(name + '.txt', 'w', encoding='utf-8') as f:
+                pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(30)
+            print('Profile written to ' + name + '.prof')
+        else:
+            profiler.stop()
+            profiler.dump(name + '.collapsed')
+            print('Profile written to ' + name + '.collapsed')
+
+
+def read_metrics(path=METRICS_PATH, run=None):
+    """Returns the records of a metrics file, of one run or of all runs.
+
+    Parameters:
+
+    path| String: JSON-lines metrics file
+    run| String, optional: id of the run, the last run of the file when 'last'
+    """
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if run == 'last' and records:
+        run = records[-1]['run']
+    return [record for record in records if run is None or record['run'] == run]
+
+
+def summarize_metrics(records):
+    """Prints the time, rows, peak RSS and errors of each step summed over the chunks,
+    slowest step first. Returns the summary as a dict of step -> totals.
+
+    Parameters:
+
+    records| list of dicts from read_metrics
+    """
+    summary = {}
+    for record in records:
+        key = record['step'] if record['parent'] is None else record['parent'] + '/' + record['step']
+        totals = summary.setdefault(key, {'chunks': set(), 'seconds': 0.0, 'cpu_seconds': 0.0, 'rows_in': 0,
+                                          'rows_out': 0, 'peak_rss_mb': None, 'errors': {}})
+        totals['chunks'].add(record['chunk'])
+        totals['seconds'] += record['seconds']
+        totals['cpu_seconds'] += record['cpu_seconds']
+        totals['rows_in'] += record['rows_in'] or 0
+        totals['rows_out'] += record['rows_out'] or 0
+        totals['peak_rss_mb'] = larger_peak(totals['peak_rss_mb'], record['peak_rss_mb'])
+        for kind, count in record['errors'].items():
+            totals['errors'][kind] = totals['errors'].get(kind, 0) + count
+
+    print('%-28s %7s %10s %10s %12s %12s %9s  %s' % ('step', 'chunks', 'seconds', 'cpu', 'rows in', 'rows out',
+                                                    'peak MB', 'errors'))
+    for key, totals in sorted(summary.items(), key=lambda item: -item[1]['seconds']):
+        totals['chunks'] = len(totals['chunks'])
+        peak = '-' if totals['peak_rss_mb'] is None else '%.0f' % totals['peak_rss_mb']
+        print('%-28s %7s %10.1f %10.1f %12s %12s %9s  %s'
+              % (key, totals['chunks'], totals['seconds'], totals['cpu_seconds'], totals['rows_in'],
+                 totals['rows_out'], peak,
+                 ', '.join('%s %s' % item for item in sorted(totals['errors'].items())) or '-'))
+    return summary
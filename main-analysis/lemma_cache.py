@@ -0,0 +1,192 @@
+# Import required packages
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import unicodedata
+from collections import OrderedDict
+
+# Location and limits of the cache, can be set from the environment
+CACHE_PATH = os.environ.get('SPORTS_TWEETS_LEMMA_CACHE', 'lemma_cache.sqlite')
+MEMORY_ENTRIES = int(os.environ.get('SPORTS_TWEETS_LEMMA_CACHE_ENTRIES', 200000))
+MAX_DISK_BYTES = int(os.environ.get('SPORTS_TWEETS_LEMMA_CACHE_BYTES', 2 * 1024 ** 3))
+
+
+def normalize_text(text):
+    """Returns the text in the form used for the cache key: unicode NFC with whitespace collapsed.
+
+    Parameters:
+
+    text| String: tweet text
+    """
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def cache_key(lang, package_name, text, processors=''):
+    """Returns the cache key of a text: language, Stanza package, processors of the pipeline
+    and hash of the normalized text. Pipelines with other processors (eg. with pos) can give
+    other lemmas, so they do not share entries.
+
+    Parameters:
+
+    lang| String: language of the text eg. 'fi'
+    package_name| String: Stanza package used for the language eg. 'tdt'
+    text| String: tweet text
+    processors| String: processors of the pipeline eg. 'lemma,tokenize', see lemmatization.pipeline_processors
+    """
+    digest = hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+    return lang + ':' + package_name + ':' + processors + ':' + digest
+
+
+class LemmaCache:
+    """Two tier cache of lemma lists keyed by cache_key: an in-memory LRU in front of a
+    SQLite file that is shared between runs, chunks and worker processes. The SQLite
+    tier is kept under max_bytes by evicting the least recently used entries. The size of
+    the tier is kept in the one-row table lemma_bytes by triggers, so that checking it does
+    not scan the entries.
+
+    Parameters:
+
+    path| String: path of the SQLite file, None keeps only the memory tier
+    memory_entries| int: number of entries kept in the memory tier
+    max_bytes| int: size limit of the lemma data on disk
+    """
+
+    def __init__(self, path=CACHE_PATH, memory_entries=MEMORY_ENTRIES, max_bytes=MAX_DISK_BYTES):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        self.con = None
+
+        if path is not None:
+            self.con = sqlite3.connect(path, timeout=60)
+            self.con.execute('PRAGMA journal_mode=WAL')
+            # The total is counted once from a cache made before lemma_bytes, in the same
+            # transaction that adds the triggers
+            self.con.executescript("""
+                BEGIN IMMEDIATE;
+                CREATE TABLE IF NOT EXISTS lemmas
+                    (key TEXT PRIMARY KEY, lemmas TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS lemmas_used ON lemmas (used);
+                CREATE TABLE IF NOT EXISTS lemma_bytes (total INTEGER NOT NULL);
+                INSERT INTO lemma_bytes SELECT COALESCE(SUM(size), 0) FROM lemmas
+                    WHERE NOT EXISTS (SELECT 1 FROM lemma_bytes);
+                CREATE TRIGGER IF NOT EXISTS lemmas_inserted AFTER INSERT ON lemmas
+                    BEGIN UPDATE lemma_bytes SET total = total + NEW.size; END;
+                CREATE TRIGGER IF NOT EXISTS lemmas_deleted AFTER DELETE ON lemmas
+                    BEGIN UPDATE lemma_bytes SET total = total - OLD.size; END;
+                CREATE TRIGGER IF NOT EXISTS lemmas_resized AFTER UPDATE OF size ON lemmas
+                    BEGIN UPDATE lemma_bytes SET total = total + NEW.size - OLD.size; END;
+                COMMIT;
+            """)
+
+    def remember(self, key, lemmas):
+        """Adds an entry to the memory tier and drops the least recently used ones over the limit."""
+        self.memory[key] = lemmas
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get_many(self, keys):
+        """Returns a dict of key -> lemma list for the keys found in either tier.
+
+        Parameters:
+
+        keys| list of strings: cache keys to look up
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                found[key] = self.memory[key]
+                self.stats['memory_hits'] += 1
+            else:
+                missing.append(key)
+
+        if self.con is not None and missing:
+            now = time.time()
+            # Query in slices to stay under the SQLite variable limit
+            for start in range(0, len(missing), 900):
+                part = missing[start:start + 900]
+                marks = ','.join('?' * len(part))
+                rows = self.con.execute('SELECT key, lemmas FROM lemmas WHERE key IN (%s)' % marks, part).fetchall()
+                for key, lemmas in rows:
+                    found[key] = json.loads(lemmas)
+                    self.remember(key, found[key])
+                self.con.execute('UPDATE lemmas SET used = ? WHERE key IN (%s)' % marks, [now] + part)
+                self.stats['disk_hits'] += len(rows)
+            self.con.commit()
+
+        self.stats['misses'] += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries):
+        """Stores lemma lists in both tiers and evicts old entries if the disk tier is full.
+
+        Parameters:
+
+        entries| dict: cache key -> lemma list
+        """
+        for key, lemmas in entries.items():
+            self.remember(key, lemmas)
+
+        if self.con is not None and entries:
+            now = time.time()
+            rows = []
+            for key, lemmas in entries.items():
+                data = json.dumps(lemmas, ensure_ascii=False)
+                rows.append((key, data, len(data.encode('utf-8')), now))
+            # An upsert, as the delete of INSERT OR REPLACE does not fire the delete trigger
+            self.con.executemany('INSERT INTO lemmas VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                                 'lemmas = excluded.lemmas, size = excluded.size, used = excluded.used', rows)
+            self.con.commit()
+            self.evict()
+
+    def disk_bytes(self):
+        """Returns the size of the lemma data stored on disk."""
+        return self.con.execute('SELECT total FROM lemma_bytes').fetchone()[0]
+
+    def evict(self):
+        """Deletes least recently used entries from the disk tier until it is under max_bytes."""
+        excess = self.disk_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+
+        removed = 0
+        keys = []
+        for key, size in self.con.execute('SELECT key, size FROM lemmas ORDER BY used'):
+            keys.append((key,))
+            removed += size
+            if removed >= excess:
+                break
+        self.con.executemany('DELETE FROM lemmas WHERE key = ?', keys)
+        self.con.commit()
+        print('Lemma cache evicted %s entries' % len(keys))
+
+    def reset_stats(self):
+        """Sets the hit and miss counters to zero, eg. at the start of a chunk."""
+        for name in self.stats:
+            self.stats[name] = 0
+
+    def report(self, label=''):
+        """Prints the hit and miss counts since the last reset_stats.
+
+        Parameters:
+
+        label| String: name of the chunk or run the counts belong to
+        """
+        total = sum(self.stats.values())
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        rate = round(100 * hits / total, 1) if total else 0.0
+        print('--- Lemma cache %s: %s memory hits, %s disk hits, %s misses (%s %% hit rate) ---'
+              % (label, self.stats['memory_hits'], self.stats['disk_hits'], self.stats['misses'], rate))
+
+    def close(self):
+        """Closes the SQLite connection."""
+        if self.con is not None:
+            self.con.close()
+            self.con = None
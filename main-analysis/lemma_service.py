@@ -0,0 +1,316 @@
+# Import required packages
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import hashlib
+import threading
+import socketserver
+from lemmatization import lemmatize_texts, DOC_BATCH_SIZE
+from pipeline_settings import PIPELINE_PACKAGES
+
+# Unix socket of the lemmatisation service
+SOCKET_PATH = os.environ.get('SPORTS_TWEETS_LEMMA_SOCKET', os.path.join(os.path.expanduser('~'), '.sports_tweets_lemmas.sock'))
+
+# Directory of the downloaded Stanza models, as in Stanza
+MODEL_DIR = os.environ.get('STANZA_RESOURCES_DIR', os.path.join(os.path.expanduser('~'), 'stanza_resources'))
+
+# Stanza processors the pipelines are built with
+PROCESSORS = ['tokenize', 'lemma']
+
+# Seconds a client waits for the service to answer one request
+TIMEOUT = float(os.environ.get('SPORTS_TWEETS_LEMMA_TIMEOUT', 600))
+
+# Whether the platform has Unix sockets for the service
+UNIX_SOCKETS = hasattr(socket, 'AF_UNIX')
+
+
+def file_md5(path, block_size=1 << 20):
+    """Returns the MD5 of a file, the checksum Stanza lists for its models."""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_files(lang, package_name, model_dir=MODEL_DIR):
+    """Returns (path, md5) of every model file a pipeline of the language needs according to the
+    resources.json of the model directory, or None if the directory has no resources.json.
+
+    Parameters:
+
+    lang| String: language eg. 'fi'
+    package_name| String: Stanza package eg. 'tdt'
+    model_dir| String: directory of the Stanza models
+    """
+    path = os.path.join(model_dir, 'resources.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        resources = json.load(f)
+
+    files = []
+    todo = [(processor, package_name) for processor in PROCESSORS]
+    while todo:
+        processor, package = todo.pop()
+        entry = resources.get(lang, {}).get(processor, {}).get(package)
+        if entry is None:
+            return None
+        files.append((os.path.join(model_dir, lang, processor, package + '.pt'), entry.get('md5')))
+        todo += [(dependency['model'], dependency['package']) for dependency in entry.get('dependencies', [])]
+    return files
+
+
+def model_ready(lang, package_name, model_dir=MODEL_DIR):
+    """Tells if the models of a pipeline are downloaded and match their checksums. Files that
+    were verified before are not read again as long as their size and time are unchanged.
+
+    Parameters:
+
+    lang| String: language eg. 'fi'
+    package_name| String: Stanza package eg. 'tdt'
+    model_dir| String: directory of the Stanza models
+    """
+    files = model_files(lang, package_name, model_dir)
+    if files is None:
+        return False
+
+    verified_path = os.path.join(model_dir, '.verified.json')
+    verified = {}
+    if os.path.exists(verified_path):
+        with open(verified_path) as f:
+            verified = json.load(f)
+
+    changed = False
+    for path, md5 in files:
+        if not os.path.exists(path):
+            return False
+        stamp = [os.path.getsize(path), os.path.getmtime(path), md5]
+        if verified.get(path) != stamp:
+            if md5 is not None and file_md5(path) != md5:
+                return False
+            verified[path] = stamp
+            changed = True
+
+    # Workers starting together may all get here, so each writes its own temporary file
+    if changed:
+        tmp_path = '%s.tmp.%s' % (verified_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(verified, f)
+        os.replace(tmp_path, verified_path)
+    return True
+
+
+def download_models(packages=PIPELINE_PACKAGES, model_dir=MODEL_DIR):
+    """Downloads the Stanza models of the given languages, skipping the ones with a verified
+    local copy.
+
+    Parameters:
+
+    packages| dict: language -> Stanza package eg. {'fi': 'tdt'}
+    model_dir| String: directory of the Stanza models
+    """
+    for lang, package_name in packages.items():
+        if model_ready(lang, package_name, model_dir):
+            print('Stanza models for ' + lang + ' already downloaded')
+            continue
+        import stanza
+        stanza.download(lang, model_dir=model_dir, package=package_name, processors=','.join(PROCESSORS))
+
+
+def send_message(sock, message):
+    """Sends a JSON message prefixed with its length."""
+    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+
+def receive_message(sock):
+    """Receives a JSON message sent with send_message, None if the connection closed."""
+    header = receive_bytes(sock, 4)
+    if header is None:
+        return None
+    data = receive_bytes(sock, struct.unpack('>I', header)[0])
+    return json.loads(data.decode('utf-8'))
+
+
+def receive_bytes(sock, count):
+    """Receives exactly count bytes, None if the connection closed first."""
+    chunks = []
+    while count > 0:
+        chunk = sock.recv(min(count, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        count -= len(chunk)
+    return b''.join(chunks)
+
+
+class LemmaRequestHandler(socketserver.BaseRequestHandler):
+    """Answers the requests of one client connection: {'lang': ..., 'texts': [...]} is answered
+    with {'lemmas': [...]}, {'ping': true} with the languages the service has loaded."""
+
+    def handle(self):
+        while True:
+            request = receive_message(self.request)
+            if request is None:
+                return
+            try:
+                send_message(self.request, self.server.answer(request))
+            except Exception as error:
+                send_message(self.request, {'error': repr(error)})
+
+
+# The service listens on a Unix socket, which Windows does not have. There the pipelines are
+# always loaded in the process, see service_pipeline.
+if UNIX_SOCKETS:
+
+    class LemmaServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """Lemmatisation service that keeps one Stanza pipeline per language loaded. Requests of
+        different languages run in parallel, requests of one language one at a time.
+
+        Parameters:
+
+        socket_path| String: path of the Unix socket
+        pipelines| dict: language -> Stanza Pipeline
+        batch_size| int: number of texts sent to a pipeline in one call
+        """
+        daemon_threads = True
+
+        def __init__(self, socket_path, pipelines, batch_size=DOC_BATCH_SIZE):
+            self.pipelines = pipelines
+            self.locks = {lang: threading.Lock() for lang in pipelines}
+            self.batch_size = batch_size
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            socketserver.UnixStreamServer.__init__(self, socket_path, LemmaRequestHandler)
+
+        def answer(self, request):
+            """Returns the answer to one request."""
+            if request.get('ping'):
+                return {'langs': sorted(self.pipelines)}
+            lang = request['lang']
+            if lang not in self.pipelines:
+                return {'error': 'language ' + str(lang) + ' is not loaded'}
+            with self.locks[lang]:
+                start_time = time.time()
+                lemmas = lemmatize_texts(request['texts'], self.pipelines[lang], self.batch_size)
+            print('Lemmatised %s %s texts in %s seconds' % (len(lemmas), lang, round(time.time() - start_time, 2)))
+            return {'lemmas': lemmas}
+
+
+def serve(packages=PIPELINE_PACKAGES, socket_path=SOCKET_PATH, batch_size=DOC_BATCH_SIZE):
+    """Downloads the missing models, loads one pipeline per language and answers requests until
+    interrupted.
+
+    Parameters:
+
+    packages| dict: language -> Stanza package eg. {'fi': 'tdt'}
+    socket_path| String: path of the Unix socket
+    batch_size| int: number of texts sent to a pipeline in one call
+    """
+    if not UNIX_SOCKETS:
+        raise OSError('The lemmatisation service needs Unix sockets, which this platform does not have')
+    import stanza
+    os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+    download_models(packages)
+    pipelines = {lang: stanza.Pipeline(lang, processors=','.join(PROCESSORS), package=package_name,
+                                       download_method=None)
+                 for lang, package_name in packages.items()}
+
+    server = LemmaServer(socket_path, pipelines, batch_size)
+    print('Lemmatisation service for ' + ', '.join(sorted(pipelines)) + ' listening on ' + socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+class LemmaClient:
+    """Connection to the lemmatisation service.
+
+    Parameters:
+
+    socket_path| String: path of the Unix socket
+    timeout| float: seconds to wait for an answer
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout=TIMEOUT):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+
+    def request(self, message):
+        """Sends one request and returns the answer, raises RuntimeError on errors of the service."""
+        send_message(self.sock, message)
+        answer = receive_message(self.sock)
+        if answer is None:
+            raise RuntimeError('Lemmatisation service closed the connection')
+        if 'error' in answer:
+            raise RuntimeError('Lemmatisation service: ' + answer['error'])
+        return answer
+
+    def langs(self):
+        """Returns the languages the service has loaded."""
+        return self.request({'ping': True})['langs']
+
+    def lemmatize(self, lang, texts):
+        """Returns the lemmas of each text as a list, in the order of texts."""
+        return self.request({'lang': lang, 'texts': list(texts)})['lemmas']
+
+    def close(self):
+        self.sock.close()
+
+
+class RemotePipeline:
+    """Stand-in for the Stanza pipeline of one language that sends the texts to the service.
+    lemmatization.lemmatize_texts uses it like a pipeline.
+
+    Parameters:
+
+    lang| String: language eg. 'fi'
+    client| LemmaClient: connection to the service
+    """
+
+    def __init__(self, lang, client):
+        self.lang = lang
+        self.client = client
+        # The service builds its pipelines with these, see lemmatization.pipeline_processors
+        self.processors = PROCESSORS
+
+    def lemmatize(self, texts):
+        return self.client.lemmatize(self.lang, texts)
+
+
+def service_pipeline(lang, package_name, create_pipeline, socket_path=SOCKET_PATH):
+    """Returns a RemotePipeline if the service is running and has the language loaded,
+    otherwise a pipeline in this process made with create_pipeline(lang, package_name).
+
+    Parameters:
+
+    lang| String: language eg. 'fi'
+    package_name| String: Stanza package eg. 'tdt'
+    create_pipeline| function creating an in-process pipeline
+    socket_path| String: path of the Unix socket
+    """
+    if UNIX_SOCKETS and os.path.exists(socket_path):
+        try:
+            client = LemmaClient(socket_path)
+            if lang in client.langs():
+                print('Using the lemmatisation service for language: ' + lang)
+                return RemotePipeline(lang, client)
+            client.close()
+        except (OSError, RuntimeError) as error:
+            print('Lemmatisation service not available (' + str(error) + '), loading the pipeline')
+    download_models({lang: package_name})
+    return create_pipeline(lang, package_name)
+
+
+if __name__ == '__main__':
+
+    # Start the service eg. python lemma_service.py, or python lemma_service.py fi en for some languages only
+    langs = sys.argv[1:] or list(PIPELINE_PACKAGES)
+    serve({lang: PIPELINE_PACKAGES[lang] for lang in langs})
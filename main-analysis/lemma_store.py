@@ -0,0 +1,119 @@
+# Import required packages
+import itertools
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Type of the lemmas column: a list of dictionary encoded lemmas per tweet. The values are
+# int32 ids into the dictionary of the distinct lemmas of the chunk, stored flat with int32
+# offsets per tweet
+LEMMA_TYPE = pa.list_(pa.dictionary(pa.int32(), pa.string()))
+
+
+def encode_lemmas(lemma_lists):
+    """Encodes lists of lemmas into one Arrow list array of dictionary encoded lemmas: a flat
+    int32 id array, int32 offsets and the distinct lemmas of these lists only, so the size of
+    the array (and of its checkpoints and pickles) follows the chunk. None stays a null row.
+
+    Parameters:
+
+    lemma_lists| list of lists of strings (or None)
+    """
+    missing = np.fromiter((lemmas is None for lemmas in lemma_lists), dtype=bool, count=len(lemma_lists))
+    lengths = np.fromiter((len(lemmas) if lemmas is not None else 0 for lemmas in lemma_lists),
+                          dtype=np.int64, count=len(lemma_lists))
+    offsets = np.zeros(len(lemma_lists) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+
+    flat = list(itertools.chain.from_iterable(lemmas for lemmas in lemma_lists if lemmas is not None))
+    values = pa.array(flat, type=pa.string()).dictionary_encode()
+    return pa.ListArray.from_arrays(pa.array(offsets), values, mask=pa.array(missing) if missing.any() else None)
+
+
+def lemma_series(lemma_lists, index=None):
+    """Returns lists of lemmas as a compact pandas Series (Arrow backed, see LEMMA_TYPE).
+
+    Parameters:
+
+    lemma_lists| list of lists of strings (or None)
+    index| Pandas index of the series
+    """
+    return pd.Series(pd.arrays.ArrowExtensionArray(encode_lemmas(lemma_lists)), index=index)
+
+
+def arrow_lemmas(lemmas):
+    """Returns the Arrow (chunked) array behind a Series in the compact form."""
+    return lemmas.array.__arrow_array__()
+
+
+def is_lemma_series(lemmas):
+    """Tells if a Series already holds lemmas in the compact form."""
+    return isinstance(lemmas.dtype, pd.ArrowDtype) and lemmas.dtype.pyarrow_dtype == LEMMA_TYPE
+
+
+def as_lemma_series(lemmas):
+    """Returns the lemmas in the compact form, encoding a Series of Python lists if needed."""
+    if is_lemma_series(lemmas):
+        return lemmas
+    lemma_lists = [value if isinstance(value, list) else None for value in lemmas.tolist()]
+    return lemma_series(lemma_lists, index=lemmas.index)
+
+
+def lemma_chunks(lemmas):
+    """Yields the flat form of the lemmas in pieces that share one dictionary: the row position
+    of each token, the int32 id of each token, the dictionary (Arrow string array) and a mask
+    of the rows of the piece that have no lemmas.
+
+    Parameters:
+
+    lemmas| Pandas Series in the compact form
+    """
+    start = 0
+    for chunk in arrow_lemmas(lemmas).chunks:
+        flat = pc.list_flatten(chunk)
+        rows = pc.list_parent_indices(chunk).to_numpy().astype(np.int64) + start
+        ids = flat.indices.to_numpy(zero_copy_only=False)
+        missing = chunk.is_null().to_numpy(zero_copy_only=False)
+        yield rows, ids, flat.dictionary, missing
+        start += len(chunk)
+
+
+def lemma_lists(lemmas):
+    """Returns the lemmas as Python lists (None for rows without lemmas)."""
+    if is_lemma_series(lemmas):
+        return arrow_lemmas(lemmas).to_pylist()
+    return [value if isinstance(value, list) else None for value in lemmas.tolist()]
+
+
+def lemma_text(lemmas):
+    """Returns the lemmas of each row joined with spaces, produced on demand from the compact form.
+
+    Parameters:
+
+    lemmas| Pandas Series of lemmas
+    """
+    lemmas = as_lemma_series(lemmas)
+    text = pc.binary_join(pc.cast(arrow_lemmas(lemmas), pa.list_(pa.string())), ' ')
+    return pd.Series(text.to_pylist(), index=lemmas.index, dtype=object)
+
+
+def memory_report(lemma_lists, lang=''):
+    """Prints the memory of a lemmas column as Python lists plus joined lemma_text (the earlier
+    layout) and in the compact form, and returns both in bytes.
+
+    Parameters:
+
+    lemma_lists| list of lists of strings (or None)
+    lang| String: language of the lemmas
+    """
+    before = pd.DataFrame({'lemmas': pd.Series(lemma_lists, dtype=object),
+                           'lemma_text': pd.Series([' '.join(lemmas) if lemmas is not None else None
+                                                    for lemmas in lemma_lists], dtype=object)})
+    before_bytes = int(before.memory_usage(deep=True, index=False).sum())
+    # Ids, offsets and the dictionary, lemma_text is no longer stored
+    after_bytes = int(arrow_lemmas(lemma_series(lemma_lists)).nbytes)
+
+    print('--- Lemmas of %s %s tweets: %s MB as lists and lemma_text, %s MB compact ---'
+          % (len(lemma_lists), lang, round(before_bytes / 1e6, 1), round(after_bytes / 1e6, 1)))
+    return before_bytes, after_bytes
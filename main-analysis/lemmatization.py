@@ -0,0 +1,181 @@
+# Import required packages
+import time
+import numpy as np
+from lemma_cache import cache_key
+from lemma_store import lemma_series
+
+# Number of tweets handed to the Stanza pipeline in one call
+DOC_BATCH_SIZE = 1000
+
+# Internal batch sizes of the Stanza processors
+TOKENIZE_BATCH_SIZE = 256
+LEMMA_BATCH_SIZE = 3000
+
+
+def unwrap_pipeline(nlp_lang):
+    """Returns the plain Stanza pipeline behind nlp_lang. Pipelines wrapped with
+    spacy_stanza keep the Stanza pipeline in the tokenizer.
+
+    Parameters:
+
+    nlp_lang| Stanza Pipeline or spacy_stanza language
+    """
+    tokenizer = getattr(nlp_lang, 'tokenizer', None)
+    return getattr(tokenizer, 'snlp', nlp_lang)
+
+
+def pipeline_processors(nlp_lang):
+    """Returns the processors of a pipeline as a sorted comma separated string, '' if the
+    pipeline does not tell them.
+
+    Parameters:
+
+    nlp_lang| Stanza Pipeline, spacy_stanza language or lemma_service.RemotePipeline
+    """
+    processors = getattr(unwrap_pipeline(nlp_lang), 'processors', None) or []
+    return ','.join(sorted(str(name).strip() for name in processors))
+
+
+def length_buckets(texts, batch_size=DOC_BATCH_SIZE):
+    """Yields arrays of positions into texts, batch_size positions at a time, ordered
+    by text length so that each batch holds tweets of similar length.
+
+    Parameters:
+
+    texts| list of strings: texts to split into batches
+    batch_size| int: number of texts in one batch
+    """
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    order = np.argsort(lengths, kind='stable')
+
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+def doc_lemmas(doc):
+    """Returns the lemmas of a Stanza document as a list, one lemma per token.
+
+    Parameters:
+
+    doc| Stanza Document: processed document
+    """
+    lemmas = []
+    for sentence in doc.sentences:
+        for token in sentence.tokens:
+            lemma = token.words[0].lemma
+            # Stanza leaves the lemma empty for some symbols, keep the token itself
+            lemmas.append(lemma if lemma is not None else token.text)
+    return lemmas
+
+
+def lemmatize_texts(texts, nlp_lang, batch_size=DOC_BATCH_SIZE):
+    """Lemmatises a list of texts as bulk input in length-bucketed batches. Returns a
+    list of lemma lists in the same order as texts.
+
+    Parameters:
+
+    texts| list of strings: texts to lemmatise
+    nlp_lang| Stanza Pipeline for the language of the texts, or a lemma_service.RemotePipeline
+    batch_size| int: number of texts sent to the pipeline in one call
+    """
+    nlp = unwrap_pipeline(nlp_lang)
+    # Texts for the lemmatisation service are sent as they are, it batches them itself
+    if hasattr(nlp, 'lemmatize'):
+        return [lemmas for start in range(0, len(texts), 10 * batch_size)
+                for lemmas in nlp.lemmatize(texts[start:start + 10 * batch_size])]
+
+    # Stanza (and torch) are only loaded when something is lemmatised in this process
+    import stanza
+    results = [None] * len(texts)
+
+    for positions in length_buckets(texts, batch_size):
+        docs = nlp([stanza.Document([], text=texts[p]) for p in positions])
+        for p, doc in zip(positions, docs):
+            results[p] = doc_lemmas(doc)
+
+    return results
+
+
+def report_throughput(lang, tweet_count, seconds):
+    """Prints how many tweets per second were lemmatised for a language.
+
+    Parameters:
+
+    lang| String: language of the tweets
+    tweet_count| int: number of lemmatised tweets
+    seconds| float: time the lemmatisation took
+    """
+    rate = tweet_count / seconds if seconds > 0 else float('inf')
+    print('--- Lemmatising %s %s tweets took %s seconds (%s tweets/s) ---'
+          % (tweet_count, lang, round(seconds, 2), round(rate, 1)))
+
+
+def lemmatize_cached(texts, nlp_lang, cache, lang, package_name, batch_size=DOC_BATCH_SIZE):
+    """Lemmatises a list of texts through a LemmaCache: texts already in the cache and
+    repeated texts are not sent to Stanza. Returns a list of lemma lists in the same
+    order as texts.
+
+    Parameters:
+
+    texts| list of strings: texts to lemmatise
+    nlp_lang| Stanza Pipeline for the language of the texts
+    cache| LemmaCache: cache shared between chunks and runs
+    lang| String: language of the texts, part of the cache key
+    package_name| String: Stanza package of the pipeline, part of the cache key (as are its processors)
+    batch_size| int: number of texts sent to the pipeline in one call
+    """
+    processors = pipeline_processors(nlp_lang)
+    keys = [cache_key(lang, package_name, text, processors) for text in texts]
+    found = cache.get_many(list(dict.fromkeys(keys)))
+
+    # Lemmatise one copy of each text that was not in the cache
+    todo = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in todo:
+            todo[key] = text
+    if todo:
+        new = dict(zip(todo.keys(), lemmatize_texts(list(todo.values()), nlp_lang, batch_size)))
+        cache.put_many(new)
+        found.update(new)
+
+    return [found[key] for key in keys]
+
+
+def create_lemmas_batched(df, nlp_lang, lang=None, batch_size=DOC_BATCH_SIZE, cache=None, package_name=''):
+    """Lemmatises text in dataframe column 'full_text' in batches. Returns a copy of the
+    dataframe with an additional field lemmas, the lemmas of each tweet as ids into a
+    dictionary of the distinct lemmas of the chunk (see lemma_store.py). Rows without text
+    get no lemmas. The text of the lemmas is produced on demand with lemma_store.lemma_text.
+
+    Parameters:
+
+    df| Pandas dataframe to lemmatize, all tweets in the same language
+    nlp_lang| Stanza Pipeline for the language corresponding to the dataframe
+    lang| String, optional: language name used in the throughput report
+    batch_size| int: number of tweets sent to the pipeline in one call
+    cache| LemmaCache, optional: cache consulted before running Stanza
+    package_name| String: Stanza package of the pipeline, part of the cache key
+    """
+    start_time = time.time()
+    df = df.copy()
+
+    if lang is None:
+        lang = getattr(unwrap_pipeline(nlp_lang), 'lang', '')
+
+    texts = df['full_text'].tolist()
+    valid = [i for i, text in enumerate(texts) if isinstance(text, str)]
+
+    lemma_lists = [None] * len(texts)
+    if valid:
+        if cache is None:
+            results = lemmatize_texts([texts[i] for i in valid], nlp_lang, batch_size)
+        else:
+            results = lemmatize_cached([texts[i] for i in valid], nlp_lang, cache, lang, package_name, batch_size)
+        for i, lemmas in zip(valid, results):
+            lemma_lists[i] = lemmas
+
+    # Store the lemmas as compact columnar ids instead of Python lists
+    df['lemmas'] = lemma_series(lemma_lists, index=df.index)
+
+    report_throughput(lang, len(valid), time.time() - start_time)
+    return df
@@ -0,0 +1,306 @@
+# Import required packages
+import os
+import glob
+import json
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Maps of the sports tweets. A map with one marker per tweet does not work beyond some tens
+# of thousands of tweets, so the tweets are counted into grid cells for each zoom level
+# beforehand and written as a static pyramid of small JSON tiles with a Leaflet page that
+# draws the cells of the visible tiles. The page has to be opened through a web server
+# (eg. python -m http.server in the map directory), browsers do not fetch tiles from file://.
+
+# Directory of the maps
+MAP_DIR = 'data/outputs'
+
+# Zoom levels of the pyramid, 9 shows the whole metropolitan area and 16 single blocks
+MIN_ZOOM = 9
+MAX_ZOOM = 16
+
+# Size of a tile and of a grid cell in pixels, a cell is the smallest circle drawn
+TILE_SIZE = 256
+CELL_SIZE = 16
+
+# Digits of the cell coordinates in the tiles, about 1 m
+COORDINATE_DIGITS = 5
+
+# Tweets above this number are not drawn as single markers
+MAX_MARKERS = 20000
+
+
+def lonlat(gdf):
+    """Returns the longitudes and latitudes of the points of gdf as two numpy arrays, taken
+    from the geometry array in one call instead of row by row.
+
+    Parameters:
+
+    gdf| GeoDataFrame of points, in EPSG:3067 if it has no crs
+    """
+    geometry = gdf.geometry
+    if geometry.crs is None:
+        geometry = geometry.set_crs('EPSG:3067')
+    coordinates = shapely.get_coordinates(geometry.to_crs('EPSG:4326').values)
+    return coordinates[:, 0], coordinates[:, 1]
+
+
+def mercator_pixels(lon, lat, zoom):
+    """Returns the x and y pixel coordinates of points in the Web Mercator tiling at a zoom level.
+
+    Parameters:
+
+    lon| numpy array of longitudes
+    lat| numpy array of latitudes
+    zoom| int: zoom level
+    """
+    size = TILE_SIZE * 2 ** zoom
+    lat = np.radians(np.clip(lat, -85.0511, 85.0511))
+    x = (lon + 180) / 360 * size
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * size
+    return x, y
+
+
+def aggregate_cells(lon, lat, codes, category_count, zoom, cell_size=CELL_SIZE):
+    """Counts points into the grid cells of a zoom level. Returns a dataframe with one row per
+    non-empty cell: the tile of the cell, the mean position of its points, the number of
+    points and the number of points of each category (columns c0, c1, ...).
+
+    Parameters:
+
+    lon| numpy array of longitudes
+    lat| numpy array of latitudes
+    codes| numpy array of category codes from 0 to category_count - 1
+    category_count| int: number of categories
+    zoom| int: zoom level
+    cell_size| int: size of a cell in pixels
+    """
+    x, y = mercator_pixels(lon, lat, zoom)
+    cells_per_row = TILE_SIZE * 2 ** zoom // cell_size
+    cell_x = (x // cell_size).astype(np.int64)
+    cell_y = (y // cell_size).astype(np.int64)
+
+    cells, inverse = np.unique(cell_x * cells_per_row + cell_y, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(cells))
+    by_category = np.bincount(inverse * category_count + codes,
+                              minlength=len(cells) * category_count).reshape(len(cells), category_count)
+
+    result = pd.DataFrame({'tile_x': (cells // cells_per_row) * cell_size // TILE_SIZE,
+                           'tile_y': (cells % cells_per_row) * cell_size // TILE_SIZE,
+                           'lon': np.bincount(inverse, weights=lon, minlength=len(cells)) / counts,
+                           'lat': np.bincount(inverse, weights=lat, minlength=len(cells)) / counts,
+                           'count': counts})
+    for code in range(category_count):
+        result['c' + str(code)] = by_category[:, code]
+    return result
+
+
+def write_tile_pyramid(gdf, output_dir, category=None, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, cell_size=CELL_SIZE):
+    """Writes the points of gdf as pre-aggregated density tiles {zoom}/{x}/{y}.json for each
+    zoom level, with metadata.json and an index.html page that shows them. Each tile lists
+    its non-empty cells as [lon, lat, count, count of each category]. Returns the metadata.
+
+    Parameters:
+
+    gdf| GeoDataFrame of points, eg. the output of the main analysis
+    output_dir| String: directory of the map
+    category| String, optional: column of the category of each point eg. 'sport'
+    min_zoom| int: first zoom level
+    max_zoom| int: last zoom level, closer zooms scale its tiles
+    cell_size| int: size of a cell in pixels
+    """
+    gdf = gdf[~(gdf.geometry.isna() | gdf.geometry.is_empty)]
+    lon, lat = lonlat(gdf)
+    if category is None:
+        codes, categories = np.zeros(len(gdf), dtype=np.int64), ['tweets']
+    else:
+        codes, categories = pd.factorize(gdf[category].astype(str), sort=True)
+        categories = categories.tolist()
+
+    tile_count = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        cells = aggregate_cells(lon, lat, codes, len(categories), zoom, cell_size)
+        cells[['lon', 'lat']] = cells[['lon', 'lat']].round(COORDINATE_DIGITS)
+        values = cells[['lon', 'lat', 'count'] + ['c' + str(code) for code in range(len(categories))]].to_numpy()
+
+        # Sort the cells by tile so that the cells of a tile are next to each other
+        tiles = cells['tile_x'].to_numpy() * 2 ** zoom + cells['tile_y'].to_numpy()
+        order = np.argsort(tiles, kind='stable')
+        cells, values, tiles = cells.iloc[order], values[order], tiles[order]
+        starts = np.flatnonzero(np.r_[True, tiles[1:] != tiles[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(tiles)]):
+            directory = os.path.join(output_dir, str(zoom), str(cells['tile_x'].iat[start]))
+            os.makedirs(directory, exist_ok=True)
+            rows = [[row[0], row[1]] + [int(value) for value in row[2:]] for row in values[start:end].tolist()]
+            with open(os.path.join(directory, str(cells['tile_y'].iat[start]) + '.json'), 'w') as f:
+                json.dump(rows, f, separators=(',', ':'))
+        tile_count += len(starts)
+
+    metadata = {'min_zoom': min_zoom, 'max_zoom': max_zoom, 'cell_size': cell_size, 'categories': categories,
+                'points': int(len(gdf)), 'tiles': tile_count,
+                'bounds': [float(lon.min()), float(lat.min()), float(lon.max()), float(lat.max())] if len(gdf) else None}
+    with open(os.path.join(output_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=1)
+    with open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(VIEWER_HTML.replace('{{metadata}}', json.dumps(metadata)))
+
+    print('--- %s tweets written to %s as %s tiles on zoom levels %s-%s ---'
+          % (len(gdf), output_dir, tile_count, min_zoom, max_zoom))
+    return metadata
+
+
+def write_density_layer(gdf, path, zoom=13, category=None, cell_size=CELL_SIZE):
+    """Writes the cells of one zoom level as a single GeoJSON point layer with the counts, a
+    light layer for folium, QGIS or a web map.
+
+    Parameters:
+
+    gdf| GeoDataFrame of points
+    path| String: GeoJSON file
+    zoom| int: zoom level of the cells
+    category| String, optional: column of the category of each point
+    cell_size| int: size of a cell in pixels
+    """
+    gdf = gdf[~(gdf.geometry.isna() | gdf.geometry.is_empty)]
+    lon, lat = lonlat(gdf)
+    if category is None:
+        codes, categories = np.zeros(len(gdf), dtype=np.int64), ['tweets']
+    else:
+        codes, categories = pd.factorize(gdf[category].astype(str), sort=True)
+    cells = aggregate_cells(lon, lat, codes, len(categories), zoom, cell_size)
+    cells = cells.rename(columns={'c' + str(code): str(name) for code, name in enumerate(categories)})
+
+    layer = gpd.GeoDataFrame(cells.drop(columns=['tile_x', 'tile_y', 'lon', 'lat']),
+                             geometry=gpd.points_from_xy(cells['lon'], cells['lat']), crs='EPSG:4326')
+    layer.to_file(path, driver='GeoJSON')
+    print('--- %s tweets written to %s as %s cells ---' % (len(gdf), path, len(layer)))
+    return layer
+
+
+def make_interactive_map(sportshma, filename, mode='tiles', category=None, output_dir=MAP_DIR):
+    """
+    Produces a map of the tweets and saves it to data/outputs/ folder. Mode 'tiles' writes a
+    pre-aggregated tile pyramid to data/outputs/filename/ (see write_tile_pyramid), mode
+    'markers' a folium map with one clustered marker per tweet, for small sets of tweets.
+
+    Parameters:
+
+    sportshma | Geopandas dataframe containing the geocoded tweets
+    filename | String : Filename that you want to give to the output map (.html added to folium maps)
+    mode | String : 'tiles' or 'markers'
+    category | String, optional : column to colour the tiles by eg. 'sport'
+    output_dir | String : directory of the maps
+    """
+    if mode == 'tiles':
+        return write_tile_pyramid(sportshma, os.path.join(output_dir, filename), category)
+
+    if len(sportshma) > MAX_MARKERS:
+        raise ValueError('%s tweets are too many for single markers, use mode tiles' % len(sportshma))
+
+    import folium
+    from folium.plugins import FastMarkerCluster
+
+    # Create a Map instance
+    m = folium.Map(location=[60.25, 24.8], tiles='cartodbpositron', zoom_start=11, control_scale=True)
+
+    # Coordinates and tooltips of all tweets as one list, clustered in the browser
+    lon, lat = lonlat(sportshma)
+    texts = sportshma['full_text'].astype(str).tolist()
+    callback = ('function (row) { var marker = L.marker(new L.LatLng(row[0], row[1]));'
+                ' marker.bindTooltip(row[2]); return marker; };')
+    FastMarkerCluster(list(zip(lat.tolist(), lon.tolist(), texts)), callback=callback).add_to(m)
+
+    # Save to output folder
+    os.makedirs(output_dir, exist_ok=True)
+    m.save(os.path.join(output_dir, filename + '.html'))
+    print('Interactive map saved to ' + os.path.join(output_dir, filename + '.html'))
+    return m
+
+
+def read_output(path):
+    """Reads the output of the main analysis, a GeoPackage file or a directory of GeoParquet parts.
+
+    Parameters:
+
+    path| String: output file or directory
+    """
+    if os.path.isdir(path):
+        return gpd.GeoDataFrame(pd.concat([gpd.read_parquet(part) for part in sorted(glob.glob(os.path.join(path, '*.parquet')))],
+                                          ignore_index=True))
+    if path.endswith('.parquet'):
+        return gpd.read_parquet(path)
+    return gpd.read_file(path)
+
+
+# Leaflet page of a tile pyramid, draws each cell as a circle with an area by its count and
+# the colour of its most common category
+VIEWER_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Sports tweets</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html, body, #map {height: 100%; margin: 0} .legend {background: white; padding: 6px; font: 12px sans-serif}</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var metadata = {{metadata}};
+var colours = ['#1b9e77', '#d95f02', '#7570b3', '#e7298a', '#66a61e', '#e6ab02', '#a6761d', '#666666'];
+var shown = metadata.categories.map(function () { return true; });
+var map = L.map('map').setView([60.25, 24.8], 11);
+L.tileLayer('https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png',
+            {attribution: '&copy; OpenStreetMap contributors &copy; CARTO'}).addTo(map);
+
+var Density = L.GridLayer.extend({
+  createTile: function (coords, done) {
+    var tile = document.createElement('canvas');
+    var size = this.getTileSize();
+    tile.width = size.x;
+    tile.height = size.y;
+    if (coords.z < metadata.min_zoom) { setTimeout(function () { done(null, tile); }, 0); return tile; }
+    var origin = coords.scaleBy(size);
+    fetch(coords.z + '/' + coords.x + '/' + coords.y + '.json')
+      .then(function (response) { return response.ok ? response.json() : []; })
+      .catch(function () { return []; })
+      .then(function (cells) {
+        var context = tile.getContext('2d');
+        cells.forEach(function (cell) {
+          var count = 0, best = -1, bestCount = 0;
+          for (var i = 0; i < metadata.categories.length; i++) {
+            if (!shown[i]) { continue; }
+            count += cell[3 + i];
+            if (cell[3 + i] > bestCount) { best = i; bestCount = cell[3 + i]; }
+          }
+          if (count === 0) { return; }
+          var point = map.project([cell[1], cell[0]], coords.z).subtract(origin);
+          context.beginPath();
+          context.arc(point.x, point.y, Math.min(2 + 2 * Math.sqrt(count), metadata.cell_size * 2), 0, 2 * Math.PI);
+          context.fillStyle = colours[best % colours.length];
+          context.globalAlpha = 0.6;
+          context.fill();
+        });
+        done(null, tile);
+      });
+    return tile;
+  }
+});
+var density = new Density({maxNativeZoom: metadata.max_zoom, minZoom: metadata.min_zoom}).addTo(map);
+
+var legend = L.control({position: 'topright'});
+legend.onAdd = function () {
+  var div = L.DomUtil.create('div', 'legend');
+  metadata.categories.forEach(function (name, i) {
+    var label = L.DomUtil.create('label', '', div);
+    label.innerHTML = '<input type="checkbox" checked> <span style="color:' + colours[i % colours.length] + '">&#9679;</span> ' + name + '<br>';
+    label.firstChild.onchange = function () { shown[i] = this.checked; density.redraw(); };
+  });
+  return div;
+};
+legend.addTo(map);
+</script>
+</body>
+</html>
+'''
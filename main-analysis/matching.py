@@ -0,0 +1,74 @@
+# Import required packages
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from lemma_store import as_lemma_series, lemma_chunks
+from instrumentation import count_error
+
+
+def match_keywords(lemmas, keyword_list):
+    """Matches the lemmas of each row against a keyword list in one pass over the flat
+    lemma ids. The keyword set is tested once against each dictionary and the result is
+    looked up by id, so no lemma strings are compared per token. Returns a boolean numpy
+    array telling which rows matched, a list of the matched keywords of each row (None for
+    rows without a match) and the number of rows that had no lemmas.
+
+    Parameters:
+
+    lemmas| Pandas Series of lemmas, compact (see lemma_store.py) or a list per row
+    keyword_list| list of strings: keywords to search for
+    """
+    lemmas = as_lemma_series(lemmas)
+    keywords = pa.array(list(dict.fromkeys(keyword_list)), type=pa.string())
+
+    mask = np.zeros(len(lemmas), dtype=bool)
+    matched = [None] * len(lemmas)
+    skipped = 0
+
+    for rows, ids, dictionary, missing in lemma_chunks(lemmas):
+        skipped += int(missing.sum())
+        # Which ids of this dictionary are keywords
+        is_keyword = pc.is_in(dictionary, value_set=keywords).to_numpy(zero_copy_only=False)
+        hit = is_keyword[ids]
+        hit_rows = rows[hit]
+        hit_ids = ids[hit]
+        mask[hit_rows] = True
+
+        # Only the matched keywords are turned back into strings
+        words = {lemma_id: dictionary[lemma_id].as_py() for lemma_id in np.unique(hit_ids).tolist()}
+        for row, lemma_id in zip(hit_rows.tolist(), hit_ids.tolist()):
+            if matched[row] is None:
+                matched[row] = []
+            if words[lemma_id] not in matched[row]:
+                matched[row].append(words[lemma_id])
+
+    return mask, matched, skipped
+
+
+def get_sports_tweets(df, keyword_list):
+    """
+    Searches for matches to sports-related keywords from a dataframe that has been lemmatised.
+    Returns the matching rows with the found keywords in column matched_keywords. Rows
+    without lemmas (eg. tweets without text) are counted and skipped.
+
+    Parameters:
+
+    df | String: name of Pandas dataframe with lemmatized tweets
+    keyword_list | list of strings: list of sports-related words to search from the tweets
+    """
+    if len(df) == 0:
+        print('0 tweets found with sports related keywords')
+        return df.assign(matched_keywords=pd.Series(dtype=object))
+
+    mask, matched, skipped = match_keywords(df['lemmas'], keyword_list)
+    if skipped > 0:
+        print('Skipped %s tweets without lemmas' % skipped)
+        count_error('no_lemmas', skipped)
+
+    sports_df = df[mask].copy()
+    sports_df['matched_keywords'] = pd.Series([matched[row] for row in np.flatnonzero(mask)],
+                                              index=sports_df.index, dtype=object)
+
+    print(str(len(sports_df)) + ' tweets found with sports related keywords')
+    return sports_df
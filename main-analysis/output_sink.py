@@ -0,0 +1,122 @@
+# Import required packages
+import os
+import glob
+import pandas as pd
+import geopandas as gpd
+from lemma_store import lemma_text
+from pipeline_settings import OUTPUT_PATH
+
+OUTPUT_LAYER = 'sports_tweets'
+OUTPUT_CRS = 'EPSG:3067'
+
+# Columns and types of the output, every chunk is written with exactly these
+OUTPUT_COLUMNS = {'lang': 'object',
+                  'full_text': 'object',
+                  'lemma_text': 'object',
+                  'matched_keywords': 'object',
+                  'toponym': 'object',
+                  'toponyms': 'object',
+                  'geoparsed': 'int32',
+                  'confidence': 'float64',
+                  'facility': 'object',
+                  'facility_type': 'object',
+                  'facility_distance': 'float64',
+                  'lat': 'float64',
+                  'lon': 'float64'}
+
+
+def to_output_schema(df, crs=OUTPUT_CRS):
+    """Returns df as a GeoDataFrame with the output columns and types: list columns are joined
+    into text, lemma_text is made from the lemmas, missing columns are added empty and other
+    columns are dropped. geoparsed is 1 for tweets located from their text and 0 for geotagged
+    tweets.
+
+    Parameters:
+
+    df| Pandas dataframe of sports tweets of one chunk, with a geometry column
+    crs| String: coordinate reference system of the output
+    """
+    df = pd.DataFrame(df)
+    out = pd.DataFrame(index=df.index)
+
+    for column, dtype in OUTPUT_COLUMNS.items():
+        if column == 'geoparsed':
+            values = df['toponym'].notna() if 'toponym' in df.columns else pd.Series(False, index=df.index)
+        elif column == 'lemma_text' and column not in df.columns and 'lemmas' in df.columns:
+            # The lemma text is not kept in memory, it is made from the lemma ids when written
+            values = lemma_text(df['lemmas'])
+        elif column in df.columns:
+            values = df[column]
+            # Lists can not be stored in GeoPackage or Shapefile columns
+            values = values.map(lambda value: ','.join(value) if isinstance(value, list) else value)
+        else:
+            values = pd.Series(None, index=df.index, dtype=object)
+        if dtype == 'object':
+            out[column] = values.astype(object).where(values.notna(), None)
+        else:
+            out[column] = values.astype(dtype)
+
+    geometry = df['geometry'] if 'geometry' in df.columns else gpd.GeoSeries([None] * len(df), index=df.index)
+    gdf = gpd.GeoDataFrame(out, geometry=gpd.GeoSeries(geometry, index=df.index, crs=getattr(geometry, 'crs', None) or crs))
+    return gdf.to_crs(crs)
+
+
+class OutputSink:
+    """Writes the sports tweets chunk by chunk, so that only one chunk is in memory at a time.
+    A GeoPackage layer is appended to; a path ending in .parquet becomes a directory of
+    GeoParquet parts, one per chunk. All chunks share the schema in OUTPUT_COLUMNS and the CRS.
+
+    Parameters:
+
+    path| String: output GeoPackage file or GeoParquet directory
+    layer| String: name of the GeoPackage layer
+    append| bool: add to an existing output instead of replacing it
+    crs| String: coordinate reference system of the output
+    """
+
+    def __init__(self, path=OUTPUT_PATH, layer=OUTPUT_LAYER, append=False, crs=OUTPUT_CRS):
+        self.path = path
+        self.layer = layer
+        self.crs = crs
+        self.parquet = path.endswith('.parquet')
+        self.rows = 0
+
+        if self.parquet:
+            os.makedirs(path, exist_ok=True)
+            existing = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+            if not append:
+                for part in existing:
+                    os.remove(part)
+                existing = []
+            self.parts = len(existing)
+            self.started = True
+        else:
+            if not append and os.path.exists(path):
+                os.remove(path)
+            self.started = append and os.path.exists(path)
+
+    def write(self, df):
+        """Appends the tweets of one chunk to the output.
+
+        Parameters:
+
+        df| Pandas dataframe of sports tweets with a geometry column
+        """
+        if len(df) == 0:
+            return
+        gdf = to_output_schema(df, self.crs)
+
+        if self.parquet:
+            self.parts += 1
+            gdf.to_parquet(os.path.join(self.path, 'part-%05d.parquet' % self.parts), index=False)
+        else:
+            gdf.to_file(self.path, layer=self.layer, driver='GPKG', mode='a' if self.started else 'w')
+            self.started = True
+        self.rows += len(gdf)
+
+    def close(self):
+        """Prints a summary of the written output."""
+        if self.rows > 0:
+            print('--- %s tweets written to %s ---' % (self.rows, self.path))
+        else:
+            print('--- Final dataframe is empty ---')
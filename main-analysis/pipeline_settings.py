@@ -0,0 +1,64 @@
+# Import required packages
+import os
+
+# Settings of the tweet pipeline that can be changed from the environment. They are kept in
+# this module without other imports, so that the command line and dry runs can read them
+# without loading pandas or the NLP stack. The modules that use them import them from here.
+
+# Input files of the chunk loop: csv chunks or Parquet parts written by Get_tweets.get_data_parquet
+CHUNK_PATTERN = os.environ.get('SPORTS_TWEETS_INPUT', 'chunk*')
+
+# Add the results to the existing output instead of replacing it, used for incremental (delta) runs
+APPEND_OUTPUT = os.environ.get('SPORTS_TWEETS_APPEND', '0') == '1'
+
+# Output of the chunk loop, a GeoPackage file or a directory of GeoParquet parts (ending in .parquet)
+OUTPUT_PATH = os.environ.get('SPORTS_TWEETS_OUTPUT', 'finaloutput.gpkg')
+
+# Directory of the manifest entries and per-chunk stage outputs
+CHECKPOINT_DIR = os.environ.get('SPORTS_TWEETS_CHECKPOINTS', 'checkpoints')
+
+# Stanza packages used for each language
+PIPELINE_PACKAGES = {'en': 'ewt', 'fi': 'tdt', 'sv': 'talbanken'}
+
+# Languages of the analysis, the extraction (pre-processing/Get_tweets.py) only fetches tweets in these
+LANGUAGES = sorted(PIPELINE_PACKAGES)
+
+# Bounding box of the study area in EPSG:3067 (minx,miny,maxx,maxy) used to filter geotagged tweets in
+# the extraction. When empty, the bounds of the boundary that parse_points uses are taken
+STUDY_BBOX = tuple(float(value) for value in os.environ.get('SPORTS_TWEETS_STUDY_BBOX', '').split(',') if value)
+
+# Pre-filtering can be switched off from the environment eg. to lemmatise everything for other uses
+PREFILTER = os.environ.get('SPORTS_TWEETS_PREFILTER', '1') != '0'
+
+# Collapsing duplicates can be switched off from the environment
+DEDUP = os.environ.get('SPORTS_TWEETS_DEDUP', '1') != '0'
+
+# Near-duplicates are only collapsed when asked for: templated posts that differ in one word
+# (eg. the place of a run) end up in the same group and share the lemmas of one of them
+NEAR_DUPLICATES = os.environ.get('SPORTS_TWEETS_NEAR_DUPLICATES', '0') == '1'
+
+# Gazetteer used by the chunk loop, a shapefile or an artifact built with gazetteer_compiler.py
+GAZETTEER_PATH = os.environ.get('SPORTS_TWEETS_GAZETTEER', 'hmagazetteer.shp')
+
+# Fuzzy matching of toponyms can be switched off from the environment
+FUZZY = os.environ.get('SPORTS_TWEETS_FUZZY', '1') != '0'
+
+# Fuzzy matches below this confidence are not used
+MIN_CONFIDENCE = float(os.environ.get('SPORTS_TWEETS_FUZZY_MIN_CONFIDENCE', '0.85'))
+
+# JSON-lines file of the per-step metrics of each chunk, nothing is written when set empty
+METRICS_PATH = os.environ.get('SPORTS_TWEETS_METRICS', 'metrics.jsonl')
+
+# Chunks to profile, comma separated file names or numbers of the chunks (1 is the first), and how
+PROFILE_CHUNKS = [chunk for chunk in os.environ.get('SPORTS_TWEETS_PROFILE', '').split(',') if chunk]
+PROFILE_MODE = os.environ.get('SPORTS_TWEETS_PROFILE_MODE', 'cprofile')
+
+# Directory of the profiles
+PROFILE_DIR = os.environ.get('SPORTS_TWEETS_PROFILE_DIR', 'profiles')
+
+# LIPAS sports facility layer (eg. lipas.shp from pre-processing/Get_lipas_data.ipynb). When set,
+# the pipeline attaches the nearest facility to each tweet
+LIPAS_PATH = os.environ.get('SPORTS_TWEETS_LIPAS', '')
+
+# Facilities further than this from a tweet (metres) are not attached, 0 for no limit
+FACILITY_RADIUS = float(os.environ.get('SPORTS_TWEETS_FACILITY_RADIUS', '0'))
@@ -0,0 +1,97 @@
+# Import required packages
+import os
+import time
+import multiprocessing as mp
+
+# Number of worker processes and torch intra-op threads per worker, can be set from the environment
+WORKERS = int(os.environ.get('SPORTS_TWEETS_WORKERS', os.cpu_count() or 1))
+TORCH_THREADS = int(os.environ.get('SPORTS_TWEETS_TORCH_THREADS', 1))
+
+# Resources built once in each worker process, eg. Stanza pipelines and the gazetteer
+WORKER_RESOURCES = {}
+
+
+def init_worker(resources, torch_threads=TORCH_THREADS):
+    """Initializer of a worker process. Limits the torch thread count and builds each
+    resource once so that the tasks of the worker can reuse them.
+
+    Parameters:
+
+    resources| dict: resource name -> (function, tuple of arguments) used to build it,
+    eg. {'nlp_fi': (create_pipeline, ('fi', 'tdt'))}
+    torch_threads| int: number of intra-op threads torch may use in this worker
+    """
+    # To avoid an error
+    os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+    os.environ['OMP_NUM_THREADS'] = str(torch_threads)
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+    for name, (function, args) in resources.items():
+        WORKER_RESOURCES[name] = function(*args)
+
+
+def worker_resource(name):
+    """Returns a resource built by init_worker in the current process.
+
+    Parameters:
+
+    name| String: name of the resource eg. 'nlp_fi'
+    """
+    return WORKER_RESOURCES[name]
+
+
+def run_task(job):
+    """Runs one task in a worker and returns its number, result and duration in seconds.
+
+    Parameters:
+
+    job| tuple: (task_function, task_no, task)
+    """
+    task_function, task_no, task = job
+    start_time = time.time()
+    result = task_function(task, task_no)
+    return task_no, result, time.time() - start_time
+
+
+def run_chunk_pool(tasks, task_function, resources, workers=WORKERS, torch_threads=TORCH_THREADS):
+    """Processes tasks (eg. chunk file names) in a pool of worker processes. Each worker
+    builds the resources once in its initializer and the parent collects the results.
+    Returns a list of the task results in the order of the tasks.
+
+    Parameters:
+
+    tasks| list: tasks given to task_function, one per call
+    task_function| function: module level function taking (task, task_no) and returning a picklable result
+    resources| dict: resource name -> (function, tuple of arguments), see init_worker
+    workers| int: number of worker processes, 1 runs the tasks in this process
+    torch_threads| int: number of torch intra-op threads per worker
+    """
+    tasks = list(tasks)
+    results = [None] * len(tasks)
+    workers = max(1, min(workers, len(tasks)))
+    print('Processing %s tasks with %s workers and %s torch threads each' % (len(tasks), workers, torch_threads))
+
+    jobs = [(task_function, task_no, task) for task_no, task in enumerate(tasks, start=1)]
+
+    if workers == 1:
+        init_worker(resources, torch_threads)
+        pool = None
+        finished = map(run_task, jobs)
+    else:
+        # Spawn instead of fork so that torch is initialised cleanly in each worker
+        pool = mp.get_context('spawn').Pool(workers, initializer=init_worker, initargs=(resources, torch_threads))
+        finished = pool.imap_unordered(run_task, jobs, chunksize=1)
+    try:
+        for done, (task_no, result, seconds) in enumerate(finished, start=1):
+            results[task_no - 1] = result
+            print('Task %s/ %s done in %s minutes (%s finished)' % (task_no, len(tasks), round(seconds / 60, 3), done))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return results
@@ -0,0 +1,177 @@
+# Import required packages
+import re
+import sys
+import pandas as pd
+from lemmatization import create_lemmas_batched
+from matching import match_keywords
+from lemma_store import lemma_text
+
+# Endings stripped from the keywords to get the stems that inflected forms start with
+SUFFIXES = {'fi': ['minen', 'illa', 'illä', 'lla', 'llä', 'sta', 'stä', 'da', 'dä', 'ta', 'tä',
+                   'a', 'ä', 'i', 'u', 'y', 'o', 'ö'],
+            'en': ['ing', 'e', 's'],
+            'sv': ['ning', 'ende', 'ing', 'e', 'a']}
+
+# Shortest stem generated from a keyword, shorter stems match too many unrelated words
+MIN_STEM_LENGTH = {'fi': 4, 'en': 3, 'sv': 4}
+
+# Stems that the suffix rules can not produce eg. irregular forms
+EXTRA_STEMS = {'fi': {'juosta': ['juoks', 'juos'], 'juoksu': ['juoks'], 'juokseminen': ['juoks']},
+               'en': {'run': ['ran']},
+               'sv': {}}
+
+
+def keyword_stems(keyword, lang):
+    """Returns the set of stems of a keyword: the keyword itself, the keyword without its
+    inflectional ending, weak grade variants of the stems (lenkk -> lenk) and the stems
+    listed in EXTRA_STEMS.
+
+    Parameters:
+
+    keyword| String: sports keyword eg. 'lenkkeillä'
+    lang| String: language of the keyword eg. 'fi'
+    """
+    keyword = keyword.lower()
+    stems = {keyword}
+    min_length = MIN_STEM_LENGTH.get(lang, 3)
+
+    for suffix in SUFFIXES.get(lang, []):
+        if keyword.endswith(suffix) and len(keyword) - len(suffix) >= min_length:
+            stems.add(keyword[:-len(suffix)])
+
+    # Consonant gradation and doubled consonants: lenkki -> lenkin, running -> run
+    for stem in list(stems):
+        if len(stem) > min_length and stem[-1] == stem[-2] and stem[-1] not in 'aeiouyäöå':
+            stems.add(stem[:-1])
+
+    stems.update(EXTRA_STEMS.get(lang, {}).get(keyword, []))
+    return stems
+
+
+def trie_pattern(stems):
+    """Returns a regular expression matching any of the stems. The stems are merged into a
+    character trie so that the regex engine walks shared prefixes only once. A stem that
+    is a prefix of another one makes the longer one redundant.
+
+    Parameters:
+
+    stems| iterable of strings: stems to match
+    """
+    trie = {}
+    for stem in stems:
+        node = trie
+        for char in stem:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        if '' in node:
+            return ''
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    return build(trie)
+
+
+def build_prefilter(keyword_list, lang):
+    """Compiles a case insensitive regex that finds words starting with a stem of any of the
+    keywords. Used to select the tweets that can contain a keyword before lemmatising.
+
+    Parameters:
+
+    keyword_list| list of strings: sports keywords of the language
+    lang| String: language of the keywords eg. 'fi'
+    """
+    stems = set()
+    for keyword in keyword_list:
+        stems.update(keyword_stems(keyword, lang))
+    # A stem has to start a word, hashtags included
+    return re.compile(r'(?<!\w)' + trie_pattern(stems), re.IGNORECASE)
+
+
+def candidate_mask(texts, prefilter):
+    """Returns a boolean Series telling which texts contain a word matched by the prefilter.
+
+    Parameters:
+
+    texts| Pandas Series of tweet texts
+    prefilter| compiled regex from build_prefilter
+    """
+    return texts.str.normalize('NFC').str.contains(prefilter, na=False)
+
+
+def filter_candidates(df, prefilter, lang=''):
+    """Returns the rows of df whose 'full_text' can contain a sports keyword.
+
+    Parameters:
+
+    df| Pandas dataframe of tweets in one language
+    prefilter| compiled regex from build_prefilter
+    lang| String: language name used in the printout
+    """
+    candidates = df[candidate_mask(df['full_text'], prefilter)]
+    print('Pre-filter kept %s of %s %s tweets for lemmatisation' % (len(candidates), len(df), lang))
+    return candidates
+
+
+def keyword_hits(df, keyword_list):
+    """Returns the index labels of the rows whose lemmas contain a keyword."""
+    mask, matched, skipped = match_keywords(df['lemmas'], keyword_list)
+    return set(df.index[mask])
+
+
+def verify_prefilter(df, nlp_lang, keyword_list, lang, sample_size=10000, seed=1, cache=None, package_name=''):
+    """Runs a sample of tweets through both the full path (lemmatise everything) and the
+    pre-filtered path (lemmatise candidates only) and reports the keyword matches the
+    pre-filter loses. Returns a dict of the counts and the dataframe of missed tweets.
+
+    Parameters:
+
+    df| Pandas dataframe of tweets in one language
+    nlp_lang| Stanza Pipeline for the language
+    keyword_list| list of strings: sports keywords of the language
+    lang| String: language of the tweets eg. 'fi'
+    sample_size| int: number of tweets to verify with
+    seed| int: random seed of the sample
+    cache| LemmaCache, optional: lemma cache to use in both paths
+    package_name| String: Stanza package of the pipeline, part of the cache key
+    """
+    sample = df.sample(min(sample_size, len(df)), random_state=seed)
+    prefilter = build_prefilter(keyword_list, lang)
+
+    # Full path
+    full = create_lemmas_batched(sample, nlp_lang, lang, cache=cache, package_name=package_name)
+    full_hits = keyword_hits(full, keyword_list)
+
+    # Pre-filtered path
+    candidates = filter_candidates(sample, prefilter, lang)
+    filtered = create_lemmas_batched(candidates, nlp_lang, lang, cache=cache, package_name=package_name)
+    filtered_hits = keyword_hits(filtered, keyword_list)
+
+    missed = full_hits - filtered_hits
+    report = {'lang': lang, 'sample': len(sample), 'candidates': len(candidates),
+              'full_matches': len(full_hits), 'prefilter_matches': len(filtered_hits), 'missed': len(missed),
+              'recall_loss': len(missed) / len(full_hits) if full_hits else 0.0,
+              'volume_reduction': len(sample) / len(candidates) if len(candidates) else float('inf')}
+
+    print('--- Pre-filter %s: %s/%s tweets lemmatised (%sx less), %s of %s matches missed (recall loss %s %%) ---'
+          % (lang, report['candidates'], report['sample'], round(report['volume_reduction'], 1),
+             report['missed'], report['full_matches'], round(100 * report['recall_loss'], 2)))
+    return report, full.loc[sorted(missed)]
+
+
+if __name__ == '__main__':
+
+    # Verify the pre-filter against full lemmatisation on a chunk eg. python prefilter.py chunk1.csv
+    from lemma_service import download_models
+    from pipeline_settings import PIPELINE_PACKAGES
+    from sports_pipeline import create_pipeline, SPORTS_KEYWORDS
+
+    df = pd.read_csv(sys.argv[1], encoding='utf-8', engine='c')
+
+    for lang, keyword_list in SPORTS_KEYWORDS.items():
+        download_models({lang: PIPELINE_PACKAGES[lang]})
+        nlp = create_pipeline(lang, PIPELINE_PACKAGES[lang])
+        report, missed = verify_prefilter(df[df['lang'] == lang], nlp, keyword_list, lang)
+        if len(missed) > 0:
+            print(missed.assign(lemma_text=lemma_text(missed['lemmas']))[['full_text', 'lemma_text']].to_string())
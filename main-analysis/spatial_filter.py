@@ -0,0 +1,101 @@
+# Import required packages
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import requests
+import geojson
+from instrumentation import count_error
+
+# Municipalities of the Helsinki Metropolitan Area and the WFS they are fetched from
+HMA_MUNICIPALITIES = ['Helsinki', 'Espoo', 'Vantaa', 'Kauniainen']
+WFS_URL = 'http://geo.stat.fi/geoserver/tilastointialueet/wfs'
+
+# Boundaries are fetched once and then read from this directory, so runs work offline
+BOUNDARY_CACHE = os.environ.get('SPORTS_TWEETS_BOUNDARY_CACHE', 'boundary_cache')
+
+
+def fetch_layer(layer, year=None):
+    """Fetches a layer of Statistics Finland statistical areas from the WFS as a geodataframe.
+
+    Parameters:
+
+    layer| String: name of the layer eg. 'kunta1000k'
+    year| int, optional: year of the areas, the latest when not given
+    """
+    type_name = 'tilastointialueet:' + layer + ('_' + str(year) if year else '')
+    r = requests.get(WFS_URL, params=dict(service='WFS', version='2.0.0', request='GetFeature',
+                                          typeName=type_name, outputFormat='json'))
+    r.raise_for_status()
+    return gpd.GeoDataFrame.from_features(geojson.loads(r.content), crs='EPSG:3067')
+
+
+def cached_layer(layer='kunta1000k', year=None, cache_dir=BOUNDARY_CACHE):
+    """Returns a statistical area layer from the on-disk cache, fetching and saving it on first use.
+
+    Parameters:
+
+    layer| String: name of the layer eg. 'kunta1000k'
+    year| int, optional: year of the areas, the latest when not given
+    cache_dir| String: directory of the cached layers
+    """
+    path = os.path.join(cache_dir, '%s_%s.gpkg' % (layer, year if year else 'latest'))
+    if os.path.exists(path):
+        return gpd.read_file(path)
+
+    areas = fetch_layer(layer, year)
+    os.makedirs(cache_dir, exist_ok=True)
+    areas.drop(columns=['bbox'], errors='ignore').to_file(path + '.tmp', driver='GPKG')
+    os.replace(path + '.tmp', path)
+    print('Cached ' + layer + ' boundaries to ' + path)
+    return areas
+
+
+def load_boundary(names=HMA_MUNICIPALITIES, layer='kunta1000k', year=None, cache_dir=BOUNDARY_CACHE):
+    """Returns the union of the named municipalities as one prepared polygon in EPSG:3067,
+    ready for repeated point-in-polygon tests.
+
+    Parameters:
+
+    names| list of strings: municipality names (column nimi)
+    layer| String: name of the layer eg. 'kunta1000k'
+    year| int, optional: year of the areas, the latest when not given
+    cache_dir| String: directory of the cached layers
+    """
+    areas = cached_layer(layer, year, cache_dir).to_crs(epsg=3067)
+    boundary = shapely.union_all(areas.loc[areas['nimi'].isin(names)].geometry.values)
+    shapely.prepare(boundary)
+    return boundary
+
+
+def parse_points(sportsgeotagged, boundary=None):
+    """
+    Takes geotagged tweets and parses the coordinates into points. Returns a geodataframe with the tweets which are geotagged inside Helsinki Metropolitan area.
+    The points are built and reprojected as arrays and tested against the prepared study area polygon in one call.
+
+    Parameters:
+
+    sportsgeotagged | String: name of Pandas dataframe with geotagged tweets
+    boundary | prepared shapely polygon from load_boundary, loaded from the cache when not given
+    """
+    if boundary is None:
+        boundary = load_boundary()
+
+    lon = pd.to_numeric(sportsgeotagged['lon'], errors='coerce').to_numpy(dtype=float)
+    lat = pd.to_numeric(sportsgeotagged['lat'], errors='coerce').to_numpy(dtype=float)
+    valid = np.isfinite(lon) & np.isfinite(lat)
+    if (~valid).sum() > 0:
+        print(str((~valid).sum()) + ' geotagged tweets without valid coordinates')
+        count_error('invalid_coordinates', (~valid).sum())
+
+    # Points from the valid coordinates, converted to epsg 3067
+    points = gpd.GeoSeries(gpd.points_from_xy(lon[valid], lat[valid]), crs='EPSG:4326').to_crs(epsg=3067)
+
+    # Keep the tweets that are inside the study area
+    inside = shapely.contains_xy(boundary, points.x.to_numpy(), points.y.to_numpy())
+    gdf = gpd.GeoDataFrame(sportsgeotagged[valid].iloc[inside],
+                           geometry=points.values[inside], crs='EPSG:3067')
+
+    print(str(len(gdf)) + ' geotagged tweets inside the study area')
+    return gdf
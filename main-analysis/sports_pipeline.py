@@ -0,0 +1,423 @@
+# Import required packages
+import os
+import sys
+import glob
+import argparse
+from pipeline_settings import (CHUNK_PATTERN, APPEND_OUTPUT, OUTPUT_PATH, PIPELINE_PACKAGES, PREFILTER, DEDUP,
+                               NEAR_DUPLICATES, GAZETTEER_PATH, FUZZY, MIN_CONFIDENCE, METRICS_PATH, PROFILE_CHUNKS,
+                               PROFILE_MODE, LIPAS_PATH, FACILITY_RADIUS, LANGUAGES)
+from checkpoint import ChunkCheckpoint
+from pool_runner import run_chunk_pool, worker_resource, WORKERS, TORCH_THREADS
+from instrumentation import chunk_metrics, step, profiled, read_metrics, summarize_metrics
+
+# The pipeline of the chunk loop as stages. Each stage runs on the checkpointed output of the
+# stages it comes after and names the worker resources it needs. Libraries are imported inside
+# the stages, so eg. a geocode-only rerun never loads Stanza and the command line starts fast.
+
+# Sports keywords of each language
+SPORTS_KEYWORDS = {'fi': ['juosta', 'juoksu', 'juokseminen', 'lenkkeillä', 'lenkki', 'lenkkeily', 'kävellä', 'kävely',
+                          'käveleminen', 'patikoida', 'patikointi', 'patikoiminen', 'pyöräillä', 'pyörä', 'pyöräily',
+                          'pyöräileminen'],
+                   'en': ['running', 'run', 'walk', 'walking', 'jog', 'jogging', 'hike', 'hiking', 'trek', 'trekking',
+                          'bicycle', 'bike', 'biking', 'cycling'],
+                   'sv': ['gående', 'joggning', 'vandring', 'cykling']}
+
+# Languages in the order their results are combined
+LANGS = LANGUAGES
+
+# Parameters each checkpointed stage depends on, a change reruns the stage and the stages after it
+LEMMA_PARAMS = {'packages': PIPELINE_PACKAGES, 'prefilter': PREFILTER, 'store': 'arrow',
+                'dedup': DEDUP, 'near_duplicates': NEAR_DUPLICATES,
+                'keywords': [SPORTS_KEYWORDS['fi'], SPORTS_KEYWORDS['en'], SPORTS_KEYWORDS['sv']] if PREFILTER else None}
+MATCH_PARAMS = {'lemmas': LEMMA_PARAMS, 'keywords': [SPORTS_KEYWORDS['fi'], SPORTS_KEYWORDS['en'], SPORTS_KEYWORDS['sv']]}
+GEOCODE_PARAMS = {'sports': MATCH_PARAMS, 'gazetteer': GAZETTEER_PATH, 'geotagged': 'hma points',
+                  'fuzzy': FUZZY, 'fuzzy_min_confidence': MIN_CONFIDENCE}
+
+# Stage DAG: stage -> stages it runs after, worker resources it needs and its parameters
+STAGES = {'lemmatize': {'after': [], 'resources': ['nlp_en', 'nlp_fi', 'nlp_sv', 'lemma_cache', 'prefilters'],
+                        'params': LEMMA_PARAMS},
+          'match': {'after': ['lemmatize'], 'resources': [], 'params': MATCH_PARAMS},
+          'geocode': {'after': ['match'], 'resources': ['hmanames', 'hma_boundary'], 'params': GEOCODE_PARAMS}}
+
+# The nearest sports facility of each tweet is attached when a LIPAS layer is given
+FACILITY_PARAMS = {'located': GEOCODE_PARAMS, 'lipas': LIPAS_PATH, 'radius': FACILITY_RADIUS}
+if LIPAS_PATH:
+    STAGES['facilities'] = {'after': ['geocode'], 'resources': ['lipas'], 'params': FACILITY_PARAMS}
+
+# Stage whose output is written to the final output
+FINAL_STAGE = list(STAGES)[-1]
+
+# Stage that writes the output of the final stage of the chunks to the output, run in the main process after the others
+WRITE_STAGE = 'write'
+
+
+def create_pipeline(lang, package_name, tokenize_batch_size=None, lemma_batch_size=None):
+    """Creates a Stanza pipeline for tokenizing and lemmatising a language.
+
+    Parameters:
+
+    lang| String: language of the pipeline eg. 'fi' or 'en'
+    package_name| String: name of the Stanza package eg. 'tdt'
+    tokenize_batch_size| int, optional: batch size of the tokenizer
+    lemma_batch_size| int, optional: batch size of the lemmatizer
+    """
+    import stanza
+    from lemmatization import TOKENIZE_BATCH_SIZE, LEMMA_BATCH_SIZE
+    # To avoid an error
+    os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+    nlp = stanza.Pipeline(lang, processors='tokenize, lemma', package=package_name, download_method=None,
+                          tokenize_batch_size=tokenize_batch_size or TOKENIZE_BATCH_SIZE,
+                          lemma_batch_size=lemma_batch_size or LEMMA_BATCH_SIZE)
+    print('Stanza pipeline created for language: ' + lang)
+    return nlp
+
+
+def nlp_resource(lang):
+    """Returns the lemmatiser of a language for a worker: the running service or a pipeline in the worker."""
+    from lemma_service import service_pipeline
+    return service_pipeline(lang, PIPELINE_PACKAGES[lang], create_pipeline)
+
+
+def lemma_cache_resource():
+    """Returns the lemma cache of a worker."""
+    from lemma_cache import LemmaCache, CACHE_PATH
+    return LemmaCache(CACHE_PATH)
+
+
+def prefilters_resource():
+    """Returns the compiled pre-filter regex of each language."""
+    from prefilter import build_prefilter
+    return {lang: build_prefilter(SPORTS_KEYWORDS[lang], lang) for lang in LANGS}
+
+
+def gazetteer_resource():
+    """Returns the gazetteer index of a worker."""
+    from gazetteer import load_gazetteer_index
+    return load_gazetteer_index(GAZETTEER_PATH)
+
+
+def boundary_resource():
+    """Returns the prepared study area polygon of a worker."""
+    from spatial_filter import load_boundary
+    return load_boundary()
+
+
+def facilities_resource():
+    """Returns the sports facility index of a worker."""
+    from facilities import load_facilities
+    return load_facilities(LIPAS_PATH)
+
+
+# How each worker resource is built, see pool_runner.init_worker
+RESOURCE_BUILDERS = {'nlp_en': (nlp_resource, ('en',)),
+                     'nlp_fi': (nlp_resource, ('fi',)),
+                     'nlp_sv': (nlp_resource, ('sv',)),
+                     'lemma_cache': (lemma_cache_resource, ()),
+                     'prefilters': (prefilters_resource, ()),
+                     'hmanames': (gazetteer_resource, ()),
+                     'hma_boundary': (boundary_resource, ()),
+                     'lipas': (facilities_resource, ())}
+
+
+def lemmatize_language(df, lang, cache, label):
+    """Lemmatises the tweets of one language of a chunk with the worker lemmatiser of the
+    language. Exact duplicates (and near-duplicates if switched on) are collapsed first, one
+    tweet of each group is lemmatised and its lemmas are copied to the others, see dedup.py.
+
+    Parameters:
+
+    df| Pandas dataframe of tweets in one language
+    lang| String: language of the tweets eg. 'fi'
+    cache| LemmaCache: cache of lemmas shared between chunks and runs
+    label| String: name of the chunk used in the printouts
+    """
+    from lemmatization import create_lemmas_batched, DOC_BATCH_SIZE
+    from dedup import apply_deduplicated
+
+    nlp_lang = worker_resource('nlp_' + lang)
+    lemmatize = lambda part: create_lemmas_batched(part, nlp_lang, lang, DOC_BATCH_SIZE, cache, PIPELINE_PACKAGES[lang])
+    with step('lemmatize', len(df), lang=lang) as record:
+        lemmatized = lemmatize(df) if not DEDUP else apply_deduplicated(df, lemmatize, lang, label)
+        record['rows_out'] = len(lemmatized)
+    return lemmatized
+
+
+def lemmatize_stage(df, label):
+    """Pre-filters and lemmatises the Finnish, English and Swedish tweets of a chunk.
+
+    Parameters:
+
+    df| Pandas dataframe of the tweets of a chunk
+    label| String: name of the chunk used in the printouts
+    """
+    import pandas as pd
+    from prefilter import filter_candidates
+
+    cache = worker_resource('lemma_cache')
+    cache.reset_stats()
+    with step('split_lang', len(df)) as record:
+        by_lang = {lang: df[df['lang'] == lang] for lang in LANGS}
+        record['rows_out'] = sum(len(part) for part in by_lang.values())
+
+    parts = []
+    for lang, part in by_lang.items():
+        # Only tweets with a word starting like a sports keyword can match after lemmatisation
+        if PREFILTER:
+            with step('prefilter', len(part), lang=lang) as record:
+                part = filter_candidates(part, worker_resource('prefilters')[lang], lang)
+                record['rows_out'] = len(part)
+        parts.append(lemmatize_language(part, lang, cache, label))
+    cache.report(label)
+    return pd.concat(parts)
+
+
+def match_stage(lemmatized, label):
+    """Returns the tweets of a lemmatised chunk that contain a sports keyword of their language.
+
+    Parameters:
+
+    lemmatized| Pandas dataframe of lemmatised tweets
+    label| String: name of the chunk used in the printouts
+    """
+    import pandas as pd
+    from matching import get_sports_tweets
+
+    return pd.concat([get_sports_tweets(lemmatized[lemmatized['lang'] == lang], SPORTS_KEYWORDS[lang])
+                      for lang in LANGS])
+
+
+def geocode_stage(sports, label):
+    """Geocodes the sports tweets without a geotag from their text and keeps the geotagged ones
+    inside the study area.
+
+    Parameters:
+
+    sports| Pandas dataframe of sports tweets
+    label| String: name of the chunk used in the printouts
+    """
+    import pandas as pd
+    from gazetteer import geocode
+    from spatial_filter import parse_points
+
+    sportstogeocode = sports[sports['geom'].isna()]
+    with step('geocode', len(sportstogeocode)) as record:
+        sportshma = geocode(sportstogeocode, worker_resource('hmanames'))
+        record['rows_out'] = len(sportshma)
+
+    sportsgeotagged = sports[sports['geom'].notna()]
+    with step('parse_points', len(sportsgeotagged)) as record:
+        sportsgeotagged = parse_points(sportsgeotagged, worker_resource('hma_boundary'))
+        record['rows_out'] = len(sportsgeotagged)
+    return pd.concat([sportshma, sportsgeotagged])
+
+
+def facilities_stage(located, label):
+    """Attaches the nearest sports facility, its type and distance to the located tweets of a chunk.
+
+    Parameters:
+
+    located| GeoDataFrame of geocoded and geotagged tweets
+    label| String: name of the chunk used in the printouts
+    """
+    from facilities import nearest_facility
+    return nearest_facility(located, worker_resource('lipas'), FACILITY_RADIUS)
+
+
+STAGE_FUNCTIONS = {'lemmatize': lemmatize_stage, 'match': match_stage, 'geocode': geocode_stage,
+                   'facilities': facilities_stage}
+
+
+def chunk_plan(checkpoint, stages, force=False):
+    """Returns the stages to run for a chunk, in DAG order: the requested stages that are not
+    checkpointed (all requested stages with force), and the unfinished stages they run after.
+
+    Parameters:
+
+    checkpoint| ChunkCheckpoint of the chunk
+    stages| list of strings: requested stages
+    force| bool: rerun the requested stages even if they are checkpointed
+    """
+    needed = set()
+    for stage in reversed(list(STAGES)):
+        requested = stage in stages and (force or not checkpoint.done(stage, STAGES[stage]['params']))
+        required = any(stage in STAGES[later]['after'] for later in needed)
+        if requested or (required and not checkpoint.done(stage, STAGES[stage]['params'])):
+            needed.add(stage)
+    return [stage for stage in STAGES if stage in needed]
+
+
+def process_chunk(task, batchno):
+    """Runs the planned stages of one chunk in a worker process. Each stage starts from the
+    checkpointed output of the stage before it and saves its own output, see checkpoint.py.
+    Returns the path of the output of the final stage (geocode or facilities) of the chunk, None
+    if the chunk has not got that far.
+
+    Parameters:
+
+    task| tuple: path of the chunk csv or Parquet file, the list of stages to run, the metrics
+    file and the profiling mode of the chunk (None to not profile it)
+    batchno| int: number of the chunk in this run
+    """
+    name, plan, metrics_path, profile_mode = task
+    checkpoint = ChunkCheckpoint(name)
+    label = 'batch ' + str(batchno)
+    print('Processing ' + label + ' (' + name + '): ' + ', '.join(plan))
+
+    data = None
+    previous = None
+    with chunk_metrics(name, metrics_path), profiled(name, profile_mode):
+        for stage in plan:
+            after = STAGES[stage]['after']
+            if not after:
+                from tweet_io import read_chunk
+                with step('load') as record:
+                    df = read_chunk(name)
+                    record['rows_out'] = len(df)
+            elif previous == after[0]:
+                df = data
+            else:
+                with step('load', stage=after[0]) as record:
+                    df = checkpoint.load(after[0])
+                    record['rows_out'] = len(df)
+            with step(stage, len(df)) as record:
+                data = STAGE_FUNCTIONS[stage](df, label)
+                record['rows_out'] = len(data)
+            previous = stage
+            checkpoint.save(stage, data, STAGES[stage]['params'])
+
+    if checkpoint.done(FINAL_STAGE, STAGES[FINAL_STAGE]['params']):
+        return checkpoint.output_path(FINAL_STAGE)
+    return None
+
+
+def run_pipeline(stages=None, pattern=CHUNK_PATTERN, output=OUTPUT_PATH, append=APPEND_OUTPUT, force=False,
+                 dry_run=False, workers=WORKERS, torch_threads=TORCH_THREADS, metrics_path=METRICS_PATH,
+                 profile=PROFILE_CHUNKS, profile_mode=PROFILE_MODE):
+    """Runs the requested stages over the chunks matching pattern, in parallel worker processes
+    that build only the resources of the stages they run. With stage 'write' the output of the
+    final stage of each chunk is then streamed into the output one at a time.
+
+    Parameters:
+
+    stages| list of strings: stages to run, all by default
+    pattern| String: glob pattern of the input chunks
+    output| String: output GeoPackage file or GeoParquet directory
+    append| bool: add to an existing output instead of replacing it
+    force| bool: rerun the requested stages even if they are checkpointed
+    dry_run| bool: only print what would be run
+    workers| int: number of worker processes
+    torch_threads| int: number of torch threads per worker
+    metrics_path| String: JSON-lines file the metrics of each step are appended to, see instrumentation.py
+    profile| list of strings: file names or numbers (1 is the first) of the chunks to profile
+    profile_mode| String: 'cprofile' or 'sample'
+    """
+    stages = stages or list(STAGES) + [WRITE_STAGE]
+    chunks = sorted(glob.glob(pattern))
+    plans = {name: chunk_plan(ChunkCheckpoint(name), stages, force) for name in chunks}
+    todo = [name for name in chunks if plans[name]]
+    resources = {resource: RESOURCE_BUILDERS[resource] for name in todo for stage in plans[name]
+                 for resource in STAGES[stage]['resources']}
+
+    # Chunks to profile by file name or by number
+    profiled_chunks = {name for number, name in enumerate(chunks, start=1)
+                       if str(number) in profile or name in profile or os.path.basename(name) in profile}
+
+    print(str(len(chunks) - len(todo)) + '/' + str(len(chunks)) + ' chunks have nothing to run')
+    if dry_run:
+        for name in todo:
+            print(name + ': ' + ', '.join(plans[name]) + (' (profiled)' if name in profiled_chunks else ''))
+        print('Worker resources: ' + (', '.join(resources) or 'none'))
+        if WRITE_STAGE in stages:
+            print('Output: ' + output + (' (append)' if append else ''))
+        return None
+
+    outputs = {name: None for name in chunks}
+    if todo:
+        # Download the Stanza models that are not downloaded and verified yet
+        if any('lemmatize' in plans[name] for name in todo):
+            from lemma_service import download_models
+            download_models(PIPELINE_PACKAGES)
+        tasks = [(name, plans[name], metrics_path, profile_mode if name in profiled_chunks else None)
+                 for name in todo]
+        results = run_chunk_pool(tasks, process_chunk, resources, workers=workers, torch_threads=torch_threads)
+        outputs.update(zip(todo, results))
+
+    if WRITE_STAGE in stages:
+        import pickle
+        from output_sink import OutputSink
+
+        # Stream the saved chunk outputs to the final output one at a time
+        sink = OutputSink(output, append=append)
+        for name in chunks:
+            path = outputs[name] or ChunkCheckpoint(name).entry['stages'].get(FINAL_STAGE, {}).get('output')
+            if path is None or not os.path.exists(path):
+                print('No ' + FINAL_STAGE + ' output for ' + name + ', run the ' + FINAL_STAGE + ' stage first')
+                continue
+            with chunk_metrics(name, metrics_path), step('write') as record:
+                with open(path, 'rb') as f:
+                    geocoded = pickle.load(f)
+                record['rows_in'] = record['rows_out'] = len(geocoded)
+                sink.write(geocoded)
+        sink.close()
+    return outputs
+
+
+def main(argv=None):
+    """Command line of the pipeline eg. sports-tweets run --stages geocode,write --input 'chunk*.parquet'."""
+    parser = argparse.ArgumentParser(prog='sports-tweets', description='Finds and locates sports tweets.')
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='run pipeline stages over the input chunks')
+    run.add_argument('--stages', default=','.join(list(STAGES) + [WRITE_STAGE]),
+                     help='comma separated stages out of ' + ', '.join(list(STAGES) + [WRITE_STAGE])
+                     + ' (default: all); unfinished earlier stages are run too')
+    run.add_argument('--input', default=CHUNK_PATTERN, help='glob pattern of the input chunks (default: %(default)s)')
+    run.add_argument('--output', default=OUTPUT_PATH, help='output .gpkg file or .parquet directory (default: %(default)s)')
+    run.add_argument('--append', action='store_true', default=APPEND_OUTPUT, help='add to an existing output')
+    run.add_argument('--force', action='store_true', help='rerun the given stages even if checkpointed')
+    run.add_argument('--dry-run', action='store_true', help='print what would be run and exit')
+    run.add_argument('--workers', type=int, default=WORKERS, help='worker processes (default: %(default)s)')
+    run.add_argument('--torch-threads', type=int, default=TORCH_THREADS, help='torch threads per worker')
+    run.add_argument('--metrics', default=METRICS_PATH, help='JSON-lines file of step metrics (default: %(default)s)')
+    run.add_argument('--profile', action='append', default=list(PROFILE_CHUNKS),
+                     help='profile a chunk, given by file name or number (1 is the first); can be repeated')
+    run.add_argument('--profile-mode', choices=['cprofile', 'sample'], default=PROFILE_MODE,
+                     help='cProfile dump or sampled stacks in collapsed format (default: %(default)s)')
+
+    maps = commands.add_parser('map', help='write a density tile map of the output')
+    maps.add_argument('path', nargs='?', default=OUTPUT_PATH, help='output of a run (default: %(default)s)')
+    maps.add_argument('--name', default='sports_map', help='name of the map in data/outputs (default: %(default)s)')
+    maps.add_argument('--category', help='column to colour the map by eg. sport')
+    maps.add_argument('--markers', action='store_true', help='one folium marker per tweet, for small outputs')
+
+    metrics = commands.add_parser('metrics', help='sum the step metrics of a run over the chunks')
+    metrics.add_argument('path', nargs='?', default=METRICS_PATH, help='metrics file (default: %(default)s)')
+    metrics.add_argument('--run', default='last', help="id of the run, 'last' or 'all' (default: %(default)s)")
+
+    commands.add_parser('stages', help='list the stages and what they run after')
+
+    args = parser.parse_args(argv)
+    if args.command == 'stages':
+        for stage, spec in STAGES.items():
+            print(stage + ': after ' + (', '.join(spec['after']) or '-') + '; resources '
+                  + (', '.join(spec['resources']) or '-'))
+        print(WRITE_STAGE + ': after ' + FINAL_STAGE + '; runs in the main process')
+    elif args.command == 'run':
+        stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+        unknown = [stage for stage in stages if stage not in STAGES and stage != WRITE_STAGE]
+        if unknown:
+            parser.error('unknown stages: ' + ', '.join(unknown))
+        run_pipeline(stages, args.input, args.output, args.append, args.force, args.dry_run,
+                     args.workers, args.torch_threads, args.metrics, args.profile, args.profile_mode)
+    elif args.command == 'map':
+        from map_export import make_interactive_map, read_output
+        make_interactive_map(read_output(args.path), args.name, 'markers' if args.markers else 'tiles', args.category)
+    elif args.command == 'metrics':
+        summarize_metrics(read_metrics(args.path, None if args.run == 'all' else args.run))
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
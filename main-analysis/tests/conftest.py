@@ -0,0 +1,6 @@
+# Import required packages
+import os
+import sys
+
+# The modules of the analysis are imported by their plain names, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
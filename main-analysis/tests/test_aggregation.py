@@ -0,0 +1,93 @@
+# Import required packages
+import numpy as np
+import geopandas as gpd
+import pytest
+import shapely
+from scipy.stats import norm
+from aggregation import GridLayer, AreaCounts, getis_ord, hexagon_ids, unpack_ids
+
+# 5 x 5 grid of 250 m cells from 0, 0
+EXTENT = (0, 0, 1000, 1000)
+
+
+def tweets(points, keywords=None):
+    """Returns a GeoDataFrame of tweets at the given EPSG:3067 points."""
+    data = {} if keywords is None else {'matched_keywords': keywords}
+    return gpd.GeoDataFrame(data, geometry=gpd.points_from_xy(*zip(*points)), crs='EPSG:3067')
+
+
+def test_single_hot_cell_of_a_5x5_grid():
+    layer = GridLayer('square', 250, EXTENT)
+    assert len(layer.ids) == 25
+    counts = np.zeros(25)
+    centre, corner = layer.areas(np.array([625.0, 125.0]), np.array([625.0, 125.0]))
+    counts[centre] = 1
+
+    z, p = getis_ord(counts, layer.weights())
+
+    # By hand: n = 25, mean 0.04, S = sqrt(0.04 - 0.04 ** 2) = sqrt(0.0384). The centre and its
+    # 8 neighbours have 9 weights including their own and the one tweet in their sum:
+    # (1 - 0.04 * 9) / (S * sqrt((25 * 9 - 9 ** 2) / 24)) = 0.64 / 0.48
+    assert z[centre] == pytest.approx(4 / 3)
+    assert p[centre] == pytest.approx(2 * norm.sf(4 / 3))
+    columns, rows = unpack_ids(layer.ids)
+    assert np.allclose(z[(np.abs(columns - 2) <= 1) & (np.abs(rows - 2) <= 1)], 4 / 3)
+    # A corner has 4 weights and no tweet: -0.04 * 4 / (S * sqrt((25 * 4 - 4 ** 2) / 24))
+    assert z[corner] == pytest.approx(-0.16 / np.sqrt(0.0384 * 3.5))
+
+
+def test_hexagon_ids_fall_in_their_own_polygon():
+    layer = GridLayer('hexagon', 250, (380000, 6670000, 383000, 6673000))
+    x = np.random.default_rng(1).uniform(380000, 383000, 2000)
+    y = np.random.default_rng(2).uniform(6670000, 6673000, 2000)
+
+    positions = layer.areas(x, y)
+    assert (positions >= 0).all()
+    assert (layer.ids[positions] == hexagon_ids(x, y, 250)).all()
+    assert shapely.contains_xy(layer.geometry().values[positions], x, y).all()
+
+
+def test_update_adds_only_the_new_parquet_part(tmp_path):
+    layer = GridLayer('square', 250, EXTENT)
+    output = tmp_path / 'output'
+    output.mkdir()
+    first = tweets([(100, 100), (100, 120), (900, 900)], ['juosta', 'juosta,uida', None])
+    second = tweets([(110, 110), (600, 600)], ['uida', 'hiihtää'])
+    first.to_parquet(output / 'part-00001.parquet')
+
+    counts = AreaCounts(layer, 'matched_keywords')
+    assert counts.update(str(output)) == 3
+    counts.save(str(tmp_path / 'state'))
+    before = counts.counts.copy()
+
+    second.to_parquet(output / 'part-00002.parquet')
+    counts = AreaCounts.load(layer, str(tmp_path / 'state'), 'matched_keywords')
+    assert counts.update(str(output)) == 2
+
+    assert counts.categories == ['juosta', 'uida', 'hiihtää']
+    # Exactly the tweets of the second part were added: uida to the cell of 110, 110 and hiihtää to that of 600, 600
+    before = np.hstack([before, np.zeros((25, 1), dtype=np.int64)])
+    expected = np.zeros_like(before)
+    cells = layer.areas(np.array([110.0, 600.0]), np.array([110.0, 600.0]))
+    expected[cells[0], 1] = 1
+    expected[cells[1], 2] = 1
+    assert (counts.counts - before == expected).all()
+    assert counts.totals.sum() == 5
+    assert counts.totals[layer.areas(np.array([100.0]), np.array([100.0]))[0]] == 3
+
+
+def test_update_skips_the_rows_of_a_geopackage_already_counted(tmp_path):
+    layer = GridLayer('square', 250, EXTENT)
+    output = str(tmp_path / 'finaloutput.gpkg')
+    tweets([(100, 100), (900, 900), (5000, 5000)]).to_file(output, driver='GPKG')
+
+    counts = AreaCounts(layer)
+    assert counts.update(output) == 3
+    assert counts.sources == {'finaloutput.gpkg': 3}
+    assert counts.totals.sum() == 2
+
+    tweets([(100, 110), (400, 400)]).to_file(output, driver='GPKG', mode='a')
+    assert counts.update(output) == 2
+    assert counts.sources == {'finaloutput.gpkg': 5}
+    assert counts.totals.sum() == 4
+    assert counts.update(output) == 0
@@ -0,0 +1,40 @@
+# Import required packages
+import os
+import pandas as pd
+import checkpoint
+from checkpoint import ChunkCheckpoint
+
+
+def write_chunk(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def test_unchanged_chunk_is_not_hashed_again(tmp_path, monkeypatch):
+    chunk = str(tmp_path / 'chunk1.csv')
+    write_chunk(chunk, 'lang,full_text\nfi,juoksu\n')
+    ChunkCheckpoint(chunk, str(tmp_path / 'checkpoints')).save('lemmatize', pd.DataFrame({'a': [1]}))
+
+    def fail(path):
+        raise AssertionError('hashed ' + path)
+    monkeypatch.setattr(checkpoint, 'file_hash', fail)
+    assert ChunkCheckpoint(chunk, str(tmp_path / 'checkpoints')).done('lemmatize')
+
+
+def test_touched_chunk_keeps_its_stages(tmp_path):
+    chunk = str(tmp_path / 'chunk1.csv')
+    write_chunk(chunk, 'lang,full_text\nfi,juoksu\n')
+    ChunkCheckpoint(chunk, str(tmp_path / 'checkpoints')).save('lemmatize', pd.DataFrame({'a': [1]}))
+    os.utime(chunk, ns=(0, 10 ** 9))
+
+    assert ChunkCheckpoint(chunk, str(tmp_path / 'checkpoints')).done('lemmatize')
+    assert ChunkCheckpoint(chunk, str(tmp_path / 'checkpoints')).entry['input_mtime'] == 10 ** 9
+
+
+def test_changed_chunk_runs_again(tmp_path):
+    chunk = str(tmp_path / 'chunk1.csv')
+    write_chunk(chunk, 'lang,full_text\nfi,juoksu\n')
+    ChunkCheckpoint(chunk, str(tmp_path / 'checkpoints')).save('lemmatize', pd.DataFrame({'a': [1]}))
+    write_chunk(chunk, 'lang,full_text\nfi,uinti\nfi,hiihto\n')
+
+    assert not ChunkCheckpoint(chunk, str(tmp_path / 'checkpoints')).done('lemmatize')
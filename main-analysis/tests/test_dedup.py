@@ -0,0 +1,28 @@
+# Import required packages
+import pandas as pd
+from dedup import apply_deduplicated
+from instrumentation import chunk_metrics, step, read_metrics
+
+
+def test_duplicates_share_the_result_and_the_ratio_is_recorded(tmp_path):
+    df = pd.DataFrame({'full_text': ['Juoksulenkki Keskuspuistossa https://t.co/a', 'RT @seura: Uimahalli auki',
+                                     'Juoksulenkki Keskuspuistossa https://t.co/b', 'Uimahalli auki']},
+                      index=[10, 11, 12, 13])
+    seen = []
+
+    def lemmatize(part):
+        seen.append(len(part))
+        return part.assign(lemmas=part['full_text'].str.lower())
+
+    path = str(tmp_path / 'metrics.jsonl')
+    with chunk_metrics('chunk1.csv', path):
+        with step('lemmatize', len(df), lang='fi') as record:
+            result = apply_deduplicated(df, lemmatize, 'fi', 'chunk1.csv', near=False)
+            record['rows_out'] = len(result)
+
+    assert seen == [2]
+    assert list(result.index) == [10, 11, 12, 13]
+    assert result.loc[12, 'lemmas'] == result.loc[10, 'lemmas']
+    assert result.loc[13, 'lemmas'] == result.loc[11, 'lemmas']
+    [recorded] = read_metrics(path)
+    assert recorded['dedup'] == {'chunk': 'chunk1.csv', 'lang': 'fi', 'tweets': 4, 'unique': 2, 'dedup_ratio': 2.0}
@@ -0,0 +1,69 @@
+# Import required packages
+import numpy as np
+import geopandas as gpd
+import pytest
+import shapely
+from shapely.geometry import Point
+from facilities import FacilityIndex, load_facilities, nearest_facility
+
+
+def facility_frame(name_column='nimi_fi', type_column='tyyppi_nimi_fi'):
+    """Returns a swimming hall and a football field 1 km apart, in EPSG:3067."""
+    return gpd.GeoDataFrame({name_column: ['Yrjönkadun uimahalli', 'Töölön pallokenttä'],
+                             type_column: ['Uimahalli', 'Jalkapallokenttä']},
+                            geometry=[Point(385000, 6672000), Point(385000, 6673000)], crs='EPSG:3067')
+
+
+def tweets(geometry, crs='EPSG:3067'):
+    """Returns tweets at the given geometries."""
+    return gpd.GeoDataFrame({'full_text': ['t%s' % i for i in range(len(geometry))]}, geometry=geometry,
+                            crs=crs, index=[10 + i for i in range(len(geometry))])
+
+
+def test_nearest_facility_within_radius():
+    located = tweets([Point(385030, 6672040), Point(385000, 6672900), Point(386000, 6672000), None,
+                      Point()])
+    joined = nearest_facility(located, FacilityIndex(facility_frame()), radius=200)
+
+    assert joined.index.tolist() == [10, 11, 12, 13, 14]
+    assert joined['facility'].tolist()[:2] == ['Yrjönkadun uimahalli', 'Töölön pallokenttä']
+    assert joined['facility_type'].tolist()[:2] == ['Uimahalli', 'Jalkapallokenttä']
+    assert joined[['facility', 'facility_type']].iloc[2:].isna().all().all()
+    assert joined['facility_distance'].tolist()[:2] == pytest.approx([50, 100])
+    assert np.isnan(joined['facility_distance'].to_numpy()[2:]).all()
+
+    # Without a limit the tweet 1 km away gets the hall too
+    joined = nearest_facility(located, FacilityIndex(facility_frame()), radius=0)
+    assert joined['facility'].tolist()[2] == 'Yrjönkadun uimahalli'
+    assert joined['facility_distance'].tolist()[2] == pytest.approx(1000)
+
+    dropped = nearest_facility(located, FacilityIndex(facility_frame()), radius=200, drop=True)
+    assert dropped.index.tolist() == [10, 11]
+    assert list(dropped.columns) == list(joined.columns)
+
+
+def test_tweets_and_facilities_in_other_crs():
+    # Shapefile column names, and the facilities and tweets in WGS84
+    index = FacilityIndex(facility_frame('nimi', 'tyyppi_nim').to_crs(epsg=4326))
+    located = tweets([Point(385030, 6672040)]).to_crs(epsg=4326)
+    joined = nearest_facility(located, index, radius=200)
+    assert joined['facility'].tolist() == ['Yrjönkadun uimahalli']
+    assert joined['facility_distance'].tolist() == pytest.approx([50], abs=0.01)
+    assert joined.crs == 'EPSG:4326'
+
+
+def test_facilities_without_names_or_points(tmp_path):
+    index = FacilityIndex(facility_frame()[['geometry']])
+    joined = nearest_facility(tweets([Point(385000, 6672010)]), index)
+    assert joined['facility'].isna().all()
+    assert joined['facility_distance'].tolist() == pytest.approx([10])
+
+    empty = FacilityIndex(facility_frame().iloc[:0])
+    assert len(empty) == 0
+    positions, distances = empty.nearest(shapely.points([[385000, 6672000]]))
+    assert positions.tolist() == [-1] and np.isnan(distances).all()
+
+    # A saved layer is read from disk without fetching
+    path = str(tmp_path / 'lipas.gpkg')
+    facility_frame().to_file(path, driver='GPKG')
+    assert load_facilities(path).names.tolist() == ['Yrjönkadun uimahalli', 'Töölön pallokenttä']
@@ -0,0 +1,67 @@
+# Import required packages
+import pandas as pd
+import geopandas as gpd
+import pytest
+import fuzzy_toponyms
+from fuzzy_toponyms import FuzzyToponymIndex, FOLDED_CONFIDENCE, COMPOUND_CONFIDENCE, edit_distance
+from gazetteer import geocode
+
+NAMES = ['Töölö', 'Nuuksio', 'Kallio', 'Helsinki', 'Espoonlahti', 'Kauniainen', 'Pääkaupunkiseutu']
+NAME_KEYS = [(name.lower(), feature_id) for feature_id, name in enumerate(NAMES)]
+
+
+def test_confidence_of_each_kind_of_match():
+    index = FuzzyToponymIndex(NAME_KEYS)
+    assert index.lookup('töölö') == (0, 1.0)
+    # Only the diacritics differ
+    assert index.lookup('toolo') == (0, FOLDED_CONFIDENCE)
+    # One letter missing, swapped or wrong: 1 - distance / length
+    assert index.lookup('helsnki') == (3, pytest.approx(1 - 1 / 7))
+    assert index.lookup('espoonlahit') == (4, pytest.approx(1 - 1 / 11))
+    assert index.lookup('kauniainrn') == (5, pytest.approx(1 - 1 / 10))
+    # Two edits are allowed from 9 letters on
+    assert index.lookup('kaunianen') == (5, pytest.approx(1 - 1 / 9))
+    assert index.lookup('paakaupnkisetu') == (6, pytest.approx(1 - 2 / 14))
+    # but two in 10 letters are a confidence of 0.8
+    assert index.lookup('kaunainenn') is None
+    # Place names at the start or end of a compound word
+    assert index.lookup('nuuksionkansallispuisto') == (1, COMPOUND_CONFIDENCE)
+    assert index.lookup('lenkkikallio') == (2, COMPOUND_CONFIDENCE)
+
+
+def test_matches_below_the_thresholds_are_dropped(monkeypatch):
+    index = FuzzyToponymIndex(NAME_KEYS)
+    # Short words are not looked up, and one edit in 5 letters is a confidence of 0.8
+    assert index.lookup('töö') is None
+    assert index.lookup('kalio') is None
+    # Two edits are too many for 8 letters
+    assert index.lookup('helsnik') is None
+    assert index.lookup('sataa') is None
+
+    monkeypatch.setattr(fuzzy_toponyms, 'MIN_CONFIDENCE', 0.9)
+    index = FuzzyToponymIndex(NAME_KEYS)
+    assert index.lookup('helsnki') is None
+    assert index.lookup('kauniainrn') == (5, pytest.approx(0.9))
+    assert index.lookup('toolo') == (0, FOLDED_CONFIDENCE)
+    assert index.lookup('lenkkikallio') is None
+
+
+def test_edit_distance():
+    assert edit_distance('helsinki', 'helsinki', 2) == 0
+    assert edit_distance('helsinki', 'heslinki', 2) == 1
+    assert edit_distance('helsinki', 'hlsnki', 2) == 2
+    assert edit_distance('helsinki', 'espoo', 2) == 3
+
+
+def test_geocode_falls_back_to_the_fuzzy_index():
+    hmanames = gpd.GeoDataFrame({'name': NAMES}, geometry=gpd.points_from_xy(range(7), range(7)), crs='EPSG:3067')
+    df = pd.DataFrame({'lemmas': pd.Series([['juosta', 'helsinki'], ['juosta', 'helsnki'], ['hiihto', 'toolo'],
+                                            ['sataa']], dtype=object)})
+
+    sportshma = geocode(df, hmanames, fuzzy=True)
+    assert sportshma.index.tolist() == [0, 1, 2]
+    assert sportshma['toponym'].tolist() == ['Helsinki', 'Helsinki', 'Töölö']
+    assert sportshma['confidence'].tolist() == pytest.approx([1.0, 1 - 1 / 7, FOLDED_CONFIDENCE])
+    assert sportshma['lon'].tolist() == [3, 3, 0]
+
+    assert geocode(df, hmanames, fuzzy=False).index.tolist() == [0]
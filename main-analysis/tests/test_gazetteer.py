@@ -0,0 +1,68 @@
+# Import required packages
+import pandas as pd
+import geopandas as gpd
+import pytest
+from gazetteer import GazetteerIndex, CompiledGazetteer, geocode
+from gazetteer_compiler import surface_forms, write_artifact
+
+# Kallio is in the gazetteer twice, the first feature is used
+NAMES = ['Kallio', 'Itä', 'Itäkeskus', 'Kallio', 'Vantaa']
+POINTS = [(386000, 6675000), (393000, 6678000), (394000, 6677000), (999000, 9999000), (390000, 6690000)]
+
+LEMMAS = [['juosta', 'itä', 'keskus', 'ja', 'kallio'], ['sataa', 'lumi'], ['kallio', 'kallio', 'vantaa'], None,
+          ['#Itä', 'lenkki']]
+
+
+def gazetteer():
+    """Returns the gazetteer of the tests in EPSG:3067."""
+    x, y = zip(*POINTS)
+    return gpd.GeoDataFrame({'name': NAMES, 'geonameid': list(range(1, len(NAMES) + 1)),
+                             'alternatenames': [None] * len(NAMES)},
+                            geometry=gpd.points_from_xy(x, y), crs='EPSG:3067')
+
+
+def tweets():
+    """Returns the tweets of the tests, one of them without lemmas."""
+    index = [10, 11, 12, 13, 14]
+    return pd.DataFrame({'full_text': ['t%s' % i for i in range(len(LEMMAS))],
+                         'lemmas': pd.Series(LEMMAS, index=index, dtype=object)}, index=index)
+
+
+def test_longest_name_wins_and_first_toponym_locates_the_tweet():
+    index = GazetteerIndex(gazetteer())
+    assert index.match(['itä', 'keskus', 'kallio', 'itä']) == [2, 0, 1]
+
+    sportshma = geocode(tweets(), index, fuzzy=False)
+    assert sportshma.index.tolist() == [10, 12, 14]
+    assert sportshma['toponym'].tolist() == ['Itäkeskus', 'Kallio', 'Itä']
+    assert sportshma['toponyms'].tolist() == ['Itäkeskus,Kallio', 'Kallio,Vantaa', 'Itä']
+    assert sportshma[['lon', 'lat']].values.tolist() == [list(POINTS[2]), list(POINTS[0]), list(POINTS[1])]
+    assert [(point.x, point.y) for point in sportshma.geometry] == [POINTS[2], POINTS[0], POINTS[1]]
+    assert sportshma.crs == 'EPSG:3067'
+    assert sportshma['confidence'].tolist() == [1.0, 1.0, 1.0]
+
+
+def test_compiled_artifact_geocodes_like_the_gazetteer(tmp_path):
+    hmanames = gazetteer()
+    path = str(tmp_path / 'test.gaz')
+    write_artifact(path, hmanames, surface_forms(hmanames))
+
+    expected = geocode(tweets(), hmanames, fuzzy=False)
+    compiled = geocode(tweets(), CompiledGazetteer(path), fuzzy=False)
+    columns = ['full_text', 'lon', 'lat', 'toponym', 'toponyms', 'confidence']
+    pd.testing.assert_frame_equal(pd.DataFrame(compiled[columns]), pd.DataFrame(expected[columns]))
+    assert compiled.geometry.geom_equals(expected.geometry).all()
+
+
+def test_no_toponyms():
+    sportshma = geocode(tweets().iloc[[1]], gazetteer(), fuzzy=False)
+    assert len(sportshma) == 0
+    assert isinstance(sportshma, gpd.GeoDataFrame)
+
+
+def test_raw_text_column():
+    df = pd.DataFrame({'full_text': ['Lenkillä Itä-keskus #kallio', None, 'Sataa']})
+    sportshma = geocode(df, gazetteer(), column='full_text', fuzzy=False)
+    assert sportshma.index.tolist() == [0]
+    assert sportshma['toponyms'].tolist() == ['Itäkeskus,Kallio']
+    assert sportshma['lon'].tolist() == pytest.approx([POINTS[2][0]])
@@ -0,0 +1,39 @@
+# Import required packages
+import geopandas as gpd
+from gazetteer import CompiledGazetteer
+from gazetteer_compiler import surface_forms, write_artifact
+
+
+def gazetteer(names, alternates):
+    """Returns a small gazetteer with the given base and alternate names (comma separated)."""
+    return gpd.GeoDataFrame({'name': names, 'geonameid': list(range(1, len(names) + 1)), 'alternatenames': alternates},
+                            geometry=gpd.points_from_xy(range(len(names)), range(len(names))), crs='EPSG:3067')
+
+
+def test_inflected_city_wins_over_inflected_alternate_name():
+    # The river comes first and has the city name as an alternate name
+    hmanames = gazetteer(['Vantaanjoki', 'Vantaa'], ['Vantaa,Vanda', None])
+    forms = surface_forms(hmanames).set_index('key')['feature']
+
+    assert forms['vantaa'] == 1
+    for form in ['vantaan', 'vantaalla', 'vantaalle', 'vantaalta']:
+        assert forms[form] == 1
+    assert forms['vantaanjoki'] == 0
+    assert forms['vanda'] == 0
+
+
+def test_artifact_max_parts_counts_alternate_names(tmp_path):
+    hmanames = gazetteer(['Itäkeskus', 'Kallio'], ['Itä Helsingin kauppa keskus', None])
+    path = str(tmp_path / 'test.gaz')
+    write_artifact(path, hmanames, surface_forms(hmanames))
+
+    compiled = CompiledGazetteer(path)
+    assert compiled.max_parts == 5
+    assert compiled.match(['itä', 'helsingin', 'kauppa', 'keskus']) == [0]
+
+
+def test_gazetteer_without_alternate_names():
+    hmanames = gazetteer(['Kallio', 'Vantaa'], [None, None])
+    forms = surface_forms(hmanames).set_index('key')['feature']
+    assert forms['kallio'] == 0
+    assert forms['vantaalla'] == 1
@@ -0,0 +1,33 @@
+# Import required packages
+import sys
+import json
+import importlib
+import instrumentation
+
+
+def test_import_without_resource_module(monkeypatch):
+    # The resource module is missing on Windows
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    module = importlib.reload(instrumentation)
+    try:
+        assert module.resource is None
+    finally:
+        monkeypatch.undo()
+        importlib.reload(instrumentation)
+
+
+def test_steps_without_peak_rss(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'peak_rss', lambda: None)
+    path = str(tmp_path / 'metrics.jsonl')
+    with instrumentation.chunk_metrics('chunk_1.csv', path):
+        with instrumentation.step('geocode', rows_in=3) as outer:
+            with instrumentation.step('parse_points', rows_in=3) as inner:
+                inner['rows_out'] = 2
+            outer['rows_out'] = 2
+
+    records = instrumentation.read_metrics(path)
+    assert [record['step'] for record in records] == ['parse_points', 'geocode']
+    assert [record['peak_rss_mb'] for record in records] == [None, None]
+    assert instrumentation.summarize_metrics(records)['geocode']['peak_rss_mb'] is None
+    with open(path) as f:
+        assert json.loads(f.readline())['parent'] == 'geocode'
@@ -0,0 +1,67 @@
+# Import required packages
+import sqlite3
+from lemma_cache import LemmaCache
+from lemmatization import lemmatize_cached
+
+
+class FakePipeline:
+    """Pipeline that lemmatizes by adding a suffix, with the given processors."""
+
+    def __init__(self, processors, suffix):
+        self.processors = dict.fromkeys(processors)
+        self.suffix = suffix
+        self.calls = 0
+
+    def lemmatize(self, texts):
+        self.calls += 1
+        return [[word + self.suffix for word in text.split()] for text in texts]
+
+
+def test_pipelines_with_other_processors_do_not_share_entries():
+    cache = LemmaCache(path=None)
+    plain = FakePipeline(['tokenize', 'lemma'], '')
+    with_pos = FakePipeline(['tokenize', 'lemma', 'pos'], '+pos')
+
+    assert lemmatize_cached(['juoksin tänään'], plain, cache, 'fi', 'tdt') == [['juoksin', 'tänään']]
+    assert lemmatize_cached(['juoksin tänään'], with_pos, cache, 'fi', 'tdt') == [['juoksin+pos', 'tänään+pos']]
+    assert lemmatize_cached(['juoksin tänään'], plain, cache, 'fi', 'tdt') == [['juoksin', 'tänään']]
+    assert (plain.calls, with_pos.calls) == (1, 1)
+
+
+def test_disk_size_is_kept_without_scanning_the_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = LemmaCache(path, max_bytes=70)
+    queries = []
+    cache.con.set_trace_callback(queries.append)
+
+    cache.put_many({'fi:tdt::a': ['juosta'], 'fi:tdt::b': ['uida', 'hiihtää']})
+    cache.put_many({'fi:tdt::a': ['juosta', 'kävellä']})
+    cache.con.set_trace_callback(None)
+    assert not [query for query in queries if 'SUM(' in query.upper()]
+    assert cache.disk_bytes() == cache.con.execute('SELECT SUM(size) FROM lemmas').fetchone()[0]
+
+    # Over max_bytes the least recently used entry is evicted and the size follows
+    cache.put_many({'fi:tdt::c': ['pyöräillä', 'luistella', 'melonta']})
+    assert cache.con.execute('SELECT key FROM lemmas ORDER BY key').fetchall() == [('fi:tdt::a',), ('fi:tdt::c',)]
+    assert cache.disk_bytes() == cache.con.execute('SELECT SUM(size) FROM lemmas').fetchone()[0] <= 70
+    cache.close()
+
+    # A second process opening the cache continues from the same total
+    reopened = LemmaCache(path, max_bytes=70)
+    assert reopened.disk_bytes() == reopened.con.execute('SELECT SUM(size) FROM lemmas').fetchone()[0]
+    reopened.close()
+
+
+def test_total_of_a_cache_made_before_the_size_table(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    con = sqlite3.connect(path)
+    con.execute('CREATE TABLE lemmas (key TEXT PRIMARY KEY, lemmas TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)')
+    con.execute("INSERT INTO lemmas VALUES ('fi:tdt::a', '[\"juosta\"]', 10, 0)")
+    con.commit()
+    con.close()
+
+    cache = LemmaCache(path)
+    assert cache.disk_bytes() == 10
+    cache.put_many({'fi:tdt::b': ['uida']})
+    assert cache.disk_bytes() == 10 + len('["uida"]')
+    cache.close()
@@ -0,0 +1,55 @@
+# Import required packages
+import os
+import json
+import socket
+import hashlib
+import importlib
+import socketserver
+from multiprocessing import get_context
+import lemma_service
+from lemma_service import model_ready
+
+
+def fake_models(model_dir):
+    """Writes a resources.json and one model file of a Finnish pipeline to model_dir."""
+    content = b'model'
+    resources = {'fi': {'tokenize': {'tdt': {'md5': hashlib.md5(content).hexdigest()}},
+                        'lemma': {'tdt': {'md5': hashlib.md5(content).hexdigest()}}}}
+    with open(os.path.join(model_dir, 'resources.json'), 'w') as f:
+        json.dump(resources, f)
+    for processor in ['tokenize', 'lemma']:
+        os.makedirs(os.path.join(model_dir, 'fi', processor))
+        with open(os.path.join(model_dir, 'fi', processor, 'tdt.pt'), 'wb') as f:
+            f.write(content)
+
+
+def test_verified_models_are_not_written_again(tmp_path):
+    fake_models(str(tmp_path))
+    assert model_ready('fi', 'tdt', str(tmp_path))
+    verified_path = str(tmp_path / '.verified.json')
+    written = os.stat(verified_path).st_mtime_ns
+
+    assert model_ready('fi', 'tdt', str(tmp_path))
+    assert os.stat(verified_path).st_mtime_ns == written
+
+
+def test_workers_checking_models_together(tmp_path):
+    fake_models(str(tmp_path))
+    with get_context('spawn').Pool(4) as pool:
+        assert all(pool.starmap(model_ready, [('fi', 'tdt', str(tmp_path))] * 16))
+    assert not [name for name in os.listdir(str(tmp_path)) if '.tmp' in name]
+
+
+def test_in_process_pipeline_without_unix_sockets(monkeypatch):
+    # Windows has neither AF_UNIX nor socketserver.UnixStreamServer
+    monkeypatch.delattr(socket, 'AF_UNIX')
+    monkeypatch.delattr(socketserver, 'UnixStreamServer')
+    module = importlib.reload(lemma_service)
+    try:
+        assert not module.UNIX_SOCKETS
+        monkeypatch.setattr(module, 'download_models', lambda packages: None)
+        pipeline = module.service_pipeline('fi', 'tdt', lambda lang, package_name: (lang, package_name))
+        assert pipeline == ('fi', 'tdt')
+    finally:
+        monkeypatch.undo()
+        importlib.reload(lemma_service)
@@ -0,0 +1,20 @@
+# Import required packages
+import pickle
+import pandas as pd
+from lemma_store import lemma_series, lemma_lists, lemma_text, lemma_chunks, arrow_lemmas
+
+
+def test_dictionary_holds_only_the_lemmas_of_the_chunk():
+    lemma_series([['word%s' % number for number in range(100000)]])
+    small = lemma_series([['juosta', 'helsinki', 'juosta'], None])
+
+    dictionaries = [chunk.values.dictionary for chunk in arrow_lemmas(small).chunks]
+    assert [dictionary.to_pylist() for dictionary in dictionaries] == [['juosta', 'helsinki']]
+    assert len(pickle.dumps(small)) < 10000
+
+
+def test_lemmas_round_trip_across_chunks():
+    lemmas = pd.concat([lemma_series([['a', 'b'], None]), lemma_series([['c', 'a']])], ignore_index=True)
+    assert lemma_lists(lemmas) == [['a', 'b'], None, ['c', 'a']]
+    assert lemma_text(lemmas).tolist() == ['a b', None, 'c a']
+    assert [rows.tolist() for rows, _, _, _ in lemma_chunks(lemmas)] == [[0, 0], [2, 2]]
@@ -0,0 +1,51 @@
+# Import required packages
+import os
+import glob
+import json
+import numpy as np
+import geopandas as gpd
+import pytest
+from map_export import aggregate_cells, write_tile_pyramid
+
+# Two tweets at Helsinki railway station, in the same cell, and one in Espoo centre. Their
+# tiles by the slippy map formula: Helsinki 582/296 on zoom 10 and 37307/18969 on zoom 16,
+# Espoo 4657/2369 on zoom 13.
+LON = np.array([24.9384, 24.93841, 24.6559])
+LAT = np.array([60.1699, 60.16991, 60.2055])
+
+
+def test_cells_land_in_their_tiles():
+    cells = aggregate_cells(LON, LAT, np.array([0, 1, 1]), 2, 10)
+    helsinki = cells[cells['count'] == 2].iloc[0]
+    assert (helsinki['tile_x'], helsinki['tile_y']) == (582, 296)
+    assert (helsinki['c0'], helsinki['c1']) == (1, 1)
+    assert helsinki['lon'] == pytest.approx(LON[:2].mean())
+
+    cells = aggregate_cells(LON, LAT, np.array([0, 1, 1]), 2, 16)
+    assert cells[cells['count'] == 2][['tile_x', 'tile_y']].values.tolist() == [[37307, 18969]]
+    cells = aggregate_cells(LON[2:], LAT[2:], np.array([0]), 1, 13)
+    assert cells[['tile_x', 'tile_y', 'count']].values.tolist() == [[4657, 2369, 1]]
+
+
+def test_tile_pyramid_counts_and_metadata(tmp_path):
+    tweets = gpd.GeoDataFrame({'sport': ['running', 'cycling', 'running']},
+                              geometry=gpd.points_from_xy(LON, LAT), crs='EPSG:4326').to_crs('EPSG:3067')
+    metadata = write_tile_pyramid(tweets, str(tmp_path), category='sport', min_zoom=10, max_zoom=12)
+
+    paths = glob.glob(os.path.join(str(tmp_path), '*', '*', '*.json'))
+    assert metadata == {'min_zoom': 10, 'max_zoom': 12, 'cell_size': 16, 'categories': ['cycling', 'running'],
+                        'points': 3, 'tiles': len(paths),
+                        'bounds': pytest.approx([LON.min(), LAT.min(), LON.max(), LAT.max()])}
+    with open(os.path.join(str(tmp_path), 'metadata.json')) as f:
+        assert json.load(f) == metadata
+    assert os.path.exists(os.path.join(str(tmp_path), '10', '582', '296.json'))
+
+    for zoom in ['10', '11', '12']:
+        cells = []
+        for path in glob.glob(os.path.join(str(tmp_path), zoom, '*', '*.json')):
+            with open(path) as f:
+                cells += json.load(f)
+        # Each cell is [lon, lat, count, cycling, running] and the categories sum to the count
+        assert all(cell[2] == cell[3] + cell[4] for cell in cells)
+        assert sum(cell[2] for cell in cells) == 3
+        assert sum(cell[3] for cell in cells) == 1
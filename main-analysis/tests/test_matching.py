@@ -0,0 +1,46 @@
+# Import required packages
+import pandas as pd
+from lemma_store import lemma_series
+from matching import get_sports_tweets
+from instrumentation import chunk_metrics, step, read_metrics
+
+KEYWORDS = ['juosta', 'uinti', 'hiihto', 'lenkki']
+
+LEMMAS = [['mennä', 'juosta', 'ja', 'uinti', 'juosta'], None, ['sataa', 'lumi'], ['hiihto'], [],
+          ['uinti', 'lenkki', 'uinti']]
+
+
+def loop_matches(lemma_lists, keyword_list):
+    """Index of the rows the row by row loop of the earlier get_sports_tweets kept."""
+    return [i for i, lemmas in enumerate(lemma_lists)
+            if lemmas is not None and any(lemma in keyword_list for lemma in lemmas)]
+
+
+def test_same_rows_as_the_loop_with_keywords_in_order():
+    df = pd.DataFrame({'full_text': ['t%s' % i for i in range(len(LEMMAS))],
+                       'lemmas': pd.Series(LEMMAS, dtype=object)})
+    sports = get_sports_tweets(df, KEYWORDS)
+    assert sports.index.tolist() == loop_matches(LEMMAS, KEYWORDS) == [0, 3, 5]
+    # Each keyword once, in the order it first appears
+    assert sports['matched_keywords'].tolist() == [['juosta', 'uinti'], ['hiihto'], ['uinti', 'lenkki']]
+
+
+def test_compact_lemmas_of_several_chunks(tmp_path):
+    # Two chunks with dictionaries of their own, and a label index
+    lemmas = pd.concat([lemma_series(LEMMAS[:3]), lemma_series(LEMMAS[3:])], ignore_index=True)
+    df = pd.DataFrame({'full_text': ['t%s' % i for i in range(len(LEMMAS))], 'lemmas': lemmas})
+    df.index = [10 + i for i in range(len(df))]
+
+    path = str(tmp_path / 'metrics.jsonl')
+    with chunk_metrics('chunk1.csv', path):
+        with step('match', len(df)):
+            sports = get_sports_tweets(df, KEYWORDS)
+    assert sports.index.tolist() == [10, 13, 15]
+    assert sports['matched_keywords'].tolist() == [['juosta', 'uinti'], ['hiihto'], ['uinti', 'lenkki']]
+    # The tweet without lemmas is counted as skipped
+    assert read_metrics(path)[0]['errors'] == {'no_lemmas': 1}
+
+
+def test_no_tweets():
+    df = pd.DataFrame({'full_text': pd.Series(dtype=object), 'lemmas': pd.Series(dtype=object)})
+    assert len(get_sports_tweets(df, KEYWORDS)) == 0
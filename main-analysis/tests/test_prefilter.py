@@ -0,0 +1,47 @@
+# Import required packages
+import pandas as pd
+from prefilter import build_prefilter, filter_candidates, verify_prefilter
+
+
+class FakePipeline:
+    """Pipeline that lemmatizes with a dictionary of word forms, other words are their own lemma."""
+
+    def __init__(self, lemmas):
+        self.lemmas = lemmas
+        self.processors = ['tokenize', 'lemma']
+
+    def lemmatize(self, texts):
+        return [[self.lemmas.get(word.strip('#.,!'), word.strip('#.,!')) for word in text.lower().split()]
+                for text in texts]
+
+
+FINNISH = FakePipeline({'juoksin': 'juosta', 'hiihtoa': 'hiihto', 'lenkillä': 'lenkki', 'uimassa': 'uida',
+                        'sataa': 'sataa', 'nuuksiossa': 'nuuksio', 'kävin': 'käydä'})
+
+
+def test_inflected_keywords_are_candidates():
+    prefilter = build_prefilter(['juosta', 'hiihto', 'lenkki'], 'fi')
+    df = pd.DataFrame({'full_text': ['Juoksin tänään', '#hiihtoa Nuuksiossa', 'Kävin lenkillä', 'Sataa lunta',
+                                     'Uimassa']})
+    assert filter_candidates(df, prefilter, 'fi').index.tolist() == [0, 1, 2]
+
+
+def test_verify_prefilter_without_recall_loss():
+    df = pd.DataFrame({'full_text': ['Juoksin tänään', '#hiihtoa Nuuksiossa', 'Kävin lenkillä', 'Sataa lunta',
+                                     'Kävin uimassa'] * 20})
+    report, missed = verify_prefilter(df, FINNISH, ['juosta', 'hiihto', 'lenkki'], 'fi', sample_size=50)
+    assert report['sample'] == 50
+    assert report['full_matches'] == report['prefilter_matches'] == report['candidates']
+    assert report['candidates'] < report['sample']
+    assert report['missed'] == 0 and report['recall_loss'] == 0.0
+    assert len(missed) == 0
+
+
+def test_verify_prefilter_reports_the_tweets_it_would_lose():
+    # The irregular 'swam' does not start with a stem of 'swim'
+    english = FakePipeline({'swam': 'swim', 'swimming': 'swim'})
+    df = pd.DataFrame({'full_text': ['I swam 2k', 'Swimming in the sea', 'Rainy day']}, index=[7, 8, 9])
+    report, missed = verify_prefilter(df, english, ['swim'], 'en')
+    assert (report['full_matches'], report['prefilter_matches'], report['missed']) == (2, 1, 1)
+    assert report['recall_loss'] == 0.5
+    assert missed['full_text'].tolist() == ['I swam 2k']
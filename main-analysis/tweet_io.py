@@ -0,0 +1,39 @@
+# Import required packages
+import os
+import re
+import pandas as pd
+
+
+def partition_lang(path):
+    """Returns the language of a file in a language partitioned dataset (.../lang=fi/part-00001.parquet),
+    or None if the path has no language partition.
+
+    Parameters:
+
+    path| String: path of the file
+    """
+    match = re.search(r'lang=([^/\\]+)', path)
+    return match.group(1) if match else None
+
+
+def read_chunk(path, columns=None, lang=None):
+    """Reads one chunk of tweets into a dataframe. Csv chunks are read whole; Parquet files
+    are read with only the given columns. The language of a Parquet partition is taken from
+    its directory name and added as column lang.
+
+    Parameters:
+
+    path| String: path of a chunk csv file or a Parquet file or partition directory
+    columns| list of strings, optional: columns to read from Parquet files
+    lang| String, optional: read only this language of a partitioned dataset directory
+    """
+    if not path.endswith('.parquet') and not os.path.isdir(path):
+        return pd.read_csv(path, encoding='utf-8', engine='c')
+
+    if lang is not None and os.path.isdir(path):
+        path = os.path.join(path, 'lang=' + lang)
+
+    df = pd.read_parquet(path, columns=columns)
+    if 'lang' not in df.columns:
+        df['lang'] = partition_lang(path)
+    return df
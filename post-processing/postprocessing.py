@@ -0,0 +1,237 @@
+# Import required packages
+import os
+import sys
+import glob
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Post-processing of the sports tweets as array operations: the tweets are read and combined
+# in one concat, tweets geoparsed to the centre of a city are dropped by comparing the
+# coordinate arrays, and the sports of each tweet are found by splitting all lemma texts at
+# once and looking the tokens up in the keyword list.
+
+# Which keywords belong to which category
+SPORTS_DICT = {'walk': 0, 'walking': 0, 'hike': 1, 'hiking': 1, 'trek': 1, 'trekking': 1, 'running': 2, 'run': 2,
+               'jog': 3, 'jogging': 3, 'bicycle': 4, 'bike': 4, 'biking': 4, 'cycling': 4,
+               'kävely': 0, 'kävellä': 0, 'käveleminen': 0, 'juoksu': 2, 'juosta': 2, 'juokseminen': 2,
+               'lenkki': 3, 'lenkkeily': 3, 'lenkkeillä': 3, 'patikointi': 1, 'patikoida': 1, 'patikoiminen': 1,
+               'pyörä': 4, 'pyöräily': 4, 'pyöräillä': 4, 'pyöräileminen': 4}
+
+# Names of the category codes
+SPORT_CATEGORIES = {0: 'walking', 1: 'hiking', 2: 'running', 3: 'jogging', 4: 'cycling'}
+
+# Coordinates (EPSG:3067) that the gazetteer gives for Helsinki, Espoo and Vantaa. Tweets
+# geoparsed to them create artificial hotspots and are removed for statistical analyses.
+CITY_CENTROIDS = np.array([[385446.3474936858, 6672081.187213039],
+                           [370853.5646174778, 6681537.223923998],
+                           [391713.1203601367, 6685777.800663358]])
+
+# Distance in metres within which a point counts as a city centroid, covers rounding in csv files
+CITY_TOLERANCE = 0.01
+
+# Coordinate system of the analysis
+ANALYSIS_CRS = 'EPSG:3067'
+
+# Columns saved to the final file
+OUTPUT_COLUMNS = ['full_text', 'geometry', 'sport', 'sport_code', 'lang', 'geoparsed']
+
+
+def read_tweets(pattern, crs=ANALYSIS_CRS, x='xcoord', y='ycoord'):
+    """Reads all files matching pattern into one geodataframe in EPSG:3067, with a single
+    concat instead of appending file by file. Csv files get their points from columns x and
+    y in crs; GeoPackage, Shapefile and (Geo)Parquet files, eg. the output of the main
+    analysis, keep their own geometry.
+
+    Parameters:
+
+    pattern| String: glob pattern of the files eg. 'geoparsed*.csv'
+    crs| String: coordinate system of the x and y columns of csv files
+    x| String: column of the x coordinates in csv files
+    y| String: column of the y coordinates in csv files
+    """
+    frames = []
+    for name in sorted(glob.glob(pattern)):
+        if name.endswith('.csv'):
+            df = pd.read_csv(name, engine='pyarrow')
+            frames.append(gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df[x], df[y]), crs=crs).to_crs(ANALYSIS_CRS))
+        elif name.endswith('.parquet') or os.path.isdir(name):
+            frames.append(gpd.read_parquet(name).to_crs(ANALYSIS_CRS))
+        else:
+            frames.append(gpd.read_file(name).to_crs(ANALYSIS_CRS))
+
+    if not frames:
+        print('No files match ' + pattern)
+        return gpd.GeoDataFrame(geometry=gpd.GeoSeries([], crs=ANALYSIS_CRS))
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=ANALYSIS_CRS)
+
+
+def city_geotag_mask(geodf, centroids=CITY_CENTROIDS, tolerance=CITY_TOLERANCE):
+    """Returns a boolean array telling which points of geodf are at a city centroid. The x
+    and y arrays are compared with each centroid, so it takes one pass per centroid.
+
+    Parameters:
+
+    geodf| GeoDataFrame of points in EPSG:3067
+    centroids| numpy array of (x, y) rows
+    tolerance| float: largest difference of x and of y from a centroid in metres
+    """
+    x = geodf.geometry.x.to_numpy()
+    y = geodf.geometry.y.to_numpy()
+    mask = np.zeros(len(geodf), dtype=bool)
+    for cx, cy in centroids:
+        mask |= (np.abs(x - cx) <= tolerance) & (np.abs(y - cy) <= tolerance)
+    return mask
+
+
+def delete_city_geotags(geodf, centroids=CITY_CENTROIDS, tolerance=CITY_TOLERANCE):
+    """
+    The posts tagged to a city geotag create artificial hotspots and should be removed for statistical analyses.
+    Returns geodf without the tweets at the city centroids, with a new index.
+
+    Parameters:
+    geodf | GeoDataFrame holding geocoded tweets in EPSG:3067
+    centroids | numpy array of (x, y) rows of the city centroids
+    tolerance | float: largest difference of x and of y from a centroid in metres
+    """
+    mask = city_geotag_mask(geodf, centroids, tolerance)
+    print('Removed %s tweets geoparsed to city centroids' % int(mask.sum()))
+    return geodf[~mask].reset_index(drop=True)
+
+
+def combine_tweets(geoparsed, geotagged):
+    """Combines geoparsed and geotagged tweets into one geodataframe in a single concat, with
+    column geoparsed telling where each tweet came from.
+
+    Parameters:
+
+    geoparsed| GeoDataFrame of tweets located from their text
+    geotagged| GeoDataFrame of geotagged tweets
+    """
+    return gpd.GeoDataFrame(pd.concat([geoparsed.assign(geoparsed=1), geotagged.assign(geoparsed=0)],
+                                      ignore_index=True), crs=ANALYSIS_CRS)
+
+
+def sport_matches(lemma_text, sports_dict=SPORTS_DICT):
+    """Finds the sports keywords in lemma texts. All texts are split into tokens in one Arrow
+    call and the tokens are looked up in the keyword list at once. A keyword repeated in a
+    tweet is counted once. Returns the positions of the matched rows and the positions of
+    their keywords in sports_dict, in row order and in the order the keywords appear.
+
+    Parameters:
+
+    lemma_text| Pandas Series of space separated lemmas, missing for tweets without text
+    sports_dict| dict: keyword -> category code
+    """
+    texts = pa.array(lemma_text.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+    tokens = pc.split_pattern(texts, ' ')
+    rows = pc.list_parent_indices(tokens).to_numpy()
+    keywords = pc.index_in(pc.list_flatten(tokens), value_set=pa.array(list(sports_dict), type=pa.string()))
+    keywords = keywords.fill_null(-1).to_numpy()
+
+    hit = keywords >= 0
+    rows, keywords = rows[hit], keywords[hit]
+    # Keep the first mention of each keyword of a row
+    _, first = np.unique(rows * len(sports_dict) + keywords, return_index=True)
+    first.sort()
+    return rows[first], keywords[first]
+
+
+def explode_sports(data, column='lemma_text', sports_dict=SPORTS_DICT):
+    """Returns one row per tweet and sport it mentions, with the keyword in column sport and
+    its category code in column sport_code. Tweets without a sport are left out.
+
+    Parameters:
+
+    data| GeoDataFrame of tweets with lemma texts
+    column| String: column of the lemma texts
+    sports_dict| dict: keyword -> category code
+    """
+    rows, keywords = sport_matches(data[column], sports_dict)
+    names = np.array(list(sports_dict), dtype=object)
+    codes = np.array(list(sports_dict.values()), dtype=np.int64)
+
+    sports = data.iloc[rows].copy()
+    sports['sport'] = names[keywords]
+    sports['sport_code'] = codes[keywords]
+    return sports
+
+
+def assign_sports(data, column='lemma_text', sports_dict=SPORTS_DICT):
+    """Returns data with column sports, the list of sports keywords of each tweet. Tweets
+    without lemma text get None.
+
+    Parameters:
+
+    data| GeoDataFrame of tweets with lemma texts
+    column| String: column of the lemma texts
+    sports_dict| dict: keyword -> category code
+    """
+    rows, keywords = sport_matches(data[column], sports_dict)
+    names = np.array(list(sports_dict), dtype=object)
+    bounds = np.searchsorted(rows, np.arange(len(data) + 1))
+
+    sports = [names[keywords[start:end]].tolist() for start, end in zip(bounds[:-1], bounds[1:])]
+    data = data.copy()
+    data['sports'] = pd.Series(sports, index=data.index, dtype=object).where(data[column].notna(), None)
+    return data
+
+
+def save_sports(sports, path):
+    """Saves the sports tweets with the output columns, text columns as strings.
+
+    Parameters:
+
+    sports| GeoDataFrame from explode_sports
+    path| String: .shp, .gpkg or .parquet file
+    """
+    sports = sports[OUTPUT_COLUMNS].copy()
+    sports['full_text'] = sports['full_text'].astype(str)
+    sports['sport'] = sports['sport'].astype(str)
+    if path.endswith('.parquet'):
+        sports.to_parquet(path)
+    else:
+        sports.to_file(path)
+    print('%s sports mentions saved to %s' % (len(sports), path))
+
+
+def postprocess(geoparsed_pattern='geoparsed.csv', geotagged_pattern='geotagged.csv', output=None):
+    """Runs the post-processing: reads the geoparsed tweets and removes those at city centroids,
+    reads the geotagged tweets (x and y in EPSG:4326), combines them and finds the sports of
+    each tweet. Without geotagged_pattern the first files are the combined output of the main
+    analysis (column geoparsed is 1 for geoparsed tweets). Returns one row per tweet and
+    sport, and saves it if output is given.
+
+    Parameters:
+
+    geoparsed_pattern| String: glob pattern of the geoparsed tweets, or of the whole output of the main analysis
+    geotagged_pattern| String: glob pattern of the geotagged tweets, empty if they are in the first files
+    output| String, optional: file to save the result to, see save_sports
+    """
+    start_time = time.time()
+    if geotagged_pattern:
+        geoparsed = delete_city_geotags(read_tweets(geoparsed_pattern))
+        geotagged = read_tweets(geotagged_pattern, crs='EPSG:4326')
+        tweets = combine_tweets(geoparsed, geotagged)
+    else:
+        # Output of the main analysis with both kinds of tweets and column geoparsed
+        tweets = read_tweets(geoparsed_pattern)
+        mask = city_geotag_mask(tweets) & (tweets['geoparsed'] == 1).to_numpy()
+        print('Removed %s tweets geoparsed to city centroids' % int(mask.sum()))
+        tweets = tweets[~mask].reset_index(drop=True)
+    sports = explode_sports(tweets)
+    print('--- %s tweets, %s sports mentions in %s seconds ---'
+          % (len(tweets), len(sports), round(time.time() - start_time, 2)))
+    if output:
+        save_sports(sports, output)
+    return sports
+
+
+if __name__ == '__main__':
+
+    # eg. python postprocessing.py geoparsed.csv geotagged.csv sports_mapped_.shp
+    # or python postprocessing.py finaloutput.gpkg '' sports_mapped_.shp
+    postprocess(*sys.argv[1:4])
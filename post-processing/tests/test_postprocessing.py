@@ -0,0 +1,51 @@
+# Import required packages
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from postprocessing import sport_matches, explode_sports, city_geotag_mask, postprocess, CITY_CENTROIDS
+
+# Keywords of the tests and their category codes
+SPORTS = {'juosta': 2, 'pyöräillä': 4, 'kävellä': 0}
+
+
+def points(coordinates, **columns):
+    """Returns a GeoDataFrame of points in EPSG:3067 with the given columns."""
+    x, y = zip(*coordinates)
+    return gpd.GeoDataFrame(columns, geometry=gpd.points_from_xy(x, y), crs='EPSG:3067')
+
+
+def test_repeated_keyword_counts_once_in_order():
+    lemma_text = pd.Series(['pyöräillä ja juosta ja pyöräillä', None, 'sataa', 'kävellä juosta juosta'])
+    rows, keywords = sport_matches(lemma_text, SPORTS)
+    names = np.array(list(SPORTS))
+    assert rows.tolist() == [0, 0, 3, 3]
+    assert names[keywords].tolist() == ['pyöräillä', 'juosta', 'kävellä', 'juosta']
+
+
+def test_explode_sports_leaves_out_tweets_without_lemmas():
+    data = pd.DataFrame({'full_text': ['a', 'b', 'c'], 'lemma_text': [None, 'juosta juosta', None]}, index=[5, 6, 7])
+    sports = explode_sports(data, sports_dict=SPORTS)
+    assert sports.index.tolist() == [6]
+    assert sports[['sport', 'sport_code']].values.tolist() == [['juosta', 2]]
+    assert len(explode_sports(data.iloc[[0, 2]], sports_dict=SPORTS)) == 0
+
+
+def test_city_geotag_mask_tolerance():
+    helsinki = CITY_CENTROIDS[0]
+    tweets = points([(helsinki[0], helsinki[1]), (helsinki[0] + 0.005, helsinki[1] - 0.009),
+                     (helsinki[0] + 0.02, helsinki[1]), tuple(CITY_CENTROIDS[2]), (385000, 6672000)])
+    assert city_geotag_mask(tweets).tolist() == [True, True, False, True, False]
+    assert city_geotag_mask(tweets, tolerance=0.05).tolist() == [True, True, True, True, False]
+
+
+def test_output_of_the_main_analysis_keeps_geotagged_tweets_at_centroids(tmp_path):
+    espoo = tuple(CITY_CENTROIDS[1])
+    output = points([espoo, espoo, (380000, 6675000)], full_text=['a', 'b', 'c'], lang=['fi', 'fi', 'en'],
+                    lemma_text=['juosta', 'kävellä pyöräillä', 'run'], geoparsed=[1, 0, 1])
+    output.to_parquet(tmp_path / 'part-00001.parquet')
+
+    sports = postprocess(str(tmp_path / '*.parquet'), '')
+    # The geoparsed tweet at the centroid is removed, the geotagged one there is kept
+    assert sports['full_text'].tolist() == ['b', 'b', 'c']
+    assert sports['sport'].tolist() == ['kävellä', 'pyöräillä', 'run']
+    assert sports['sport_code'].tolist() == [0, 4, 2]
@@ -1,5 +1,184 @@
+import os
+import sys
+import glob
+import time
+import threading
+import json
+import configparser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import psycopg2
+import psycopg2.pool
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# The extraction filters follow the settings of the analysis in main-analysis
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main-analysis'))
+from pipeline_settings import LANGUAGES, STUDY_BBOX
+
+# Database connection settings are read from the environment (PGHOST, PGPORT, PGDATABASE, PGUSER,
+# PGPASSWORD) or from the [database] section of this file, never from the source
+DB_CONFIG = os.environ.get('SPORTS_TWEETS_DB_CONFIG', 'db.ini')
+TWEET_TABLE = os.environ.get('SPORTS_TWEETS_TABLE', 'twitter_histories.twitter_histories_full_fin_est_fulltext')
+
+# Columns written to the Parquet files, lang is the partition key and is kept in the directory names
+TWEET_SCHEMA = pa.schema([('full_text', pa.string()),
+                          ('geom', pa.binary()),
+                          ('lat', pa.float64()),
+                          ('lon', pa.float64())])
+
+# Rows fetched from the server side cursor at a time and rows per Parquet file
+FETCH_ROWS = 50000
+ROWS_PER_FILE = 500000
+
+# State file of the incremental extraction holding the high-water mark of the key column
+STATE_PATH = os.environ.get('SPORTS_TWEETS_EXTRACT_STATE', 'extract_state.json')
+
+# Unique, increasing column of the tweet table that the high-water mark is kept on. Tables without it are
+# extracted without a mark, and get_data_incremental can not be used on them
+KEY_COLUMN = os.environ.get('SPORTS_TWEETS_KEY', 'id')
+
+# Parallel extraction: number of connections/threads, ranges per worker and attempts per range
+EXTRACT_WORKERS = int(os.environ.get('SPORTS_TWEETS_EXTRACT_WORKERS', 8))
+RANGES_PER_WORKER = 4
+RETRIES = 3
+
+# Server version from which ctid ranges are read with TID range scans. Older servers scan the whole
+# table for each range, so the ranges are split on KEY_COLUMN there
+TID_RANGE_SCAN_VERSION = 140000
+
+# SRID of the geom column of the tweet table
+TWEET_SRID = int(os.environ.get('SPORTS_TWEETS_SRID', 4326))
+
+# Rows the analysis would drop (other languages, geotags outside the study area) are filtered in the
+# database; this can be switched off from the environment to extract the whole table
+PUSHDOWN = os.environ.get('SPORTS_TWEETS_PUSHDOWN', '1') != '0'
+
+# Metres added around the study area, so that the edges of the reprojected box do not cut off any tweet
+# that parse_points would keep
+BBOX_MARGIN = 1000
+
+# Columns of the extraction: lang is the partition key and the rest are the columns of TWEET_SCHEMA.
+# The coordinates are cast on the server, numeric columns would otherwise arrive as Decimal objects
+SELECT_COLUMNS = 'lang, full_text, ST_AsBinary(geom) AS geom, lat::float8 AS lat, lon::float8 AS lon'
+
+def connection_params(config_path = DB_CONFIG):
+    """
+    Returns the keyword arguments for psycopg2.connect. Values from the [database] section of the config
+    file are used when it exists; anything missing there is left to libpq, which reads the PG* environment
+    variables. This way a local PostgreSQL instance can stand in for the server by setting PGHOST etc.
+
+    Parameters:
+
+    config_path: path of an ini file with a [database] section (host, port, dbname, user, password)
+    """
+    params = {}
+    if config_path and os.path.exists(config_path):
+        config = configparser.ConfigParser()
+        config.read(config_path)
+        if config.has_section('database'):
+            params.update(dict(config.items('database')))
+    return params
+
+def study_bbox(margin = BBOX_MARGIN):
+    """
+    Returns the bounding box (minx, miny, maxx, maxy in EPSG:3067) of the study area grown by margin metres:
+    SPORTS_TWEETS_STUDY_BBOX when it is set, otherwise the bounds of the boundary that parse_points tests the
+    geotagged tweets against.
+    """
+    if STUDY_BBOX:
+        minx, miny, maxx, maxy = STUDY_BBOX
+    else:
+        from spatial_filter import load_boundary
+        minx, miny, maxx, maxy = load_boundary().bounds
+    return (minx - margin, miny - margin, maxx + margin, maxy + margin)
+
+def language_condition(langs = LANGUAGES):
+    """
+    Returns the SQL condition that keeps the tweets in the languages of the analysis.
+    """
+    return 'lang IN (' + ', '.join("'" + lang.replace("'", "''") + "'" for lang in langs) + ')'
+
+def area_condition(bbox, srid = TWEET_SRID):
+    """
+    Returns the SQL condition that keeps the tweets without geom, which are geocoded from their text, and the
+    geotagged tweets inside bbox. The box is reprojected once to the SRID of the column, so the spatial index
+    of geom can be used.
+
+    Parameters:
+
+    bbox: minx, miny, maxx, maxy in EPSG:3067
+    srid: SRID of the geom column
+    """
+    envelope = 'ST_MakeEnvelope(%r, %r, %r, %r, 3067)' % tuple(float(value) for value in bbox)
+    if srid != 3067:
+        envelope = 'ST_Transform(%s, %d)' % (envelope, srid)
+    return '(geom IS NULL OR ST_Intersects(geom, ' + envelope + '))'
+
+def tweet_filter(langs = LANGUAGES, bbox = None, srid = TWEET_SRID):
+    """
+    Returns the WHERE condition that pushes the filters of the analysis down to the database, so that tweets
+    the analysis drops are not transferred, stored or lemmatized: the language filter of the lemmatize stage
+    and the study area test of parse_points (as a bounding box, parse_points still tests the exact boundary).
+    Returns an empty string when PUSHDOWN is off.
+
+    Parameters:
+
+    langs: languages of the analysis
+    bbox: minx, miny, maxx, maxy in EPSG:3067, study_bbox() when not given
+    srid: SRID of the geom column
+    """
+    if not PUSHDOWN:
+        return ''
+    return language_condition(langs) + ' AND ' + area_condition(study_bbox() if bbox is None else bbox, srid)
+
+def where(*conditions):
+    """
+    Returns a WHERE clause joining the non-empty conditions with AND, an empty string if there are none.
+    """
+    conditions = [condition for condition in conditions if condition]
+    return ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+def pushdown_report(condition = None):
+    """
+    Counts in one scan of the tweet table the rows and bytes of the whole table, of the analysed languages
+    and of what the extraction with condition fetches, and prints how much the filter saves. Bytes are the
+    sizes of the extracted values (lang, full_text, geom as WKB and the two coordinates). Returns the counts
+    as a dict. Running it against a local PostGIS copy (PGHOST, SPORTS_TWEETS_TABLE) checks the filter.
+
+    Parameters:
+
+    condition: WHERE condition of the extraction, tweet_filter() when not given
+    """
+    condition = (tweet_filter() if condition is None else condition) or 'true'
+    size = ('coalesce(octet_length(lang), 0) + coalesce(octet_length(full_text), 0)'
+            ' + coalesce(octet_length(ST_AsBinary(geom)), 0) + 16')
+    query = ('SELECT count(*), coalesce(sum(' + size + '), 0),'
+             ' count(*) FILTER (WHERE ' + language_condition() + '),'
+             ' coalesce(sum(' + size + ') FILTER (WHERE ' + language_condition() + '), 0),'
+             ' count(*) FILTER (WHERE ' + condition + '),'
+             ' coalesce(sum(' + size + ') FILTER (WHERE ' + condition + '), 0)'
+             ' FROM ' + TWEET_TABLE)
+
+    con = psycopg2.connect(**connection_params())
+    try:
+        with con.cursor() as cur:
+            cur.execute(query)
+            values = [int(value) for value in cur.fetchone()]
+    finally:
+        con.close()
+
+    report = dict(zip(['rows', 'bytes', 'language_rows', 'language_bytes', 'extracted_rows', 'extracted_bytes'],
+                      values))
+    for label, rows, size in [('All tweets', report['rows'], report['bytes']),
+                              ('In ' + ', '.join(LANGUAGES), report['language_rows'], report['language_bytes']),
+                              ('Extracted', report['extracted_rows'], report['extracted_bytes'])]:
+        print('%-16s %12s rows %10s MB' % (label, rows, round(size / 1024 ** 2, 1)))
+    if report['bytes'] > 0:
+        print('Pushdown saves %s%% of the rows and %s%% of the bytes'
+              % (round(100 - 100 * report['extracted_rows'] / report['rows'], 1),
+                 round(100 - 100 * report['extracted_bytes'] / report['bytes'], 1)))
+    return report
 
 def get_data(limit = None):
     """
@@ -13,14 +192,14 @@ def get_data(limit = None):
     """
     
     # set up database connection
-    con = psycopg2.connect(database="some_new", user="ehem", password="DigiGeoEmil!",
-                       host="dgl-data.geography.helsinki.fi")
+    con = psycopg2.connect(**connection_params())
     
     if limit == None:
-        query1 = 'SELECT lang, full_text, geom, lat, lon FROM twitter_histories.twitter_histories_full_fin_est_fulltext;'
+        query1 = 'SELECT lang, full_text, geom, lat, lon FROM ' + TWEET_TABLE + where(tweet_filter()) + ';'
         
     else:
-        query1 = 'SELECT lang, full_text, geom, lat, lon FROM twitter_histories.twitter_histories_full_fin_est_fulltext LIMIT ' + str(limit) + ';'
+        query1 = ('SELECT lang, full_text, geom, lat, lon FROM ' + TWEET_TABLE + where(tweet_filter())
+                  + ' LIMIT ' + str(limit) + ';')
     
     batch_no=1
     
@@ -33,4 +212,432 @@ def get_data(limit = None):
 
     return
 
-get_data()
\ No newline at end of file
+def stream_rows(con, query, fetch_rows = FETCH_ROWS):
+    """
+    Runs the query on a named (server side) cursor and yields the result in lists of at most
+    fetch_rows rows, so that only one batch is held in memory at a time.
+
+    Parameters:
+
+    con: open psycopg2 connection
+    query: SQL query returning lang, full_text, geom (as WKB), lat, lon
+    fetch_rows: number of rows fetched from the server at a time
+    """
+    with con.cursor(name='tweet_stream') as cur:
+        cur.itersize = fetch_rows
+        cur.execute(query)
+        while True:
+            rows = cur.fetchmany(fetch_rows)
+            if not rows:
+                break
+            yield rows
+
+class PartitionWriter:
+    """
+    Writes tweets to zstd compressed Parquet files partitioned by language: out_dir/lang=fi/part-00001.parquet.
+    Rows are buffered per language and written as row groups of row_group_rows rows. A new file is started
+    after rows_per_file rows, so that one file can be processed as one chunk downstream.
+
+    Parameters:
+
+    out_dir: directory of the partitioned dataset
+    rows_per_file: number of rows after which a new file is started
+    row_group_rows: number of rows in one row group
+    prefix: start of the file names, lets several writers share out_dir
+    """
+    def __init__(self, out_dir, rows_per_file = ROWS_PER_FILE, row_group_rows = FETCH_ROWS, prefix = 'part'):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.rows_per_file = rows_per_file
+        self.row_group_rows = row_group_rows
+        self.writers = {}
+        self.rows = {}
+        self.files = {}
+        self.buffers = {}
+        self.paths = []
+
+    def write(self, lang, columns):
+        """Buffers rows of one language. columns is a dict of column name -> list of values."""
+        buffer = self.buffers.setdefault(lang, {name: [] for name in TWEET_SCHEMA.names})
+        for name in TWEET_SCHEMA.names:
+            buffer[name].extend(columns[name])
+        if len(buffer['full_text']) >= self.row_group_rows:
+            self.flush(lang)
+
+    def flush(self, lang):
+        """Writes the buffered rows of one language as a row group."""
+        buffer = self.buffers.pop(lang, None)
+        if not buffer or not buffer['full_text']:
+            return
+
+        if lang not in self.writers or self.rows[lang] >= self.rows_per_file:
+            self.close_lang(lang)
+            self.files[lang] = self.files.get(lang, 0) + 1
+            folder = os.path.join(self.out_dir, 'lang=' + str(lang))
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, '%s-%05d.parquet' % (self.prefix, self.files[lang]))
+            self.writers[lang] = pq.ParquetWriter(path, TWEET_SCHEMA, compression='zstd')
+            self.paths.append(path)
+            self.rows[lang] = 0
+
+        table = pa.Table.from_pydict(buffer, schema=TWEET_SCHEMA)
+        self.writers[lang].write_table(table)
+        self.rows[lang] += table.num_rows
+
+    def close_lang(self, lang):
+        writer = self.writers.pop(lang, None)
+        if writer is not None:
+            writer.close()
+
+    def close(self):
+        try:
+            for lang in list(self.buffers):
+                self.flush(lang)
+        finally:
+            # The files are closed also when writing the last rows fails
+            self.buffers = {}
+            for lang in list(self.writers):
+                self.close_lang(lang)
+
+def write_batch(writer, rows):
+    """
+    Splits a batch of (lang, full_text, geom, lat, lon) rows by language and writes each part as a row group.
+    """
+    by_lang = {}
+    for lang, full_text, geom, lat, lon in rows:
+        columns = by_lang.setdefault(lang, {'full_text': [], 'geom': [], 'lat': [], 'lon': []})
+        columns['full_text'].append(full_text)
+        columns['geom'].append(bytes(geom) if geom is not None else None)
+        columns['lat'].append(lat)
+        columns['lon'].append(lon)
+
+    for lang, columns in by_lang.items():
+        writer.write(lang, columns)
+    return len(rows)
+
+def get_data_parquet(limit = None, out_dir = 'data/tweets', state_path = STATE_PATH):
+    """
+    Retrieves Twitter data like get_data, but streams it through a server side cursor with bounded memory and
+    writes it as Parquet partitioned by language (see PartitionWriter). A stage can then read only the
+    language and columns it needs, eg. pd.read_parquet('data/tweets/lang=fi', columns=['full_text', 'geom']).
+
+    Parameters:
+
+    limit: optional, limits the number of records retrieved.
+    out_dir: directory of the partitioned dataset
+    state_path: state file the high-water mark is saved to (not for limited extractions)
+    """
+
+    # set up database connection
+    con = psycopg2.connect(**connection_params())
+    mark = high_water_mark(con)
+
+    query = 'SELECT ' + SELECT_COLUMNS + ' FROM ' + TWEET_TABLE + where(mark_condition(mark), tweet_filter())
+    if limit != None:
+        query += ' LIMIT ' + str(int(limit))
+
+    writer = PartitionWriter(out_dir)
+    total = 0
+    try:
+        for rows in stream_rows(con, query):
+            total += write_batch(writer, rows)
+            print(str(total) + ' tweets written')
+    finally:
+        writer.close()
+        con.close()
+
+    # A limited extraction is not a baseline for the incremental runs
+    if limit == None:
+        save_mark(mark, state_path = state_path)
+    return total
+
+def block_ranges(con, parts):
+    """
+    Splits the heap of the tweet table into parts ctid ranges of about equal number of pages.
+    Returns a list of (first page, end page) tuples, the end page excluded.
+
+    Parameters:
+
+    con: open psycopg2 connection
+    parts: number of ranges
+    """
+    with con.cursor() as cur:
+        cur.execute("SELECT pg_relation_size(%s::regclass) / current_setting('block_size')::int", (TWEET_TABLE,))
+        pages = cur.fetchone()[0]
+    step = max(1, -(-pages // parts))
+    # The last range is left open so that pages added during the run are not missed
+    return [(start, start + step if start + step < pages else None) for start in range(0, max(pages, 1), step)]
+
+def key_ranges(con, key_column, parts):
+    """
+    Splits the tweet table into parts ranges of an integer key column, eg. the tweet id.
+    Returns a list of (first key, end key) tuples, the end key excluded. Other keys, eg. timestamps,
+    are refused with a ValueError.
+
+    Parameters:
+
+    con: open psycopg2 connection
+    key_column: name of an indexed integer column
+    parts: number of ranges
+    """
+    with con.cursor() as cur:
+        cur.execute('SELECT min(' + key_column + '), max(' + key_column + ') FROM ' + TWEET_TABLE)
+        low, high = cur.fetchone()
+    if low is None:
+        return []
+    if not isinstance(low, int) or not isinstance(high, int):
+        raise ValueError('The ranges are split on an integer column, ' + key_column + ' is '
+                         + type(low).__name__)
+    step = max(1, -(-(high - low + 1) // parts))
+    return [(start, start + step) for start in range(low, high + 1, step)]
+
+def range_query(key_range, key_column = None, condition = ''):
+    """
+    Returns the extraction query for one range. Without a key column the range is a ctid (page) range.
+    condition is the pushed down filter from tweet_filter.
+    """
+    start, end = key_range
+    if key_column is None:
+        bounds = "ctid >= '(%d,0)'::tid" % start
+        if end is not None:
+            bounds += " AND ctid < '(%d,0)'::tid" % end
+    else:
+        bounds = '%s >= %d AND %s < %d' % (key_column, start, key_column, end)
+    return 'SELECT ' + SELECT_COLUMNS + ' FROM ' + TWEET_TABLE + where(bounds, condition)
+
+def extract_range(pool, range_no, key_range, out_dir, key_column = None, condition = '', retries = RETRIES):
+    """
+    Extracts one range over a pooled connection into its own Parquet files (range-NNNNN-*.parquet).
+    If the range fails, its files are removed and it is retried up to retries times.
+    Returns the range number, rows written, seconds taken and the name of the worker thread.
+    """
+    prefix = 'range-%05d' % range_no
+    for attempt in range(1, retries + 1):
+        start_time = time.time()
+        con = pool.getconn()
+        writer = PartitionWriter(out_dir, prefix = prefix)
+        rows = 0
+        finished = False
+        try:
+            try:
+                for batch in stream_rows(con, range_query(key_range, key_column, condition)):
+                    rows += write_batch(writer, batch)
+            finally:
+                writer.close()
+            con.commit()
+            finished = True
+            return range_no, rows, time.time() - start_time, threading.current_thread().name
+
+        except (psycopg2.Error, OSError) as error:
+            print('Range %s failed on attempt %s/%s: %s' % (range_no, attempt, retries, error))
+            if attempt == retries:
+                raise
+
+        finally:
+            # Also on other errors (eg. Arrow conversion) the connection goes back to the pool, closed
+            # if the range failed, and the files of the failed range are removed
+            pool.putconn(con, close = not finished)
+            if not finished:
+                for path in glob.glob(os.path.join(out_dir, 'lang=*', prefix + '-*.parquet')):
+                    os.remove(path)
+        time.sleep(2 ** attempt)
+
+def get_data_parallel(out_dir = 'data/tweets', workers = EXTRACT_WORKERS, key_column = None, state_path = STATE_PATH):
+    """
+    Retrieves Twitter data like get_data_parquet, but splits the table into ctid (or key_column) ranges
+    that are extracted concurrently by a thread pool over a bounded connection pool. Every range writes
+    its own Parquet files and is retried on its own. Prints rows/sec for each worker. Like
+    get_data_parquet it extracts the rows up to the current high-water mark of KEY_COLUMN and saves the
+    mark, so get_data_incremental continues from there.
+
+    Parameters:
+
+    out_dir: directory of the partitioned dataset
+    workers: number of concurrent connections
+    key_column: optional integer column to split on instead of ctid, KEY_COLUMN on servers before PostgreSQL 14
+    state_path: state file the high-water mark is saved to
+    """
+    params = connection_params()
+    con = psycopg2.connect(**params)
+    try:
+        mark = high_water_mark(con)
+        if key_column is None and con.server_version < TID_RANGE_SCAN_VERSION:
+            if has_column(con, KEY_COLUMN):
+                print('PostgreSQL %s has no TID range scans, splitting on %s' % (con.server_version, KEY_COLUMN))
+                key_column = KEY_COLUMN
+            else:
+                print('Warning: PostgreSQL %s has no TID range scans and %s has no column %s, every ctid range'
+                      ' scans the whole table' % (con.server_version, TWEET_TABLE, KEY_COLUMN))
+        if key_column is None:
+            ranges = block_ranges(con, workers * RANGES_PER_WORKER)
+        else:
+            ranges = key_ranges(con, key_column, workers * RANGES_PER_WORKER)
+    finally:
+        con.close()
+
+    condition = ' AND '.join(part for part in [mark_condition(mark), tweet_filter()] if part)
+    print('Extracting ' + str(len(ranges)) + ' ranges with ' + str(workers) + ' workers'
+          + (' where ' + condition if condition else ''))
+    pool = psycopg2.pool.ThreadedConnectionPool(1, workers, **params)
+    worker_stats = {}
+    start_time = time.time()
+
+    try:
+        with ThreadPoolExecutor(max_workers = workers, thread_name_prefix = 'extract') as executor:
+            futures = [executor.submit(extract_range, pool, range_no, key_range, out_dir, key_column, condition)
+                       for range_no, key_range in enumerate(ranges, start = 1)]
+            for future in as_completed(futures):
+                range_no, rows, seconds, worker = future.result()
+                stats = worker_stats.setdefault(worker, [0, 0.0])
+                stats[0] += rows
+                stats[1] += seconds
+                print('Range %s/%s: %s rows in %s s' % (range_no, len(ranges), rows, round(seconds, 1)))
+    finally:
+        pool.closeall()
+
+    total = sum(stats[0] for stats in worker_stats.values())
+    for worker, (rows, seconds) in sorted(worker_stats.items()):
+        print('%s: %s rows, %s rows/sec' % (worker, rows, round(rows / seconds) if seconds > 0 else rows))
+    print('%s rows in %s minutes' % (total, round((time.time() - start_time) / 60, 2)))
+    save_mark(mark, state_path = state_path)
+    return total
+
+def read_state(state_path = STATE_PATH):
+    """
+    Returns the saved state of the incremental extraction, an empty dict on the first run.
+    """
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path) as f:
+        return json.load(f)
+
+def save_state(state, state_path = STATE_PATH):
+    """
+    Saves the state of the incremental extraction. The file is replaced in one step so that a crash
+    can not leave a half written high-water mark behind.
+    """
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f, indent = 2, default = str)
+    os.replace(state_path + '.tmp', state_path)
+
+def has_column(con, column):
+    """
+    Tells if the tweet table has a column.
+    """
+    with con.cursor() as cur:
+        cur.execute('SELECT count(*) FROM pg_attribute WHERE attrelid = %s::regclass AND attname = %s'
+                    ' AND attnum > 0 AND NOT attisdropped', (TWEET_TABLE, column))
+        return cur.fetchone()[0] > 0
+
+def high_water_mark(con, key_column = KEY_COLUMN):
+    """
+    Returns the largest value of key_column in the tweet table, None if the table is empty or has no
+    key_column. Without the column the extraction runs without a mark.
+    """
+    if not has_column(con, key_column):
+        print('Warning: ' + TWEET_TABLE + ' has no column ' + key_column + ' (SPORTS_TWEETS_KEY), no high-water'
+              ' mark is saved and get_data_incremental can not continue from this extraction')
+        return None
+    with con.cursor() as cur:
+        cur.execute('SELECT max(' + key_column + ') FROM ' + TWEET_TABLE)
+        return cur.fetchone()[0]
+
+def mark_condition(mark, key_column = KEY_COLUMN):
+    """
+    Returns the condition that keeps the rows up to the high-water mark, so that rows added while a full
+    extraction runs are left to the next incremental run instead of being extracted twice.
+    """
+    if mark is None:
+        return ''
+    return key_column + ' <= ' + psycopg2.extensions.adapt(mark).getquoted().decode()
+
+def save_mark(mark, key_column = KEY_COLUMN, state_path = STATE_PATH):
+    """
+    Saves the high-water mark of a completed extraction as the starting point of get_data_incremental.
+    """
+    if mark is None:
+        return
+    state = read_state(state_path)
+    state.setdefault(TWEET_TABLE, {})[key_column] = mark
+    state[TWEET_TABLE]['last_run'] = time.strftime('%Y%m%d%H%M%S')
+    save_state(state, state_path)
+    print('High-water mark ' + str(mark) + ' of ' + key_column + ' saved to ' + state_path)
+
+def is_unique_key(con, key_column):
+    """
+    Tells if key_column has a unique index of its own. Keyset pagination on a column with repeated values
+    would skip the rows that share the value at a page boundary.
+    """
+    with con.cursor() as cur:
+        cur.execute('SELECT count(*) FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid'
+                    ' AND a.attnum = i.indkey[0] WHERE i.indrelid = %s::regclass AND i.indisunique'
+                    ' AND i.indnatts = 1 AND a.attname = %s', (TWEET_TABLE, key_column))
+        return cur.fetchone()[0] > 0
+
+def get_data_incremental(key_column = KEY_COLUMN, out_dir = 'data/tweets', page_rows = FETCH_ROWS, state_path = STATE_PATH,
+                         full = False):
+    """
+    Retrieves only the tweets added since the previous run. The largest value of key_column seen so far
+    (the high-water mark) is kept in a state file and newer rows are read with keyset pagination
+    (WHERE key > last ORDER BY key LIMIT page_rows). The rows are written as delta-<run>-NNNNN.parquet
+    files next to the earlier parts, and the high-water mark is saved only after they are complete.
+    Returns the paths of the new files, which are the only ones the analysis needs to process, eg. with
+    SPORTS_TWEETS_INPUT='data/tweets/lang=*/delta-<run>-*.parquet' and SPORTS_TWEETS_APPEND=1.
+    The first mark is saved by the full extraction (get_data_parallel or get_data_parquet). Without it the
+    whole table would be extracted again next to the existing parts, so this is refused unless full is set.
+
+    Parameters:
+
+    key_column: unique, increasing column with a unique index such as the tweet id
+    out_dir: directory of the partitioned dataset
+    page_rows: number of rows per page
+    state_path: path of the state file
+    full: extract the whole table when there is no high-water mark yet
+    """
+    state = read_state(state_path)
+    last = state.get(TWEET_TABLE, {}).get(key_column)
+    if last is None and not full:
+        raise ValueError('No high-water mark of ' + key_column + ' in ' + state_path + ', run the full extraction'
+                         ' first or pass full=True')
+    run = time.strftime('%Y%m%d%H%M%S')
+
+    con = psycopg2.connect(**connection_params())
+    if not is_unique_key(con, key_column):
+        con.close()
+        raise ValueError(key_column + ' has no unique index, keyset pagination on it could skip rows')
+    writer = PartitionWriter(out_dir, prefix = 'delta-' + run)
+    total = 0
+    select = 'SELECT ' + key_column + ', ' + SELECT_COLUMNS + ' FROM ' + TWEET_TABLE
+    condition = tweet_filter()
+
+    try:
+        with con.cursor() as cur:
+            while True:
+                if last is None:
+                    cur.execute(select + where(condition) + ' ORDER BY ' + key_column + ' LIMIT %s', (page_rows,))
+                else:
+                    cur.execute(select + where(key_column + ' > %s', condition) + ' ORDER BY ' + key_column
+                                + ' LIMIT %s', (last, page_rows))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                total += write_batch(writer, [row[1:] for row in rows])
+                last = rows[-1][0]
+                print(str(total) + ' new tweets written')
+    finally:
+        writer.close()
+        con.close()
+
+    if total > 0:
+        state.setdefault(TWEET_TABLE, {})[key_column] = last
+        state[TWEET_TABLE]['last_run'] = run
+        save_state(state, state_path)
+    print(str(total) + ' new tweets since the previous run, high-water mark ' + str(last))
+    return writer.paths
+
+if __name__ == '__main__':
+    # python Get_tweets.py report prints what the pushed down filter saves without extracting
+    if sys.argv[1:] == ['report']:
+        pushdown_report()
+    else:
+        get_data_parallel()
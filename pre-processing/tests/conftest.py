@@ -0,0 +1,6 @@
+# Import required packages
+import os
+import sys
+
+# Get_tweets.py is imported by its plain name, as from the command line
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+# Import required packages
+import re
+
+
+class FakeCursor:
+    """Cursor of FakeConnection: answers each query with the first answer whose pattern it matches."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        self.connection.queries.append((query, params))
+        for pattern, answer in self.connection.answers:
+            if re.search(pattern, query):
+                self.rows = list(answer(query, params) if callable(answer) else answer)
+                return
+        raise AssertionError('Unexpected query: ' + query)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    """Stand-in of a psycopg2 connection that records the queries it gets.
+
+    Parameters:
+
+    answers| list of (regex, rows or function(query, params) -> rows)
+    server_version| int: version of the server as in server_version_num
+    """
+
+    def __init__(self, answers, server_version=160000):
+        self.answers = answers
+        self.server_version = server_version
+        self.queries = []
+        self.closed = False
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
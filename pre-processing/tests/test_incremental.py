@@ -0,0 +1,55 @@
+# Import required packages
+import json
+import pytest
+import Get_tweets
+from fake_db import FakeConnection
+
+
+@pytest.fixture
+def no_pushdown(monkeypatch):
+    monkeypatch.setattr(Get_tweets, 'PUSHDOWN', False)
+
+
+def test_incremental_needs_a_high_water_mark(tmp_path, monkeypatch):
+    monkeypatch.setattr(Get_tweets.psycopg2, 'connect', lambda **params: pytest.fail('connected without a mark'))
+    with pytest.raises(ValueError):
+        Get_tweets.get_data_incremental(out_dir=str(tmp_path), state_path=str(tmp_path / 'state.json'))
+
+
+def test_full_extraction_saves_the_mark_the_incremental_run_continues_from(tmp_path, monkeypatch, no_pushdown):
+    state_path = str(tmp_path / 'state.json')
+    rows = [(1, 'fi', 'a', None, None, None), (2, 'en', 'b', None, None, None), (3, 'fi', 'c', None, None, None)]
+    full = FakeConnection([(r'FROM pg_attribute', [(1,)]), (r'SELECT max\(id\)', [(2,)]),
+                           (r'FROM \S+ WHERE id <= 2$', [row[1:] for row in rows[:2]])])
+    monkeypatch.setattr(Get_tweets.psycopg2, 'connect', lambda **params: full)
+    assert Get_tweets.get_data_parquet(out_dir=str(tmp_path / 'tweets'), state_path=state_path) == 2
+    with open(state_path) as f:
+        assert json.load(f)[Get_tweets.TWEET_TABLE]['id'] == 2
+
+    def newer(query, params):
+        return [row for row in rows if row[0] > params[0]][:params[1]]
+    incremental = FakeConnection([(r'pg_index', [(1,)]), (r'WHERE id > %s', newer)])
+    monkeypatch.setattr(Get_tweets.psycopg2, 'connect', lambda **params: incremental)
+    paths = Get_tweets.get_data_incremental(out_dir=str(tmp_path / 'tweets'), state_path=state_path)
+    assert len(paths) == 1 and '/lang=fi/delta-' in paths[0]
+    with open(state_path) as f:
+        assert json.load(f)[Get_tweets.TWEET_TABLE]['id'] == 3
+
+
+def test_incremental_refuses_a_key_without_unique_index(tmp_path, monkeypatch):
+    state_path = str(tmp_path / 'state.json')
+    Get_tweets.save_state({Get_tweets.TWEET_TABLE: {'created_at': '2020-01-01'}}, state_path)
+    con = FakeConnection([(r'pg_index', [(0,)])])
+    monkeypatch.setattr(Get_tweets.psycopg2, 'connect', lambda **params: con)
+    with pytest.raises(ValueError):
+        Get_tweets.get_data_incremental('created_at', out_dir=str(tmp_path), state_path=state_path)
+    assert con.closed
+
+
+def test_full_extraction_of_a_table_without_the_key(tmp_path, monkeypatch, no_pushdown):
+    state_path = str(tmp_path / 'state.json')
+    con = FakeConnection([(r'FROM pg_attribute', [(0,)]), (r'FROM \S+$', [('fi', 'a', None, None, None)])])
+    monkeypatch.setattr(Get_tweets.psycopg2, 'connect', lambda **params: con)
+    assert Get_tweets.get_data_parquet(out_dir=str(tmp_path / 'tweets'), state_path=state_path) == 1
+    assert not [query for query, params in con.queries if 'max(' in query]
+    assert not (tmp_path / 'state.json').exists()
@@ -0,0 +1,79 @@
+# Import required packages
+import os
+import pytest
+import psycopg2
+import pandas as pd
+import Get_tweets
+
+# Tests against a PostgreSQL server with PostGIS standing in for the tweet database, eg. a local
+# container: SPORTS_TWEETS_TEST_PG=1 PGHOST=localhost PGUSER=postgres PGPASSWORD=... python -m pytest tests
+pytestmark = pytest.mark.skipif(not os.environ.get('SPORTS_TWEETS_TEST_PG'), reason='needs a PostgreSQL server')
+
+# Table created for the tests and its number of tweets
+TEST_TABLE = 'public.sports_tweets_test'
+TEST_ROWS = 5000
+
+
+@pytest.fixture
+def tweet_table(monkeypatch):
+    """Creates a tweet table with four languages, numeric coordinates and every third tweet without geom."""
+    con = psycopg2.connect(**Get_tweets.connection_params())
+    con.autocommit = True
+    with con.cursor() as cur:
+        cur.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+        cur.execute('DROP TABLE IF EXISTS ' + TEST_TABLE)
+        cur.execute('CREATE TABLE ' + TEST_TABLE + ' (id bigint PRIMARY KEY, lang text, full_text text,'
+                    ' geom geometry(Point, 4326), lat numeric, lon numeric)')
+        cur.execute('INSERT INTO ' + TEST_TABLE + " SELECT n, (ARRAY['fi', 'en', 'sv', 'et'])[n % 4 + 1], 'tweet ' || n,"
+                    ' CASE WHEN n % 3 = 0 THEN NULL ELSE ST_SetSRID(ST_MakePoint(24.0 + (n % 97) * 0.015,'
+                    ' 59.9 + (n % 89) * 0.006), 4326) END FROM generate_series(1, %s) n', (TEST_ROWS,))
+        cur.execute('UPDATE ' + TEST_TABLE + ' SET lat = round(ST_Y(geom)::numeric, 6), lon = round(ST_X(geom)::numeric, 6)')
+    monkeypatch.setattr(Get_tweets, 'TWEET_TABLE', TEST_TABLE)
+    yield con
+    with con.cursor() as cur:
+        cur.execute('DROP TABLE ' + TEST_TABLE)
+    con.close()
+
+
+@pytest.mark.parametrize('key_column', [None, 'id'])
+def test_parallel_extraction_gets_every_row_once(tweet_table, tmp_path, monkeypatch, key_column):
+    monkeypatch.setattr(Get_tweets, 'PUSHDOWN', False)
+    out_dir = str(tmp_path / 'tweets')
+    assert Get_tweets.get_data_parallel(out_dir, workers=3, key_column=key_column,
+                                        state_path=str(tmp_path / 'state.json')) == TEST_ROWS
+
+    tweets = pd.read_parquet(out_dir)
+    assert sorted(tweets['full_text']) == sorted('tweet %s' % number for number in range(1, TEST_ROWS + 1))
+
+
+def test_numeric_coordinates_arrive_as_floats(tweet_table, tmp_path, monkeypatch):
+    monkeypatch.setattr(Get_tweets, 'PUSHDOWN', False)
+    out_dir = str(tmp_path / 'tweets')
+    Get_tweets.get_data_parquet(out_dir=out_dir, state_path=str(tmp_path / 'state.json'))
+
+    tweets = pd.read_parquet(out_dir)
+    assert tweets['lat'].dtype == 'float64' and tweets['lon'].dtype == 'float64'
+    assert tweets['lat'].notna().sum() == TEST_ROWS - TEST_ROWS // 3
+    assert tweets['lat'].dropna().between(59.9, 60.5).all()
+
+
+def test_pushdown_keeps_the_rows_the_analysis_keeps(tweet_table, tmp_path, monkeypatch):
+    from test_pushdown import BOUNDARY, analysis_filter
+    import spatial_filter
+    monkeypatch.setattr(Get_tweets, 'STUDY_BBOX', ())
+    monkeypatch.setattr(spatial_filter, 'load_boundary', lambda *args, **kwargs: BOUNDARY)
+
+    tweets = {}
+    for pushdown in [False, True]:
+        monkeypatch.setattr(Get_tweets, 'PUSHDOWN', pushdown)
+        out_dir = str(tmp_path / str(pushdown))
+        Get_tweets.get_data_parquet(out_dir=out_dir, state_path=str(tmp_path / 'state.json'))
+        tweets[pushdown] = pd.read_parquet(out_dir)
+        tweets[pushdown]['lang'] = tweets[pushdown]['lang'].astype(str)
+
+    assert len(tweets[True]) < len(tweets[False])
+    assert analysis_filter(tweets[True], BOUNDARY) == analysis_filter(tweets[False], BOUNDARY)
+
+    report = Get_tweets.pushdown_report()
+    assert (report['rows'], report['extracted_rows']) == (len(tweets[False]), len(tweets[True]))
+    assert report['extracted_bytes'] < report['bytes']
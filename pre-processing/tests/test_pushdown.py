@@ -0,0 +1,87 @@
+# Import required packages
+import numpy as np
+import pandas as pd
+import shapely
+import pytest
+from pyproj import Transformer
+import spatial_filter
+import Get_tweets
+from spatial_filter import parse_points
+
+# Study area of the tests: a polygon around the metropolitan area in EPSG:3067
+BOUNDARY = shapely.Polygon([(362000, 6667000), (381000, 6665500), (403000, 6672000), (401000, 6697000),
+                            (370000, 6696000), (361600, 6684000)])
+
+
+@pytest.fixture
+def boundary(monkeypatch):
+    monkeypatch.setattr(Get_tweets, 'STUDY_BBOX', ())
+    monkeypatch.setattr(Get_tweets, 'PUSHDOWN', True)
+    monkeypatch.setattr(spatial_filter, 'load_boundary', lambda *args, **kwargs: BOUNDARY)
+    return BOUNDARY
+
+
+def test_where_clause(boundary):
+    condition = Get_tweets.tweet_filter(['fi', 'en', 'sv'], srid=4326)
+    minx, miny, maxx, maxy = BOUNDARY.bounds
+    assert condition == ("lang IN ('fi', 'en', 'sv') AND (geom IS NULL OR ST_Intersects(geom, ST_Transform("
+                         'ST_MakeEnvelope(%r, %r, %r, %r, 3067), 4326)))'
+                         % (minx - 1000, miny - 1000, maxx + 1000, maxy + 1000))
+    assert Get_tweets.where('id <= 5', condition) == ' WHERE id <= 5 AND ' + condition
+
+
+def test_where_clause_in_the_analysis_crs_and_quoting():
+    condition = Get_tweets.tweet_filter(["fi'"], bbox=(0, 1, 2, 3), srid=3067)
+    assert condition == ("lang IN ('fi''') AND (geom IS NULL OR ST_Intersects(geom, "
+                         'ST_MakeEnvelope(0.0, 1.0, 2.0, 3.0, 3067)))')
+
+
+def test_pushdown_can_be_switched_off(monkeypatch):
+    monkeypatch.setattr(Get_tweets, 'PUSHDOWN', False)
+    assert Get_tweets.tweet_filter() == ''
+    assert Get_tweets.range_query((0, None), condition=Get_tweets.tweet_filter()).endswith("WHERE ctid >= '(0,0)'::tid")
+
+
+def pushed_down(tweets, langs, bbox, srid=4326):
+    """Applies the pushed down condition the way PostGIS does: the corners of the envelope are
+    reprojected and joined with straight lines in the SRID of the column."""
+    minx, miny, maxx, maxy = bbox
+    corners = np.array([(minx, miny), (minx, maxy), (maxx, maxy), (maxx, miny), (minx, miny)])
+    lon, lat = Transformer.from_crs(3067, srid, always_xy=True).transform(corners[:, 0], corners[:, 1])
+    envelope = shapely.Polygon(zip(lon, lat))
+    geotagged = tweets['geom'].notna().to_numpy()
+    inside = shapely.intersects_xy(envelope, tweets['lon'].to_numpy(dtype=float), tweets['lat'].to_numpy(dtype=float))
+    return tweets[tweets['lang'].isin(langs).to_numpy() & (~geotagged | inside)]
+
+
+def analysis_filter(tweets, boundary):
+    """The filters of the analysis after the extraction: the lemmatize stage keeps the analysed
+    languages, the tweets without geom are geocoded and parse_points keeps the geotagged ones inside."""
+    tweets = tweets[tweets['lang'].isin(Get_tweets.LANGUAGES)]
+    geotagged = tweets[tweets['geom'].notna()]
+    return set(tweets.loc[tweets['geom'].isna(), 'full_text']) | set(parse_points(geotagged, boundary)['full_text'])
+
+
+def test_pushdown_keeps_the_rows_the_analysis_keeps(boundary):
+    # Points spread over and around the study area, many of them just inside its edges
+    rng = np.random.default_rng(1)
+    minx, miny, maxx, maxy = BOUNDARY.bounds
+    x = np.concatenate([rng.uniform(minx - 20000, maxx + 20000, 3000),
+                        shapely.get_coordinates(BOUNDARY.exterior.segmentize(100))[:, 0]])
+    y = np.concatenate([rng.uniform(miny - 20000, maxy + 20000, 3000),
+                        shapely.get_coordinates(BOUNDARY.exterior.segmentize(100))[:, 1]])
+    edge = shapely.get_coordinates(shapely.buffer(BOUNDARY, -1).exterior.segmentize(100))
+    x, y = np.concatenate([x, edge[:, 0]]), np.concatenate([y, edge[:, 1]])
+    lon, lat = Transformer.from_crs(3067, 4326, always_xy=True).transform(x, y)
+
+    count = len(x) + 500
+    geotagged = np.arange(count) < len(x)
+    tweets = pd.DataFrame({'lang': rng.choice(['fi', 'en', 'sv', 'et', 'ru'], count),
+                           'full_text': ['tweet %s' % number for number in range(count)],
+                           'geom': np.where(geotagged, b'point', None),
+                           'lat': np.concatenate([lat, np.full(500, np.nan)]),
+                           'lon': np.concatenate([lon, np.full(500, np.nan)])})
+
+    extracted = pushed_down(tweets, Get_tweets.LANGUAGES, Get_tweets.study_bbox())
+    assert len(extracted) < len(tweets)
+    assert analysis_filter(extracted, boundary) == analysis_filter(tweets, boundary)
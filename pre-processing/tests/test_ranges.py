@@ -0,0 +1,119 @@
+# Import required packages
+import os
+import glob
+import datetime
+import pytest
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+import Get_tweets
+from fake_db import FakeConnection
+
+
+def covered_pages(ranges, pages):
+    """Returns how many ranges each page of a table with pages pages (plus pages added later) falls into."""
+    counts = [0] * (pages + 10)
+    for start, end in ranges:
+        for page in range(start, len(counts) if end is None else end):
+            counts[page] += 1
+    return counts
+
+
+@pytest.mark.parametrize('pages, parts', [(0, 4), (1, 4), (3, 8), (32, 32), (100, 32), (1001, 7), (5000, 32)])
+def test_block_ranges_cover_every_page_once(pages, parts):
+    con = FakeConnection([(r'pg_relation_size', [(pages,)])])
+    ranges = Get_tweets.block_ranges(con, parts)
+    assert len(ranges) <= max(parts, 1)
+    # Pages added during the run fall into the last, open range
+    assert covered_pages(ranges, pages) == [1] * (pages + 10)
+
+
+@pytest.mark.parametrize('low, high, parts', [(1, 1, 4), (1, 10, 3), (5, 1000, 32), (-7, 7, 5)])
+def test_key_ranges_cover_every_key_once(low, high, parts):
+    con = FakeConnection([(r'SELECT min\(id\), max\(id\)', [(low, high)])])
+    ranges = Get_tweets.key_ranges(con, 'id', parts)
+    keys = [key for start, end in ranges for key in range(start, end) if key <= high]
+    assert keys == list(range(low, high + 1))
+
+
+def test_key_ranges_refuse_timestamps():
+    low, high = datetime.datetime(2015, 1, 1), datetime.datetime(2020, 1, 1)
+    con = FakeConnection([(r'SELECT min\(created_at\), max\(created_at\)', [(low, high)])])
+    with pytest.raises(ValueError):
+        Get_tweets.key_ranges(con, 'created_at', 4)
+
+
+class FakePool:
+    """Connection pool handing out the given connections in order."""
+
+    def __init__(self, connections):
+        self.connections = list(connections)
+        self.returned = []
+
+    def getconn(self):
+        return self.connections.pop(0)
+
+    def putconn(self, con, close=False):
+        self.returned.append((con, close))
+
+    def closeall(self):
+        pass
+
+
+def test_failed_range_is_removed_and_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(Get_tweets.time, 'sleep', lambda seconds: None)
+    out_dir = str(tmp_path)
+    rows = [('fi', 'tweet %s' % number, None, None, None) for number in range(10)]
+
+    def broken(query, params):
+        # A part of the range was written before the connection broke
+        os.makedirs(os.path.join(out_dir, 'lang=fi'))
+        open(os.path.join(out_dir, 'lang=fi', 'range-00003-00001.parquet'), 'wb').close()
+        raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    first = FakeConnection([(r'ctid', broken)])
+    second = FakeConnection([(r'ctid', rows)])
+    pool = FakePool([first, second])
+
+    range_no, written, seconds, worker = Get_tweets.extract_range(pool, 3, (0, 10), out_dir)
+    assert (range_no, written) == (3, 10)
+    assert pool.returned == [(first, True), (second, False)]
+    paths = glob.glob(os.path.join(out_dir, 'lang=*', '*.parquet'))
+    assert [os.path.basename(path) for path in paths] == ['range-00003-00001.parquet']
+    assert pq.read_table(paths[0]).num_rows == 10
+
+
+def test_range_failing_with_another_error_returns_its_connection(tmp_path):
+    out_dir = str(tmp_path)
+    # A coordinate that can not be converted to the Arrow schema
+    rows = [('fi', 'tweet', None, None, None), ('fi', 'tweet', None, 'not a float', None)]
+    con = FakeConnection([(r'ctid', rows)])
+    pool = FakePool([con])
+
+    with pytest.raises(pa.ArrowException):
+        Get_tweets.extract_range(pool, 1, (0, 10), out_dir)
+    assert pool.returned == [(con, True)]
+    assert not glob.glob(os.path.join(out_dir, 'lang=*', '*.parquet'))
+
+
+def test_old_servers_split_on_the_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(Get_tweets, 'PUSHDOWN', False)
+    con = FakeConnection([(r'FROM pg_attribute', [(1,)]), (r'SELECT max\(id\)', [(None,)]),
+                          (r'SELECT min\(id\), max\(id\)', [(None, None)])],
+                         server_version=130011)
+    monkeypatch.setattr(Get_tweets.psycopg2, 'connect', lambda **params: con)
+    monkeypatch.setattr(Get_tweets.psycopg2.pool, 'ThreadedConnectionPool', lambda *args, **params: FakePool([]))
+
+    assert Get_tweets.get_data_parallel(str(tmp_path), workers=2, state_path=str(tmp_path / 'state.json')) == 0
+    assert not [query for query, params in con.queries if 'pg_relation_size' in query]
+
+
+def test_old_servers_without_the_key_split_on_ctid(tmp_path, monkeypatch):
+    monkeypatch.setattr(Get_tweets, 'PUSHDOWN', False)
+    con = FakeConnection([(r'FROM pg_attribute', [(0,)]), (r'pg_relation_size', [(0,)])], server_version=130011)
+    monkeypatch.setattr(Get_tweets.psycopg2, 'connect', lambda **params: con)
+    monkeypatch.setattr(Get_tweets.psycopg2.pool, 'ThreadedConnectionPool',
+                        lambda *args, **params: FakePool([FakeConnection([(r'ctid', [])])]))
+
+    assert Get_tweets.get_data_parallel(str(tmp_path), workers=2, state_path=str(tmp_path / 'state.json')) == 0
+    assert not [query for query, params in con.queries if 'min(' in query or 'max(' in query]